@@ -0,0 +1,237 @@
+# encoding: utf-8
+"""Bulk analysis: positions or games streamed from a file through a pool of
+processes, one JSON line of results each.
+
+    python analyze.py positions.fen --out results.jsonl --depth 3
+    python analyze.py games.pgn.gz --out results.jsonl --workers 8 --resume
+
+The input is a FEN per line, EPD lines with four fields included, or PGN
+files, .gz and .bz2 ones too.  Every line of output has the index of its
+record in the input, whether it is legal and why not, the check status and
+the best move and score searched to a fixed depth.  For a game those are
+about its final position, and a game with an illegal move says which ply.
+
+Records are handed out in chunks, and at most --window chunks are in
+flight: when the window is full reading waits for the oldest chunk, which
+is written and flushed the moment it is done.  Memory stays bounded however
+long the input is, the output is in input order, and --resume continues a
+run that died after the last complete line of its output.
+"""
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+
+from chess import KING, PAWN, BLACK, Position, move_name
+from pgn import open_pgn, read_games, validate
+from search import search
+
+ONGOING, CHECKMATE, STALEMATE = "ongoing", "checkmate", "stalemate"
+
+
+def read_fens(lines):
+    """Yields the FEN of every line that isn't blank or a # comment.  EPD
+    operations after the four position fields are dropped."""
+    for line in lines:
+        fields = line.split()
+        if not fields or fields[0].startswith("#"):
+            continue
+        if len(fields) >= 6 and fields[4].isdigit() and fields[5].isdigit():
+            yield " ".join(fields[:6])
+        else:
+            yield " ".join(fields[:4])
+
+
+def read_records(path, pgn=None):
+    """The FENs or the Games of the file at path, PGN being told by the
+    file name unless pgn says."""
+    if pgn is None:
+        pgn = ".pgn" in os.path.basename(path)
+    lines = open_pgn(path)
+    return read_games(lines) if pgn else read_fens(lines)
+
+
+def illegal(position):
+    """Why position can't happen, None if it can."""
+    for color in (0, BLACK):
+        if bin(position.bitboards[KING | color]).count("1") != 1:
+            return "Needs one king a side"
+        if position.bitboards[PAWN | color] & 0xff000000000000ff:
+            return "Pawn on the first or last rank"
+    if position.in_check(position.turn ^ 1):
+        return "The side not to move is in check"
+    return None
+
+
+def _state(position, depth):
+    """Results about a legal position."""
+    moves = position.legal_moves()
+    check = position.in_check()
+    status = ONGOING if moves else CHECKMATE if check else STALEMATE
+    result = {"legal": True, "fen": position.to_fen(), "check": check, "status": status, "moves": len(moves)}
+    if moves and depth:
+        found = search(position, max_depth=depth)
+        result.update(best=move_name(found.move), score=found.score, depth=found.depth, nodes=found.nodes,
+                      pv=[move_name(move) for move in found.pv])
+    return result
+
+
+def analyze_position(fen, depth):
+    """Results for a FEN as a dict."""
+    try:
+        position = Position.from_fen(fen)
+    except Exception as error:
+        #~ Whatever a broken line does, it must not end the run
+        return {"legal": False, "fen": fen, "error": str(error) or type(error).__name__}
+    problem = illegal(position)
+    if problem:
+        return {"legal": False, "fen": fen, "error": problem}
+    return _state(position, depth)
+
+
+def analyze_game(game, depth):
+    """Results for a Game as a dict, the final position's when it is legal."""
+    result = {"tags": game.tags, "plies": len(game.moves), "result": game.result}
+    try:
+        position = validate(game)
+    except Exception as error:
+        result.update(legal=False, error=str(error) or type(error).__name__)
+        return result
+    result.update(_state(position, depth))
+    return result
+
+
+def _analyze_chunk(task):
+    """The results of a chunk of records numbered from start, as JSON lines."""
+    start, records, depth = task
+    lines = []
+    for index, record in enumerate(records, start):
+        if isinstance(record, basestring):
+            result = analyze_position(record, depth)
+        else:
+            result = analyze_game(record, depth)
+        result["index"] = index
+        lines.append(json.dumps(result, sort_keys=True) + "\n")
+    return "".join(lines)
+
+
+class _Finished(object):
+    """A result worked out in this process, looks like an AsyncResult."""
+
+    def __init__(self, value):
+        self.value = value
+
+    def ready(self):
+        return True
+
+    def get(self):
+        return self.value
+
+
+class _Inline(object):
+    """Runs the tasks in this process, for --workers 1."""
+
+    def apply_async(self, function, args):
+        return _Finished(function(*args))
+
+    def terminate(self):
+        pass
+
+    def join(self):
+        pass
+
+
+def _chunks(records, size):
+    records = iter(records)
+    while True:
+        chunk = list(itertools.islice(records, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def analyze(records, out, depth=2, workers=None, chunk_size=32, window=None, start=0):
+    """Writes the JSON line of results of every record but the first start
+    to out, in order.  Returns the number written."""
+    workers = workers or multiprocessing.cpu_count()
+    window = window or workers * 4
+    pool = multiprocessing.Pool(workers) if workers > 1 else _Inline()
+    pending = deque()
+    index = start
+    try:
+        for chunk in _chunks(itertools.islice(records, start, None), chunk_size):
+            pending.append(pool.apply_async(_analyze_chunk, ((index, chunk, depth),)))
+            index += len(chunk)
+            #~ Backpressure, no more reading until the oldest chunk is out
+            while len(pending) >= window or (pending and pending[0].ready()):
+                _write(out, pending.popleft().get())
+        while pending:
+            _write(out, pending.popleft().get())
+    finally:
+        pool.terminate()
+        pool.join()
+    return index - start
+
+
+def _write(out, lines):
+    out.write(lines)
+    out.flush()
+
+
+def resume_point(path):
+    """Index of the record after the last complete line of a results file,
+    0 when there is none.  A torn last line is cut off the file."""
+    if not os.path.exists(path):
+        return 0
+    with open(path, "r+b") as out:
+        out.seek(0, 2)
+        offset = out.tell()
+        data = ""
+        #~ Reads back from the end until the last complete line is in data
+        while offset > 0 and data.count("\n") < 2:
+            step = min(4096, offset)
+            offset -= step
+            out.seek(offset)
+            data = out.read(step) + data
+        end = data.rfind("\n")
+        out.truncate(offset + end + 1 if end >= 0 else 0)
+        if end < 0:
+            return 0
+        return json.loads(data[data.rfind("\n", 0, end) + 1:end])["index"] + 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze the positions or games of a file in parallel.")
+    parser.add_argument("path", help="FEN lines or PGN games, - for stdin")
+    parser.add_argument("-o", "--out", default="-", help="JSON lines file, stdout by default")
+    parser.add_argument("-d", "--depth", type=int, default=2, help="search depth, 0 for no search")
+    parser.add_argument("-w", "--workers", type=int, help="processes, one per core by default")
+    parser.add_argument("--chunk", type=int, default=32, help="records per task")
+    parser.add_argument("--window", type=int, help="chunks in flight, 4 per worker by default")
+    parser.add_argument("--pgn", action="store_true", default=None, help="read PGN whatever the file name")
+    start = parser.add_mutually_exclusive_group()
+    start.add_argument("--start", type=int, default=0, help="skip the records before this index")
+    start.add_argument("--resume", action="store_true", help="continue after the last line of --out")
+    args = parser.parse_args(argv)
+
+    if args.resume:
+        if args.out == "-":
+            parser.error("--resume needs --out")
+        args.start = resume_point(args.out)
+    out = sys.stdout if args.out == "-" else open(args.out, "ab" if args.resume else "wb")
+    started = time.time()
+    count = analyze(read_records(args.path, args.pgn), out, args.depth, args.workers, args.chunk, args.window,
+                    args.start)
+    seconds = max(time.time() - started, 1e-9)
+    print >> sys.stderr, "{} records from index {} in {:.2f}s, {:.0f}/s".format(
+        count, args.start, seconds, count / seconds)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+import json
+import os
+import shutil
+import tempfile
+from StringIO import StringIO
+from unittest import TestCase, main
+
+from analyze import analyze, read_fens, read_records, resume_point
+from pgn_tests import GAMES
+
+FENS = """# mates, a stalemate and broken lines
+rnb1kbnr/pppp1ppp/8/4p3/6Pq/5P2/PPPPP2P/RNBQKBNR w KQkq - 1 3
+k7/2Q5/1K6/8/8/8/8/8 b - -
+
+6k1/5ppp/8/8/8/8/8/R5K1 w - - bm Ra8#;
+k7/8/1K6/8/8/8/8/7Q w - - 0 1
+8/8/8/8/8/8/8/K7 w - - 0 1
+not a fen
+P6k/8/8/8/8/8/8/K7 w - - 0 1
+8p/8/8/8/8/8/8/K6k w - - 0 1
+"""
+
+
+class TestAnalyze(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def run_lines(self, records, **kwargs):
+        out = StringIO()
+        analyze(records, out, **kwargs)
+        return [json.loads(line) for line in out.getvalue().splitlines()]
+
+    def test_positions(self):
+        results = self.run_lines(read_fens(FENS.splitlines()), depth=1, workers=1)
+        self.assertEqual([result["index"] for result in results], range(8))
+        self.assertEqual([result["legal"] for result in results],
+                         [True, True, True, False, False, False, False, False])
+        self.assertEqual([result.get("status") for result in results[:3]], ["checkmate", "stalemate", "ongoing"])
+        self.assertTrue(results[0]["check"])
+        self.assertEqual(results[2]["best"], "a1a8")
+        self.assertEqual(results[2]["fen"], "6k1/5ppp/8/8/8/8/8/R5K1 w - - 0 1")
+        self.assertEqual(results[3]["error"], "The side not to move is in check")
+        self.assertEqual(results[4]["error"], "Needs one king a side")
+        self.assertEqual(results[6]["error"], "Pawn on the first or last rank")
+        self.assertTrue(results[7]["error"].startswith("Bad row"))
+
+    def test_games(self):
+        path = os.path.join(self.folder, "games.pgn")
+        with open(path, "w") as games:
+            games.write(GAMES)
+        first, second = self.run_lines(read_records(path), depth=0, workers=1)
+        self.assertEqual((first["legal"], first["status"], first["plies"], first["tags"]["White"]),
+                         (True, "checkmate", 33, "Morphy"))
+        self.assertFalse(second["legal"])
+        self.assertTrue(second["error"].startswith("Ply 3"))
+
+    def test_pool_keeps_input_order(self):
+        records = list(read_fens(FENS.splitlines())) * 5
+        single = self.run_lines(records, depth=1, workers=1)
+        pooled = self.run_lines(records, depth=1, workers=2, chunk_size=2, window=2)
+        self.assertEqual(single, pooled)
+        self.assertEqual(self.run_lines(records, depth=1, workers=1, start=30), single[30:])
+
+    def test_resume_after_a_torn_line(self):
+        path = os.path.join(self.folder, "results.jsonl")
+        records = list(read_fens(FENS.splitlines()))
+        self.assertEqual(resume_point(path), 0)
+        with open(path, "wb") as out:
+            analyze(records, out, depth=1, workers=1)
+        with open(path, "rb") as out:
+            complete = out.read()
+        lines = complete.splitlines(True)
+        with open(path, "wb") as out:
+            out.write("".join(lines[:4]) + lines[4][:10])
+        self.assertEqual(resume_point(path), 4)
+        with open(path, "ab") as out:
+            self.assertEqual(analyze(records, out, depth=1, workers=1, start=4), 4)
+        with open(path, "rb") as out:
+            self.assertEqual(out.read(), complete)
+        with open(path, "wb") as out:
+            out.write(lines[0][:5])
+        self.assertEqual(resume_point(path), 0)
+        self.assertEqual(os.path.getsize(path), 0)
+
+
+if __name__ == "__main__":
+    main()
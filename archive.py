@@ -0,0 +1,216 @@
+# encoding: utf-8
+"""Game archive: games stored as packed 16 bit moves behind an offset index.
+
+The file is a header, the games' moves back to back and a fixed size index
+entry per game, all little endian:
+
+    header  "CHESSARC", version, game count, index offset
+    data    per game the 37 byte start Position.pack() when it isn't the
+            start position, padded to 38, then one uint16 per ply
+    index   per game data offset, ply count, result and flags
+
+Archive reads it through mmap, so game N and ply K are found by arithmetic
+and read in place, whatever the size of the file:
+
+    with ArchiveWriter("games.arc") as writer:
+        writer.add(board.position.history(), "1-0")
+    archive = Archive("games.arc")
+    archive.move(12345, 20), archive.position(12345, 20)
+
+Build one from PGN files and look at a game with:
+
+    python archive.py build games.arc games.pgn.gz
+    python archive.py show games.arc 12345
+"""
+
+import argparse
+import mmap
+import struct
+import sys
+from array import array
+
+from chess import Position, move_name
+
+MAGIC   = "CHESSARC"
+VERSION = 1
+#~ Magic, version, game count and index offset
+HEADER = struct.Struct("<8sIQQ")
+#~ Data offset, ply count, result and flags
+ENTRY  = struct.Struct("<QIBB")
+MOVE   = struct.Struct("<H")
+
+RESULTS = ["*", "1-0", "0-1", "1/2-1/2"]
+#~ The game starts from the packed position stored before its moves
+CUSTOM_START = 1
+#~ Position.pack() padded so the moves stay aligned
+START_SIZE = 38
+
+
+class ArchiveError(Exception):
+    pass
+
+
+class ArchiveWriter(object):
+    """Appends games to a new archive file.  The index is kept in memory, 14
+    bytes a game, and written after the games by close()."""
+
+    def __init__(self, path):
+        self.file  = open(path, "wb")
+        self.index = bytearray()
+        self.count = 0
+        self.file.write(HEADER.pack(MAGIC, VERSION, 0, 0))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def add(self, moves, result="*", start=None):
+        """Adds a game, moves being 16 bit moves played from the start
+        Position, the standard one by default.  Returns its number."""
+        if result not in RESULTS:
+            raise ArchiveError("Unknown result: {!r}".format(result))
+        offset, flags = self.file.tell(), 0
+        if start is not None and start != Position.start():
+            flags |= CUSTOM_START
+            self.file.write(start.pack().ljust(START_SIZE, "\0"))
+        moves = moves if isinstance(moves, array) and moves.typecode == "H" else array("H", moves)
+        if sys.byteorder != "little":
+            moves = array("H", moves)
+            moves.byteswap()
+        moves.tofile(self.file)
+        self.index += ENTRY.pack(offset, len(moves), RESULTS.index(result), flags)
+        self.count += 1
+        return self.count - 1
+
+    def close(self):
+        if self.file.closed:
+            return
+        index_offset = self.file.tell()
+        self.file.write(self.index)
+        self.file.seek(0)
+        self.file.write(HEADER.pack(MAGIC, VERSION, self.count, index_offset))
+        self.file.close()
+
+
+class Archive(object):
+    """Read only view of an archive file through mmap."""
+
+    def __init__(self, path):
+        with open(path, "rb") as archive:
+            self.map = mmap.mmap(archive.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.map) < HEADER.size:
+            raise ArchiveError("Not an archive: {}".format(path))
+        magic, version, self.count, self.index_offset = HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != VERSION:
+            raise ArchiveError("Not a version {} archive: {}".format(VERSION, path))
+        if self.index_offset + self.count * ENTRY.size > len(self.map):
+            raise ArchiveError("Truncated archive: {}".format(path))
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for game in xrange(self.count):
+            yield self.moves(game)
+
+    def close(self):
+        self.map.close()
+
+    def _locate(self, game):
+        """(offset of the first move, plies, result index, flags) of game."""
+        if not 0 <= game < self.count:
+            raise IndexError("No game {} in an archive of {}".format(game, self.count))
+        offset, plies, result, flags = ENTRY.unpack_from(self.map, self.index_offset + game * ENTRY.size)
+        if flags & CUSTOM_START:
+            offset += START_SIZE
+        return offset, plies, result, flags
+
+    def plies(self, game):
+        return self._locate(game)[1]
+
+    def result(self, game):
+        return RESULTS[self._locate(game)[2]]
+
+    def start(self, game):
+        """The position game starts from."""
+        offset, _, _, flags = self._locate(game)
+        if flags & CUSTOM_START:
+            offset -= START_SIZE
+            return Position.unpack(self.map[offset:offset + Position.PACKED.size])
+        return Position.start()
+
+    def move(self, game, ply):
+        """The 16 bit move played at ply of game, read in place."""
+        offset, plies = self._locate(game)[:2]
+        if not 0 <= ply < plies:
+            raise IndexError("No ply {} in a game of {}".format(ply, plies))
+        return MOVE.unpack_from(self.map, offset + 2 * ply)[0]
+
+    def moves(self, game):
+        """The moves of game as an array of 16 bit moves."""
+        offset, plies = self._locate(game)[:2]
+        moves = array("H")
+        moves.fromstring(self.map[offset:offset + 2 * plies])
+        if sys.byteorder != "little":
+            moves.byteswap()
+        return moves
+
+    def position(self, game, ply=None):
+        """The position of game before ply is played, after the last move by
+        default."""
+        position = self.start(game)
+        moves = self.moves(game)
+        for move in moves[:len(moves) if ply is None else ply]:
+            position.make_move(move)
+        return position
+
+
+def build(path, pgn_paths, out=None):
+    """Writes the games of the PGN files to a new archive at path.  Returns
+    (games, plies, skipped), games with illegal moves are skipped."""
+    from pgn import PGNError, open_pgn, read_games, replay, start_position
+    games = plies = skipped = 0
+    with ArchiveWriter(path) as writer:
+        for pgn_path in pgn_paths:
+            for game in read_games(open_pgn(pgn_path)):
+                try:
+                    moves = [record.move for record in replay(game)]
+                    start = start_position(game) if "FEN" in game.tags else None
+                except (PGNError, ValueError) as error:
+                    skipped += 1
+                    if out is not None:
+                        print >> out, "skipped game {}: {}".format(games + skipped, error)
+                    continue
+                writer.add(moves, game.result if game.result in RESULTS else "*", start)
+                games += 1
+                plies += len(moves)
+    return games, plies, skipped
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and read game archives.")
+    commands = parser.add_subparsers(dest="command")
+    builder = commands.add_parser("build", help="archive the games of PGN files")
+    builder.add_argument("archive")
+    builder.add_argument("pgn", nargs="+")
+    show = commands.add_parser("show", help="print the moves of a game")
+    show.add_argument("archive")
+    show.add_argument("game", type=int)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        games, plies, skipped = build(args.archive, args.pgn, sys.stderr)
+        print "{} games, {} plies, {} skipped".format(games, plies, skipped)
+        return 0
+    archive = Archive(args.archive)
+    print " ".join(move_name(move) for move in archive.moves(args.game)), archive.result(args.game)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
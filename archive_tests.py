@@ -0,0 +1,67 @@
+import os
+import shutil
+import tempfile
+from StringIO import StringIO
+from unittest import TestCase, main
+
+from archive import Archive, ArchiveError, ArchiveWriter, build
+from chess import Position, move_name
+from notation import parse_uci
+from pgn_tests import GAMES
+
+
+class TestArchive(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, "games.arc")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def play(self, names, position=None):
+        position = position or Position.start()
+        for name in names:
+            position.make_move(parse_uci(position, name))
+        return position
+
+    def test_round_trip(self):
+        first = self.play(["e2e4", "e7e5", "g1f3"])
+        start = Position.from_fen("4k3/P7/8/8/8/8/8/4K3 w - - 0 1")
+        second = self.play(["a7a8q", "e8d7"], start.copy())
+        with ArchiveWriter(self.path) as writer:
+            writer.add(first.history(), "1-0")
+            writer.add(second.history(), "1/2-1/2", start)
+            writer.add([])
+        archive = Archive(self.path)
+        self.assertEqual(len(archive), 3)
+        self.assertEqual([move_name(move) for move in archive.moves(0)], ["e2e4", "e7e5", "g1f3"])
+        self.assertEqual(move_name(archive.move(1, 0)), "a7a8q")
+        self.assertEqual((archive.result(0), archive.result(1), archive.result(2)), ("1-0", "1/2-1/2", "*"))
+        self.assertEqual(archive.plies(2), 0)
+        self.assertEqual(archive.start(1), start)
+        self.assertEqual(archive.position(0), first)
+        self.assertEqual(archive.position(1, 1).to_fen(), "Q3k3/8/8/8/8/8/8/4K3 b - - 0 1")
+        self.assertRaises(IndexError, archive.move, 0, 3)
+        self.assertRaises(IndexError, archive.moves, 3)
+        #~ Two bytes a move and fourteen a game, plus the header and a start position
+        self.assertEqual(os.path.getsize(self.path), 28 + 2 * 5 + 38 + 3 * 14)
+        archive.close()
+
+    def test_build_from_pgn(self):
+        pgn = os.path.join(self.folder, "games.pgn")
+        with open(pgn, "w") as games:
+            games.write(GAMES)
+        self.assertEqual(build(self.path, [pgn], StringIO()), (1, 33, 1))
+        archive = Archive(self.path)
+        self.assertEqual(archive.result(0), "1-0")
+        self.assertTrue(archive.position(0).in_check())
+
+    def test_not_an_archive(self):
+        with open(self.path, "wb") as archive:
+            archive.write("x" * 40)
+        self.assertRaises(ArchiveError, Archive, self.path)
+
+
+if __name__ == "__main__":
+    main()
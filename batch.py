@@ -0,0 +1,213 @@
+# encoding: utf-8
+"""Vectorized evaluation of many positions at once with NumPy.
+
+Positions become an (N, 12, 64) array of piece planes, white pawns to kings
+and then black ones, and every feature is worked out for the whole batch in
+a few array operations instead of a Python loop per piece:
+
+    planes, turn = to_planes(boards_or_positions)
+    features = evaluate(planes, turn)
+    features["score"]       # centipawns for the side to move, shape (N,)
+
+Positions stored with Position.pack(), as in a game archive, are unpacked
+in bulk without building a Position each, see unpack().  Score every
+position of an archive with:
+
+    python batch.py games.arc --out features.npz
+
+NumPy is only needed by this module.
+"""
+
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from chess import BISHOP, BLACK, KING, KNIGHT, QUEEN, ROOK, Position
+from search import PIECE_TABLES, PIECE_VALUES
+
+#~ Piece code of each plane
+PLANE_CODES = np.array([kind | color for color in (0, BLACK) for kind in xrange(1, 7)], dtype=np.uint8)
+
+#~ Centipawns of a piece on each square for each plane, white positive, the
+#~ same values as search.evaluate()
+MATERIAL = np.array([PIECE_VALUES[code & 7] * (-1 if code & BLACK else 1) for code in PLANE_CODES],
+                    dtype=np.int32)
+SQUARE_BONUS = np.array([[-PIECE_TABLES[code & 7][square ^ 56] if code & BLACK else PIECE_TABLES[code & 7][square]
+                          for square in xrange(64)] for code in PLANE_CODES], dtype=np.int32)
+
+#~ Centipawns a move of mobility is worth
+MOBILITY_WEIGHT = 4
+
+#~ (dx, dy) of the rays and of the knight's jumps
+ROOK_RAYS     = [(0, 1), (0, -1), (1, 0), (-1, 0)]
+BISHOP_RAYS   = [(1, 1), (-1, 1), (1, -1), (-1, -1)]
+KNIGHT_JUMPS  = [(1, 2), (-1, 2), (2, 1), (-2, 1), (1, -2), (-1, -2), (2, -1), (-2, -1)]
+
+#~ Every byte value with its bits in reverse order
+REVERSED_BYTES = np.array([int("{:08b}".format(byte)[::-1], 2) for byte in xrange(256)], dtype=np.uint8)
+
+
+def _step_mask(dx, dy):
+    """Bitboard of the squares a step of dx, dy can land on."""
+    return np.uint64(sum(1 << square for square in xrange(64)
+                         if 0 <= (square & 7) - dx < 8 and 0 <= (square >> 3) - dy < 8))
+
+#~ Shift of the square numbers and landing mask of each step
+STEPS = dict(((dx, dy), (dy * 8 + dx, _step_mask(dx, dy))) for dx, dy in ROOK_RAYS + BISHOP_RAYS + KNIGHT_JUMPS)
+
+
+def _plane(code):
+    """Index of the plane of a piece code."""
+    return (code >> 3) * 6 + (code & 7) - 1
+
+
+def to_planes(positions):
+    """(planes, turn) of a sequence of Positions or Boards: an (N, 12, 64)
+    uint8 array and the side to move of each, 0 for white."""
+    positions = [getattr(position, "position", position) for position in positions]
+    mailboxes = np.frombuffer("".join(str(position.mailbox) for position in positions), dtype=np.uint8)
+    turn = np.array([position.turn for position in positions], dtype=np.uint8)
+    return from_mailboxes(mailboxes.reshape(-1, 64)), turn
+
+
+def unpack(packed):
+    """(planes, turn) of a sequence of Position.pack() strings, or of one
+    string holding them back to back."""
+    if not isinstance(packed, str):
+        packed = "".join(packed)
+    data = np.frombuffer(packed, dtype=np.uint8).reshape(-1, Position.PACKED.size)
+    placement = data[:, :32]
+    mailboxes = np.empty((len(data), 64), dtype=np.uint8)
+    mailboxes[:, 0::2] = placement & 15
+    mailboxes[:, 1::2] = placement >> 4
+    return from_mailboxes(mailboxes), data[:, 32] & 1
+
+
+def from_mailboxes(mailboxes):
+    """Planes of an (N, 64) array of piece codes by square."""
+    return (mailboxes[:, np.newaxis, :] == PLANE_CODES[np.newaxis, :, np.newaxis]).astype(np.uint8)
+
+
+def bitboards(planes):
+    """(N, 12) uint64 bitboards of the planes."""
+    #~ packbits puts the first square of each byte in its highest bit
+    packed = REVERSED_BYTES[np.packbits(planes, axis=2)]
+    return packed.view("<u8")[:, :, 0].astype(np.uint64)
+
+
+_M1, _M2, _M4, _H01 = (np.uint64(mask) for mask in
+                       (0x5555555555555555, 0x3333333333333333, 0x0f0f0f0f0f0f0f0f, 0x0101010101010101))
+
+def popcount(bits):
+    """Set bits of each of the (N,) uint64 bitboards, counted in parallel
+    within each word."""
+    bits = bits - ((bits >> np.uint64(1)) & _M1)
+    bits = (bits & _M2) + ((bits >> np.uint64(2)) & _M2)
+    bits = (bits + (bits >> np.uint64(4))) & _M4
+    return ((bits * _H01) >> np.uint64(56)).astype(np.int32)
+
+
+def _shift(bits, shift):
+    if shift > 0:
+        return bits << np.uint64(shift)
+    return bits >> np.uint64(-shift)
+
+
+def _step(bits, step):
+    shift, mask = STEPS[step]
+    return _shift(bits, shift) & mask
+
+
+def _ray(sliders, empty, step):
+    """Squares the sliders reach along step up to the first piece, filled
+    for the whole batch in three doublings (Kogge-Stone)."""
+    shift, mask = STEPS[step]
+    free = empty & mask
+    sliders = sliders | (free & _shift(sliders, shift))
+    free = free & _shift(free, shift)
+    sliders = sliders | (free & _shift(sliders, 2 * shift))
+    free = free & _shift(free, 2 * shift)
+    sliders = sliders | (free & _shift(sliders, 4 * shift))
+    return _shift(sliders, shift) & mask
+
+
+def mobility(planes):
+    """(white, black) pseudo legal moves of the knights, bishops, rooks,
+    queens and kings of every position, checks ignored, each of shape (N,).
+    Moves are counted a direction at a time: along one direction no two
+    pieces of a side reach the same square, so the bits add up."""
+    boards = bitboards(planes)
+    sides = [np.bitwise_or.reduce(boards[:, :6], axis=1), np.bitwise_or.reduce(boards[:, 6:], axis=1)]
+    empty = ~(sides[0] | sides[1])
+    counts = []
+    for color, own in ((0, sides[0]), (BLACK, sides[1])):
+        pieces = lambda kind: boards[:, _plane(kind | color)]
+        moves = np.zeros(len(planes), dtype=np.int32)
+        for step in KNIGHT_JUMPS:
+            moves += popcount(_step(pieces(KNIGHT), step) & ~own)
+        for step in ROOK_RAYS + BISHOP_RAYS:
+            moves += popcount(_step(pieces(KING), step) & ~own)
+        for kind, rays in ((ROOK, ROOK_RAYS), (BISHOP, BISHOP_RAYS)):
+            sliders = pieces(kind) | pieces(QUEEN)
+            for step in rays:
+                moves += popcount(_ray(sliders, empty, step) & ~own)
+        counts.append(moves)
+    return counts[0], counts[1]
+
+
+def evaluate(planes, turn):
+    """Features of every position as a dict of (N,) int32 arrays: material
+    and square bonuses from white's point of view, the mobility of each
+    side, and the score for the side to move, all in centipawns but the
+    mobility."""
+    #~ One float matrix product for both, exact at these magnitudes
+    flat = planes.reshape(len(planes), 12 * 64).astype(np.float32)
+    weights = np.stack([np.repeat(MATERIAL, 64), SQUARE_BONUS.ravel()], axis=1).astype(np.float32)
+    material, squares = np.rint(flat.dot(weights)).astype(np.int32).T
+    white, black = mobility(planes)
+    score = material + squares + MOBILITY_WEIGHT * (white - black)
+    return {"material": material, "squares": squares, "white_mobility": white, "black_mobility": black,
+            "score": np.where(turn, -score, score).astype(np.int32)}
+
+
+def archive_positions(archive):
+    """Position.pack() of every position of every game of an archive, the
+    one before each move and the final one."""
+    for game in xrange(len(archive)):
+        position = archive.start(game)
+        yield position.pack()
+        for move in archive.moves(game):
+            position.make_move(move)
+            yield position.pack()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate every position of a game archive with NumPy.")
+    parser.add_argument("archive")
+    parser.add_argument("--out", help="save the features as a .npz file")
+    parser.add_argument("--batch", type=int, default=65536, help="positions evaluated at once")
+    args = parser.parse_args(argv)
+
+    from archive import Archive
+    started = time.time()
+    batches, packed = [], []
+    for data in archive_positions(Archive(args.archive)):
+        packed.append(data)
+        if len(packed) == args.batch:
+            batches.append(evaluate(*unpack(packed)))
+            packed = []
+    if packed or not batches:
+        batches.append(evaluate(*unpack(packed)))
+    features = dict((name, np.concatenate([batch[name] for batch in batches])) for name in batches[0])
+    seconds = time.time() - started
+    print "{} positions in {:.2f}s, mean score {:.1f}".format(
+        len(features["score"]), seconds, features["score"].mean() if len(features["score"]) else 0.0)
+    if args.out:
+        np.savez(args.out, **features)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+import random
+from unittest import TestCase, main, skipIf
+
+from chess import PAWN, Board, Position, piece_attacks
+from search import evaluate as evaluate_one
+
+try:
+    import numpy
+    import batch
+except ImportError:
+    numpy = None
+
+
+def random_positions(count, seed=7):
+    generator, position, positions = random.Random(seed), Position.start(), []
+    while len(positions) < count:
+        moves = position.legal_moves()
+        if not moves or position.halfmove > 40:
+            position = Position.start()
+            continue
+        position.make_move(generator.choice(moves))
+        positions.append(position.copy())
+    return positions
+
+
+def moves_of(position, color):
+    """Pseudo legal moves of the pieces but the pawns, one at a time."""
+    occupied, count = position.occupied[0] | position.occupied[1], 0
+    for square, code in enumerate(position.mailbox):
+        if code and code >> 3 == color and code & 7 != PAWN:
+            count += bin(piece_attacks(code, square, occupied) & ~position.occupied[color]).count("1")
+    return count
+
+
+@skipIf(numpy is None, "NumPy is not installed")
+class TestBatch(TestCase):
+
+    def test_planes(self):
+        show_board, Board.SHOW_BOARD = Board.SHOW_BOARD, False
+        try:
+            planes, turn = batch.to_planes([Board(), Position.from_fen("8/8/8/8/8/8/8/K6k b - - 0 1")])
+        finally:
+            Board.SHOW_BOARD = show_board
+        self.assertEqual(planes.shape, (2, 12, 64))
+        self.assertEqual(list(planes[0].sum(axis=1)), [8, 2, 2, 2, 1, 1] * 2)
+        self.assertEqual((planes[1, 5, 0], planes[1, 11, 7], planes[1].sum()), (1, 1, 2))
+        self.assertEqual(list(turn), [0, 1])
+        self.assertEqual(list(batch.bitboards(planes)[0, :6]),
+                         [Position.start().bitboards[code] for code in xrange(1, 7)])
+
+    def test_unpack_matches_positions(self):
+        positions = random_positions(200)
+        planes, turn = batch.to_planes(positions)
+        unpacked, unpacked_turn = batch.unpack([position.pack() for position in positions])
+        self.assertTrue((planes == unpacked).all())
+        self.assertTrue((turn == unpacked_turn).all())
+
+    def test_matches_scalar_evaluation(self):
+        positions = random_positions(300)
+        features = batch.evaluate(*batch.to_planes(positions))
+        for i, position in enumerate(positions):
+            mobility = features["white_mobility"][i] - features["black_mobility"][i]
+            self.assertEqual(features["score"][i] - batch.MOBILITY_WEIGHT * mobility * (-1 if position.turn else 1),
+                             evaluate_one(position))
+            self.assertEqual((features["white_mobility"][i], features["black_mobility"][i]),
+                             (moves_of(position, 0), moves_of(position, 1)))
+
+    def test_start_and_empty_batches(self):
+        features = batch.evaluate(*batch.to_planes([Position.start()]))
+        self.assertEqual([features[name][0] for name in ("material", "squares", "white_mobility", "score")],
+                         [0, 0, 4, 0])
+        self.assertEqual(len(batch.evaluate(*batch.unpack([]))["score"]), 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+# encoding: utf-8
+"""Opening book: weighted moves by position key in a sorted, mmapped file.
+
+The builder replays the opening plies of every game in an archive and counts
+the moves played from each position, weighted by how the game went for the
+side that played it.  The book file is a header and fixed size entries
+sorted by key, so the reader finds a position with a binary search straight
+over the mapped file.  Nothing is loaded, lookups take microseconds and the
+book's size never shows up in the process memory:
+
+    build_book(Archive("games.arc"), "openings.book", max_ply=20)
+    book = Book("openings.book")
+    book.moves(position)    # [(move, weight, games)], best first
+    book.choose(position)   # a move picked by weight, or None
+
+    python book.py build games.arc openings.book --max-ply 20
+    python book.py probe openings.book "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1"
+"""
+
+import argparse
+import mmap
+import random
+import struct
+import sys
+
+from chess import Position, move_name
+
+MAGIC   = "CHESSBK1"
+VERSION = 1
+#~ Magic, version and entry count
+HEADER = struct.Struct("<8sIQ")
+#~ Position key, move, weight and number of games
+ENTRY  = struct.Struct("<QHHI")
+
+#~ Points for the side that played the move, by game result: win 2, draw 1
+POINTS = {"1-0": (2, 0), "0-1": (0, 2), "1/2-1/2": (1, 1), "*": (1, 1)}
+MAX_WEIGHT = 0xffff
+
+
+class BookError(Exception):
+    pass
+
+
+def build_book(archive, path, max_ply=20, min_games=1):
+    """Writes the book of the first max_ply plies of the archive's games to
+    path.  Moves played in fewer than min_games games are left out.  Returns
+    the number of entries."""
+    stats = {}
+    for game in xrange(len(archive)):
+        position = archive.start(game)
+        points = POINTS[archive.result(game)]
+        for move in archive.moves(game)[:max_ply]:
+            entry = stats.get((position.key, move))
+            if entry is None:
+                entry = stats[position.key, move] = [0, 0]
+            #~ Weighted as 2 * wins + draws for the side to move
+            entry[0] += points[position.turn]
+            entry[1] += 1
+            position.make_move(move)
+
+    entries = sorted((key, move, points, games) for (key, move), (points, games) in stats.iteritems()
+                     if games >= min_games)
+    #~ Scale the weights into 16 bits, a move lost every time still weighs 1
+    scale = max([points for _, _, points, _ in entries] + [MAX_WEIGHT]) / float(MAX_WEIGHT)
+    with open(path, "wb") as book:
+        book.write(HEADER.pack(MAGIC, VERSION, len(entries)))
+        for key, move, points, games in entries:
+            book.write(ENTRY.pack(key, move, max(1, int(points / scale)), min(games, 0xffffffff)))
+    return len(entries)
+
+
+class Book(object):
+    """Read only view of a book file through mmap."""
+
+    def __init__(self, path):
+        with open(path, "rb") as book:
+            self.map = mmap.mmap(book.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.map) < HEADER.size:
+            raise BookError("Not a book: {}".format(path))
+        magic, version, self.count = HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != VERSION:
+            raise BookError("Not a version {} book: {}".format(VERSION, path))
+        if HEADER.size + self.count * ENTRY.size > len(self.map):
+            raise BookError("Truncated book: {}".format(path))
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        self.map.close()
+
+    def probe(self, key):
+        """[(move, weight, games)] stored for key, in file order."""
+        unpack, data, size, start = ENTRY.unpack_from, self.map, ENTRY.size, HEADER.size
+        #~ Lower bound of key over the sorted entries
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) >> 1
+            if unpack(data, start + middle * size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        found = []
+        while low < self.count:
+            entry_key, move, weight, games = unpack(data, start + low * size)
+            if entry_key != key:
+                break
+            found.append((move, weight, games))
+            low += 1
+        return found
+
+    def moves(self, position):
+        """[(move, weight, games)] for position, the heaviest first."""
+        return sorted(self.probe(position.key), key=lambda entry: -entry[1])
+
+    def best(self, position):
+        """The heaviest move for position, or None when it isn't in the book."""
+        moves = self.moves(position)
+        return moves[0][0] if moves else None
+
+    def choose(self, position, generator=random):
+        """A move for position picked at random in proportion to its weight,
+        or None when the position isn't in the book."""
+        moves = self.probe(position.key)
+        if not moves:
+            return None
+        pick = generator.random() * sum(weight for _, weight, _ in moves)
+        for move, weight, _ in moves:
+            pick -= weight
+            if pick < 0:
+                return move
+        return moves[-1][0]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and probe opening books.")
+    commands = parser.add_subparsers(dest="command")
+    builder = commands.add_parser("build", help="build a book from a game archive")
+    builder.add_argument("archive")
+    builder.add_argument("book")
+    builder.add_argument("--max-ply", type=int, default=20)
+    builder.add_argument("--min-games", type=int, default=1)
+    probe = commands.add_parser("probe", help="list the book moves of a position")
+    probe.add_argument("book")
+    probe.add_argument("fen", nargs="?", help="the start position by default")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        from archive import Archive
+        entries = build_book(Archive(args.archive), args.book, args.max_ply, args.min_games)
+        print "{} entries".format(entries)
+        return 0
+    position = Position.from_fen(args.fen) if args.fen else Position.start()
+    for move, weight, games in Book(args.book).moves(position):
+        print "{:6} {:>6} {:>8}".format(move_name(move), weight, games)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
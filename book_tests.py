@@ -0,0 +1,85 @@
+import os
+import random
+import shutil
+import tempfile
+from unittest import TestCase, main
+
+from archive import Archive, ArchiveWriter
+from book import Book, BookError, build_book
+from chess import Position, move_name
+from notation import parse_uci
+from search import search
+
+
+class TestBook(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.book_path = os.path.join(self.folder, "openings.book")
+        games = [("e2e4 e7e5 g1f3", "1-0"), ("e2e4 e7e5 f1c4", "1/2-1/2"), ("e2e4 c7c5", "0-1"),
+                 ("d2d4 d7d5", "1-0")]
+        archive_path = os.path.join(self.folder, "games.arc")
+        with ArchiveWriter(archive_path) as writer:
+            for names, result in games:
+                position = Position.start()
+                for name in names.split():
+                    position.make_move(parse_uci(position, name))
+                writer.add(position.history(), result)
+        self.archive = Archive(archive_path)
+
+    def tearDown(self):
+        self.archive.close()
+        shutil.rmtree(self.folder)
+
+    def play(self, names):
+        position = Position.start()
+        for name in names:
+            position.make_move(parse_uci(position, name))
+        return position
+
+    def named(self, moves):
+        return [(move_name(move), weight, games) for move, weight, games in moves]
+
+    def test_weights(self):
+        self.assertEqual(build_book(self.archive, self.book_path), 7)
+        book = Book(self.book_path)
+        self.assertEqual(len(book), 7)
+        #~ e4 won one, drew one and lost one game for white, d4 won its only one
+        self.assertEqual(self.named(book.moves(Position.start())), [("e2e4", 3, 3), ("d2d4", 2, 1)])
+        self.assertEqual(self.named(book.moves(self.play(["e2e4"]))), [("c7c5", 2, 1), ("e7e5", 1, 2)])
+        #~ A move lost every time still weighs 1
+        self.assertEqual(self.named(book.moves(self.play(["d2d4"]))), [("d7d5", 1, 1)])
+        self.assertEqual(book.moves(self.play(["a2a3"])), [])
+        self.assertEqual(move_name(book.best(Position.start())), "e2e4")
+        book.close()
+
+    def test_max_ply_and_min_games(self):
+        self.assertEqual(build_book(self.archive, self.book_path, max_ply=1, min_games=2), 1)
+        book = Book(self.book_path)
+        self.assertEqual(self.named(book.moves(Position.start())), [("e2e4", 3, 3)])
+        self.assertEqual(book.best(self.play(["e2e4"])), None)
+
+    def test_choose(self):
+        build_book(self.archive, self.book_path)
+        book = Book(self.book_path)
+        generator = random.Random(1)
+        chosen = [move_name(book.choose(Position.start(), generator)) for _ in xrange(200)]
+        self.assertEqual(set(chosen), set(["e2e4", "d2d4"]))
+        self.assertTrue(chosen.count("e2e4") > chosen.count("d2d4"))
+        self.assertEqual(book.choose(self.play(["a2a3"])), None)
+
+    def test_search_plays_book_moves(self):
+        build_book(self.archive, self.book_path)
+        book = Book(self.book_path)
+        result = search(self.play(["e2e4", "e7e5"]), max_depth=1, book=book)
+        self.assertEqual((move_name(result.move), result.depth), ("g1f3", 0))
+        self.assertTrue(search(self.play(["a2a3"]), max_depth=1, book=book).depth > 0)
+
+    def test_not_a_book(self):
+        with open(self.book_path, "wb") as book:
+            book.write("x" * 40)
+        self.assertRaises(BookError, Book, self.book_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,60 @@
 # encoding: utf-8
 
 from ipdb import set_trace as trace
-import copy
+import marshal
+import os
+import random
+import struct
+from array import array
+
+#~ Compact position constants --------------------------------------------------
+#~ Squares are numbered from 0 ("a1") to 63 ("h8"), letters along x and numbers
+#~ along y, so a square is number * 8 + letter.
+SQUARE_NAMES = [letter + number for number in "12345678" for letter in "abcdefgh"]
+SQUARES      = dict((name, index) for index, name in enumerate(SQUARE_NAMES))
+
+#~ Piece codes.  The low three bits are the piece type and BLACK is or'ed in for
+#~ black pieces, so a code fits in a nibble and "code >> 3" is the color index.
+EMPTY, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(7)
+WHITE, BLACK = 0, 8
+COLORS       = "wb"
+PIECE_NAMES  = ["Empty", "Pawn", "Knight", "Bishop", "Rook", "Queen", "King"]
+PIECE_CODES  = dict((name, code) for code, name in enumerate(PIECE_NAMES))
+#~ FEN letter of each piece code
+FEN_SYMBOLS  = " PNBRQK  pnbrqk"
+
+#~ Castling rights bits, in FEN order "KQkq"
+CASTLING = "KQkq"
+WHITE_KING_SIDE, WHITE_QUEEN_SIDE, BLACK_KING_SIDE, BLACK_QUEEN_SIDE = 1, 2, 4, 8
+#~ Rights that survive a move touching the square; a king or rook leaving home
+#~ (or a rook being captured there) loses the matching rights.
+CASTLING_MASKS = [15] * 64
+for _location, _lost in (("e1", 3), ("a1", 2), ("h1", 1), ("e8", 12), ("a8", 8), ("h8", 4)):
+    CASTLING_MASKS[SQUARES[_location]] = 15 ^ _lost
+#~ (right, king, rook) and the locations whose pieces decide the rights
+CASTLING_PIECES = ((WHITE_KING_SIDE, "e1", "h1"), (WHITE_QUEEN_SIDE, "e1", "a1"),
+                   (BLACK_KING_SIDE, "e8", "h8"), (BLACK_QUEEN_SIDE, "e8", "a8"))
+CASTLING_LOCATIONS = set(("e1", "a1", "h1", "e8", "a8", "h8"))
+
+#~ Zobrist keys.  The generator is seeded so every process, and every stored
+#~ game, agrees on the key of a position.
+_zobrist = random.Random(20130601)
+ZOBRIST_PIECES   = [[_zobrist.getrandbits(64) if code & 7 else 0 for _ in xrange(64)] for code in xrange(16)]
+ZOBRIST_CASTLING = [_zobrist.getrandbits(64) for _ in xrange(16)]
+ZOBRIST_EP       = [_zobrist.getrandbits(64) for _ in xrange(8)]
+ZOBRIST_TURN     = _zobrist.getrandbits(64)
+ZOBRIST_CASTLING[0] = 0
+
+#~ Where the rook comes from and goes to, keyed by the castling king's square
+CASTLING_ROOKS = dict((SQUARES[king], (SQUARES[rook_from], SQUARES[rook_to]))
+                      for king, rook_from, rook_to in (("g1", "h1", "f1"), ("c1", "a1", "d1"),
+                                                       ("g8", "h8", "f8"), ("c8", "a8", "d8")))
 
 class InvalidMove(Exception):
+    def __init__(self, msg=""):
+        Exception.__init__(self, msg)
+        self.msg = msg
+
     def __str__(self):
         return self.msg
 
@@ -37,8 +88,17 @@ class Square(object):
     COMPUS_DIRECTIONS = ["_N" , "_S" , "_E" , "_W" , "_NE", "_NW", "_SE", "_SW",
                          "_L1", "_L2", "_L3", "_L4", "_L5", "_L6", "_L7", "_L8"]
 
+    #~ Static neighbor table, {location: {direction: location or None}}.  The
+    #~ board geometry never changes so it is built once when the module loads.
+    NEIGHBORS = {}
+
+    #~ A board makes its 64 squares once and keeps them, pieces come and go as
+    #~ codes in board.position.  The neighbor links are Neighbor descriptors.
+    __slots__ = ("location", "index", "board")
+
     def __init__(self, location):
         self.location = location
+        self.index    = SQUARES[location]
 
     def __str__(self):
         return self.location
@@ -47,92 +107,348 @@ class Square(object):
         self.board = board
         self.link(board)
 
+    @property
+    def piece(self):
+        """The shared Piece standing on this square, Empty if none."""
+        return PIECE_INSTANCES[self.board.position.mailbox[self.index]]
+
+    @property
+    def name(self):
+        return self.piece.name
+
+    @property
+    def color(self):
+        return self.piece.color
+
+    @property
+    def symbol(self):
+        return self.piece.symbol
+
+    @property
+    def code(self):
+        return self.board.position.mailbox[self.index]
+
+    @property
+    def move_count(self):
+        """How often the piece on this square has moved, kept by the board."""
+        return self.board.move_counts[self.index]
+
+    @property
+    def team(self):
+        """The squares holding a piece of this square's color."""
+        if not self.color:
+            return []
+        return sorted(self._squares(self.board.position.occupied[COLORS.index(self.color)]),
+                      key=lambda square: square.index)
+
     def move(self, to):
+        if not self.code:
+            raise InvalidMove("Must select a square with a piece on it")
+        from_location = self.location
         move = self.move_calculations(self.get_paths(), to)
 
-        from_location = self.location
         if move[0]:
-            if move[1] == "empassant":
-                #~ move[2] is the special square that will be captured on an empassant
-                move[2].piece = Empty(move[2].location)
-
-            #~ keep track of the last move made
-            self.board.last_moved = self.board.get(to)
-
-            #~ keep a list of moves made
-            self.board.update_move_list(self.location, to)
+            #~ Plays the move, including the pawn captured on an empassant,
+            #~ keeps track of the last move made and records it in move_list.
+            #~ SAN is written for the side to move, so a move played out of
+            #~ turn is left out, move_list stays a game play() can replay.
+            in_turn = self.code >> 3 == self.board.position.turn
+            self.board.make_move(self.board.encode_move(from_location, to), record=in_turn)
 
             if self.board.SHOW_BOARD:
                 self.board.show()
         return move
 
+    def move_calculations(self, paths, to):
+        from_letter, from_number = self.location
+        to_letter, to_number = to
+
+        dx = "abcdefgh".find(to_letter) - "abcdefgh".find(from_letter)
+        dy = "12345678".find(to_number) - "12345678".find(from_number)
+
+        vpos = to in map(lambda x: x.location, paths["V"])
+        dpos = to in map(lambda x: x.location, paths["D"])
+        hpos = to in map(lambda x: x.location, paths["H"])
+        lpos = to in map(lambda x: x.location, paths["L"])
+
+        valid = self.piece.move_valid_check(self, paths, to, dx, dy, vpos, dpos, hpos, lpos)
+
+        if valid[0] and not self.check_king_safety(to):
+            return False, "King exposed", None
+
+        return valid
+
+    def check_king_safety(self, to):
+        """Whether our king is safe after moving the piece on this square to.
+        The move is tried on the compact position and taken back."""
+        position = self.board.position
+        position.make_move(self.board.encode_move(self.location, to))
+        safe = not position.in_check(COLORS.index(self.color))
+        position.unmake_move()
+        return safe
+
     def get_paths(self, color=None):
         """Get all the squares that have access to attack this square."""
-        paths = {"H": set(), "V": set(), "D": set(), "L": set()}
-        origin = self
-        for direction in self.COMPUS_DIRECTIONS:
-            path = paths[self.COMPUS_TRANSLATIONS[direction]]
-            path = self._get_path(direction, path, color)
-            self = origin
-            paths[self.COMPUS_TRANSLATIONS[direction]] = path
-        return paths
+        if not color:
+            color = self.color
+
+        square, occupied, own = self._occupancy(color)
+        #~ One table lookup per slider type, then split by direction
+        sliding = (rook_attacks(square, occupied) | bishop_attacks(square, occupied)) & ~own
+        reach = {"H": 0, "V": 0, "D": 0, "L": KNIGHT_ATTACKS[square] & ~own}
+        for direction in RAY_MASKS:
+            reach[self.COMPUS_TRANSLATIONS[direction]] |= RAY_MASKS[direction][square] & sliding
+        return dict((translation, self._squares(bits)) for translation, bits in reach.iteritems())
 
     def _get_path(self, direction, path, color):
         """Get all the squares that have access to attack this square with the
-        direction passed."""
+        direction passed.  The reach comes from the slider tables in a single
+        lookup on the board's position instead of walking the neighbors."""
 
         if not color:
             color = self.color
-            
-        while True:
-            square = getattr(self, direction)
-            #~ None implies we're at the edge of the board
-            if square is None:
-                break
-
-            #~ colors match meaning we're attacking our own piece.  Only save up to the
-            #~ piece and not the piece as we can't capture.
-            if (color != "wb".replace(square.color, "")) and square.color:
-                return path
-
-            #~ colors are different meaning we're attaching a valid piece. Save up to and
-            #~ including the piece first encountered.
-            elif (color == "wb".replace(square.color, "")) and square.color:
-                path.add(square)
-                return path
-
-            path.add(square)
-            #~ L shape moves only propagate one space for every direction.
-            if direction.startswith("_L"):
-                return path
 
-            #~ Set the neighbor as the current square.
-            self = square
+        square, occupied, own = self._occupancy(color)
+        if direction.startswith("_L"):
+            #~ L shape moves only propagate one space for every direction.
+            neighbor = self.NEIGHBORS[self.location][direction]
+            reach = 1 << SQUARES[neighbor] if neighbor else 0
+        elif direction in ROOK_DIRECTIONS:
+            reach = RAY_MASKS[direction][square] & rook_attacks(square, occupied)
+        else:
+            reach = RAY_MASKS[direction][square] & bishop_attacks(square, occupied)
+        path.update(self._squares(reach & ~own))
         return path
 
+    def _occupancy(self, color):
+        """This square's index, every occupied square and the squares that
+        block color.  Our own pieces end a path before them, an enemy piece on
+        it.  With no color every piece counts as our own."""
+        position = self.board.position
+        occupied = position.occupied[0] | position.occupied[1]
+        own = position.occupied[COLORS.index(color)] if color else occupied
+        return SQUARES[self.location], occupied, own
+
+    def _squares(self, bits):
+        """Set of the board's squares in a bitboard."""
+        squares = set()
+        while bits:
+            low = bits & -bits
+            bits ^= low
+            letter, number = SQUARE_NAMES[low.bit_length() - 1]
+            squares.add(self.board[letter][number])
+        return squares
+
     def link(self, board):
-        """Finds all the neighboring squares to this square and sets an attr
-        to the neighboring object."""
+        """Ties the square to board.  The neighbors, square._N and friends, are
+        found in NEIGHBORS on the board when they are asked for."""
         self.board = board
-        for direction in self.COMPUS_DIRECTIONS:
-            setattr(self, direction, self._find_neighbors(board, direction))
-
-    def _find_neighbors(self, board, direction):
-        """Finds neighbor's object in the board given compus direction."""
-        neighbor = []
-        for part, delta, variables in zip(self.location, self.COMPUS_DELTAS[direction], self.LETTERS_NUMBERS):
-            try:
-                position = variables.find(part)
-                neighbor.append(variables[position + delta])
-            except (ValueError, IndexError):
+
+    @classmethod
+    def _find_neighbors(cls, location, direction):
+        """Finds neighbor's location given compus direction."""
+        neighbor = ""
+        for part, delta, variables in zip(location, cls.COMPUS_DELTAS[direction], cls.LETTERS_NUMBERS):
+            position = variables.find(part) + delta
+            #~ Stepping off either end lands on the padding space
+            if not (0 <= position < 8):
                 return None
+            neighbor += variables[position]
+        return neighbor
+
+    @classmethod
+    def _build_neighbors(cls):
+        letters, numbers = cls.LETTERS_NUMBERS
+        return dict((letter + number, dict((direction, cls._find_neighbors(letter + number, direction))
+                                          for direction in cls.COMPUS_DIRECTIONS))
+                    for letter in letters.strip() for number in numbers.strip())
+
+
+class Neighbor(object):
+    """A neighbor link of Square, the neighboring square on the same board or
+    None off the edge."""
+
+    __slots__ = ("direction",)
+
+    def __init__(self, direction):
+        self.direction = direction
+
+    def __get__(self, square, owner):
+        if square is None:
+            return self
+        location = Square.NEIGHBORS[square.location][self.direction]
+        return location and square.board.get(location)
+
+
+Square.NEIGHBORS = Square._build_neighbors()
+for _direction in Square.COMPUS_DIRECTIONS:
+    setattr(Square, _direction, Neighbor(_direction))
+
+
+#~ Move generation tables -------------------------------------------------------
+#~ Built once from Square.COMPUS_DELTAS.  RAYS[direction][square] is the tuple of
+#~ squares walked from square and RAY_MASKS the same squares as a bitboard.
+def _step(square, direction):
+    dx, dy = Square.COMPUS_DELTAS[direction]
+    letter, number = (square & 7) + dx, (square >> 3) + dy
+    if 0 <= letter < 8 and 0 <= number < 8:
+        return number * 8 + letter
+    return None
+
+def _walk(square, direction):
+    ray = []
+    square = _step(square, direction)
+    while square is not None:
+        ray.append(square)
+        square = _step(square, direction)
+    return tuple(ray)
+
+def _mask(squares):
+    mask = 0
+    for square in squares:
+        mask |= 1 << square
+    return mask
+
+ROOK_DIRECTIONS   = [d for d in Square.COMPUS_DIRECTIONS if Square.COMPUS_TRANSLATIONS[d] in "HV"]
+BISHOP_DIRECTIONS = [d for d in Square.COMPUS_DIRECTIONS if Square.COMPUS_TRANSLATIONS[d] == "D"]
+KNIGHT_DIRECTIONS = [d for d in Square.COMPUS_DIRECTIONS if Square.COMPUS_TRANSLATIONS[d] == "L"]
+#~ Directions walking up the square numbers find their first blocker at the
+#~ lowest set bit, the others at the highest.
+POSITIVE_DIRECTIONS = set(d for d in Square.COMPUS_DIRECTIONS
+                          if Square.COMPUS_DELTAS[d][1] > 0 or Square.COMPUS_DELTAS[d] == (1, 0))
+
+RAYS      = dict((d, [_walk(sq, d) for sq in xrange(64)]) for d in ROOK_DIRECTIONS + BISHOP_DIRECTIONS)
+RAY_MASKS = dict((d, [_mask(ray) for ray in RAYS[d]]) for d in RAYS)
+
+KNIGHT_ATTACKS = [_mask(_step(sq, d) for d in KNIGHT_DIRECTIONS if _step(sq, d) is not None)
+                  for sq in xrange(64)]
+KING_ATTACKS   = [_mask(_step(sq, d) for d in RAYS if _step(sq, d) is not None)
+                  for sq in xrange(64)]
+#~ PAWN_ATTACKS[color][square], the squares a pawn of color on square attacks
+PAWN_ATTACKS   = [[_mask(_step(sq, d) for d in directions if _step(sq, d) is not None)
+                   for sq in xrange(64)] for directions in (("_NE", "_NW"), ("_SE", "_SW"))]
+
+#~ BETWEEN[a][b], the squares strictly between two squares on a shared line
+BETWEEN = [[0] * 64 for _ in xrange(64)]
+for _direction in RAYS:
+    for _square in xrange(64):
+        _ray = RAYS[_direction][_square]
+        for _i, _other in enumerate(_ray):
+            BETWEEN[_square][_other] = _mask(_ray[:_i])
+
+
+def rook_attacks(square, occupied):
+    """Bitboard of the squares a rook on square reaches, blockers included."""
+    return ROOK_TABLES[square][occupied & ROOK_MASKS[square]]
+
+def bishop_attacks(square, occupied):
+    """Bitboard of the squares a bishop on square reaches, blockers included."""
+    return BISHOP_TABLES[square][occupied & BISHOP_MASKS[square]]
+
+def _slide(square, occupied, directions):
+    """Walks the rays to their first blocker, used to fill the tables."""
+    attacks = 0
+    for direction in directions:
+        masks = RAY_MASKS[direction]
+        ray = masks[square]
+        blockers = ray & occupied
+        if blockers:
+            if direction in POSITIVE_DIRECTIONS:
+                blocker = (blockers & -blockers).bit_length() - 1
+            else:
+                blocker = blockers.bit_length() - 1
+            #~ Cut the ray behind the first blocker
+            ray ^= masks[blocker]
+        attacks |= ray
+    return attacks
+
+#~ Only blockers before the last square of a ray change what a slider reaches,
+#~ so the tables are keyed by the occupied squares under these masks.
+ROOK_MASKS   = [_mask(sq for d in ROOK_DIRECTIONS for sq in RAYS[d][square][:-1]) for square in xrange(64)]
+BISHOP_MASKS = [_mask(sq for d in BISHOP_DIRECTIONS for sq in RAYS[d][square][:-1]) for square in xrange(64)]
+
+#~ Bumped whenever the layout of the cached tables changes
+SLIDER_TABLES_VERSION = 1
+
+def _slider_table(square, mask, directions):
+    """{occupied & mask: attacks} for every subset of mask."""
+    table, subset = {}, 0
+    while True:
+        table[subset] = _slide(square, subset, directions)
+        #~ Steps through every subset of mask in turn, back to 0 at the end
+        subset = (subset - mask) & mask
+        if not subset:
+            return table
+
+def load_slider_tables(path=None):
+    """The rook and bishop lookup tables, one dict per square.  They are read
+    from the marshal file at path when it holds them and written there when
+    not, so only the first start with a cache pays for building them."""
+    if path:
         try:
-            return board[neighbor[0]][neighbor[1]]
-        except KeyError:
-            return None
-
-
-class Piece(Square):
+            with open(path, "rb") as cache:
+                version, rooks, bishops = marshal.load(cache)
+            if version == SLIDER_TABLES_VERSION and len(rooks) == len(bishops) == 64:
+                return rooks, bishops
+        except (IOError, EOFError, ValueError, TypeError):
+            pass
+    rooks   = [_slider_table(square, ROOK_MASKS[square], ROOK_DIRECTIONS) for square in xrange(64)]
+    bishops = [_slider_table(square, BISHOP_MASKS[square], BISHOP_DIRECTIONS) for square in xrange(64)]
+    if path:
+        try:
+            #~ Written aside and renamed so a reader never sees half a file
+            with open(path + ".tmp", "wb") as cache:
+                marshal.dump((SLIDER_TABLES_VERSION, rooks, bishops), cache)
+            os.rename(path + ".tmp", path)
+        except (IOError, OSError):
+            pass
+    return rooks, bishops
+
+#~ ROOK_TABLES[square][occupied & ROOK_MASKS[square]] is what a rook on square
+#~ reaches, and the same for bishops.  Set CHESS_SLIDER_TABLES to a file path
+#~ to cache them on disk.
+ROOK_TABLES, BISHOP_TABLES = load_slider_tables(os.environ.get("CHESS_SLIDER_TABLES"))
+
+
+#~ Moves are 16 bit ints: to square, from square, promotion piece and a flag.
+MOVE_NORMAL, MOVE_PROMOTION, MOVE_ENPASSANT, MOVE_CASTLING = 0, 1 << 14, 2 << 14, 3 << 14
+PROMOTIONS = [KNIGHT, BISHOP, ROOK, QUEEN]
+
+def encode_move(from_square, to_square, promotion=EMPTY, flag=MOVE_NORMAL):
+    if promotion:
+        flag = MOVE_PROMOTION
+        promotion = PROMOTIONS.index(promotion) << 12
+    return to_square | (from_square << 6) | promotion | flag
+
+def move_name(move):
+    """Coordinate notation of a move, "e2e4" or "e7e8q"."""
+    name = SQUARE_NAMES[(move >> 6) & 63] + SQUARE_NAMES[move & 63]
+    if move & 0xc000 == MOVE_PROMOTION:
+        name += " nbrq"[((move >> 12) & 3) + 1]
+    return name
+
+
+def piece_attacks(code, square, occupied):
+    """Bitboard of the squares the piece code on square attacks."""
+    kind = code & 7
+    if kind == PAWN:
+        return PAWN_ATTACKS[code >> 3][square]
+    if kind == KNIGHT:
+        return KNIGHT_ATTACKS[square]
+    if kind == BISHOP:
+        return bishop_attacks(square, occupied)
+    if kind == ROOK:
+        return rook_attacks(square, occupied)
+    if kind == QUEEN:
+        return rook_attacks(square, occupied) | bishop_attacks(square, occupied)
+    return KING_ATTACKS[square]
+
+
+class Piece(object):
+    """A kind of piece of one color.  Pieces hold no state, where one stands
+    and how often it moved is kept by the Board, so there is a single shared
+    and immutable instance per piece code, see PIECE_INSTANCES.  Calling a
+    piece class returns that instance, Rook("a1", "w") is Rook("h8", "w")."""
 
     PIECES = {"King"  : {"b": "♔", "w": "♚"},
               "Queen" : {"b": "♕", "w": "♛"},
@@ -142,105 +458,79 @@ class Piece(Square):
               "Pawn"  : {"b": "♙", "w": "♟"},
               "Empty" : {"" : " "}}
 
-    def __init__(self, location, color="", side=""):
-        Square.__init__(self, location)
-        self.move_count = 0
-        self.color      = color
-        #~ Nice name of the class
-        self.name       = self.__class__.__name__
-        #~ The piece that get printed
-        self.symbol     = self.PIECES[self.name][self.color]
-        #~ The side (Queen or King) the piece is on
-        self.side       = side
-        #~ A list of all team members
-        self.team       = []
+    __slots__ = ("code", "name", "color", "symbol")
 
-    def __str__(self):
-        return self.symbol
+    #~ The shared instances, by class and color
+    _instances = {}
 
-    def move_calculations(self, paths, to):
-        from_letter, from_number = self.location
-        to_letter, to_number = to
+    def __new__(cls, location=None, color="", side=""):
+        #~ location and side are left over from when pieces were squares, the
+        #~ old calls still work but the arguments are not kept
+        piece = Piece._instances.get((cls, color))
+        if piece is None:
+            piece = object.__new__(cls)
+            name = cls.__name__
+            #~ Nice name of the class, the printed symbol and the Position code
+            object.__setattr__(piece, "name", name)
+            object.__setattr__(piece, "color", color)
+            object.__setattr__(piece, "symbol", cls.PIECES[name][color])
+            object.__setattr__(piece, "code", PIECE_CODES[name] | (BLACK if color == "b" else WHITE))
+            Piece._instances[cls, color] = piece
+        return piece
 
-        dx = "abcdefgh".find(to_letter) - "abcdefgh".find(from_letter)
-        dy = "12345678".find(to_number) - "12345678".find(from_number)
+    def __init__(self, location=None, color="", side=""):
+        pass
 
-        vpos = to in map(lambda x: x.location, paths["V"])
-        dpos = to in map(lambda x: x.location, paths["D"])
-        hpos = to in map(lambda x: x.location, paths["H"])
-        lpos = to in map(lambda x: x.location, paths["L"])
+    def __setattr__(self, name, value):
+        raise AttributeError("Pieces are shared and can't be changed")
 
-        valid = self.move_valid_check(paths, to, dx, dy, vpos, dpos, hpos, lpos)
+    def __copy__(self):
+        return self
 
-        if not self.check_king_safety(to):
-            return False, "King exposed", None
+    def __deepcopy__(self, memo):
+        return self
 
-        return valid
+    def __reduce__(self):
+        return self.__class__, (None, self.color)
 
-    def check_king_safety(self, to):
-        #~ Remove the piece from the board
-        from_piece    = self
-        from_location = self.location
-        to_piece      = self.board.get(to)
+    def __str__(self):
+        return self.symbol
 
-        self.board.set(to, from_piece)
-        self.board.set(from_location, Empty(from_location))
-        try:
-            king, = filter(lambda x: x.name is "King", self.team)
-        except ValueError:
-            return True
-        paths = king.get_paths()
-        threats = ["Rook", "Queen", "Bishop", "Knight", "Pawn", "King"]
-        for direction in "HVD":
-            for square in paths[direction]:
-                if (square.name in threats):
-                    self.board.set(from_location, from_piece)
-                    self.board.set(to_piece.location, to_piece)
-                    return False
-                    break
-        return True
+    def __repr__(self):
+        return "{}({!r})".format(self.name, self.color)
 
+    def move_valid_check(self, square, paths, to, dx, dy, vpos, dpos, hpos, lpos):
+        return False, "", None
 
-class Empty(Piece):
-    def __init__(self, location, color=""):
-        Piece.__init__(self, location)
 
-    def move(self, *args):
-        raise InvalidMove("Must select a square with a piece on it")
+class Empty(Piece):
+    __slots__ = ()
 
 
 class Pawn(Piece):
-    def __init__(self, location, color, side):
-        Piece.__init__(self, location, color, side)
-
-        #~ The direction that the piece must move, only needed with Pawns
-        if self.color == "w":
-            #~ Must move up the board
-            self.must_move = 1
-        else:
-            #~ Must move down the board
-            self.must_move = -1
+    __slots__ = ()
 
-    def move_valid_check(self, paths, to, dx, dy, vpos, dpos, hpos, lpos):
-        to_square = self.board.get(to)
+    def move_valid_check(self, square, paths, to, dx, dy, vpos, dpos, hpos, lpos):
+        #~ The direction that the piece must move, up the board for white
+        must_move = 1 if self.color == "w" else -1
+        to_square = square.board.get(to)
         #~ Square to handle enpassant
-        special = to_square.__getattribute__(["", "_S", "_N"][self.must_move])
+        special = getattr(to_square, ["", "_S", "_N"][must_move])
 
         valid_moves = [
         #~ Normal attack
-        ((dy * self.must_move) == 1) and dpos and (to_square.name is not "Empty"),
+        ((dy * must_move) == 1) and dpos and (to_square.name is not "Empty"),
         #~ Move one square
-        ((dy * self.must_move) == 1) and vpos and (to_square.name is "Empty"),
+        ((dy * must_move) == 1) and vpos and (to_square.name is "Empty"),
         #~ Move two squares on first move
-        ((dy * self.must_move) == 2) and vpos and (to_square.name is "Empty") and
-        (self.move_count == 0),
+        ((dy * must_move) == 2) and vpos and (to_square.name is "Empty") and
+        (square.move_count == 0),
         #~ Enpassant
-        ((dy * self.must_move) == 1) and dpos and (special.color != self.color) and
+        ((dy * must_move) == 1) and dpos and (special.color != self.color) and
         (special.name == "Pawn") and (special.move_count == 1) and
-        (self.board.last_moved == special)]
+        (square.board.last_moved is special)]
 
         if any(valid_moves):
-            self.move_count += 1
             if valid_moves[3]:
                 return True, "empassant", special
             elif valid_moves[0]:
@@ -252,10 +542,9 @@ class Pawn(Piece):
 
 
 class Rook(Piece):
-    def __init__(self, location, color, side):
-        Piece.__init__(self, location, color, side)
+    __slots__ = ()
 
-    def move_valid_check(self, paths, to, dx, dy, vpos, dpos, hpos, lpos):
+    def move_valid_check(self, square, paths, to, dx, dy, vpos, dpos, hpos, lpos):
         valid_moves = [(abs(dy) > 0) and (dx == 0) and vpos,
                        (abs(dx) > 0) and (dy == 0) and hpos]
         if any(valid_moves):
@@ -265,10 +554,9 @@ class Rook(Piece):
 
 
 class Knight(Piece):
-    def __init__(self, location, color, side):
-        Piece.__init__(self, location, color, side)
+    __slots__ = ()
 
-    def move_valid_check(self, paths, to, dx, dy, vpos, dpos, hpos, lpos):
+    def move_valid_check(self, square, paths, to, dx, dy, vpos, dpos, hpos, lpos):
         if lpos:
             return True, "normal", None
         else:
@@ -276,10 +564,9 @@ class Knight(Piece):
 
 
 class Bishop(Piece):
-    def __init__(self, location, color, side):
-        Piece.__init__(self, location, color, side)
+    __slots__ = ()
 
-    def move_valid_check(self, paths, to, dx, dy, vpos, dpos, hpos, lpos):
+    def move_valid_check(self, square, paths, to, dx, dy, vpos, dpos, hpos, lpos):
         if dpos:
             return True, "normal", None
         else:
@@ -287,173 +574,857 @@ class Bishop(Piece):
 
 
 class King(Piece):
-    def __init__(self, location, color, side):
-        Piece.__init__(self, location, color, side)
-
-    def move_valid_check(self, paths, to, dx, dy, vpos, dpos, hpos, lpos):
-        for side in "kq":
-            try:
-                rook, = filter(lambda x: x.name is "Rook" and x.side is "k", self.team)
-            except ValueError:
-                raise Exception("Rook not found in piece's team")
-            else:
-                rooks.append(rook)
-
-        valid_moves = [
-            #~ Normal King moves
-            ((abs(dx) == 1) or (abs(dy) == 1)) and ((to in vpos) or (to in hpos) or (to in dpos)),
-            #~ King side castle
-            (dx ==  2) and (dy == 0) and (self.move_count == 0) and (rooks[0].move_count == 0) and
-            (rooks[0].move_count == 0) and ("g1" in hpos),
-            #~ Queen side castle
-            (dx == -2) and (dy == 0) and (self.move_count == 0) and (rooks[1].move_count == 0) and
-            (rooks[1].move_count == 0) and ("b1" in hpos)]
+    __slots__ = ()
 
-        if any(valid_moves):
-            if valid_moves[1]:
-                return True, "queen_side_castle", None
-                self._check_safe_to_castle("queen")
-            elif valid_moves[2]:
-                return True, "king_side_castle", None
-                self._check_safe_to_castle("king")
-            else:
-                return True, "normal", None
-        else:
-            return False, "", None
-
-    def _check_safe_to_castle(self, side):
-        current = self
-        for step in xrange(3):
-            paths = current.get_paths(self.color)
-            for direction in "DVLH":
-                
-                threats = [
-                (direction in "D")  and any(map(lambda square: square.name in ["Queen", "Bishop"], paths[direction])),
-                (direction in "HV") and any(map(lambda square: square.name in ["Queen", "Rook"], paths[direction])),
-                (direction in "L")  and any(map(lambda square: square.name in ["Knight"], paths[direction])),]          
-                if any(threats):
-                    return False, "long range threat", None
-                
-            if side == "king":
-                close_threats = [
-                (current._NE.name in ["Pawn", "King"]) and (current._NE.color != self.color),
-                (current._NW.name in ["Pawn", "King"]) and (current._NW.color != self.color)]
-                current = current._E
-            else:
-                close_threats = [
-                (current._SE.name in ["Pawn", "King"]) and (current._SE.color != self.color),
-                (current._SW.name in ["Pawn", "King"]) and (current._SW.color != self.color)]
-                current = current._W
+    def move_valid_check(self, square, paths, to, dx, dy, vpos, dpos, hpos, lpos):
+        #~ Normal King moves
+        if max(abs(dx), abs(dy)) == 1 and (vpos or hpos or dpos):
+            return True, "normal", None
 
-            if any(close_threats):
-                return False, "point blank threat", None
+        #~ Castling, the king and its rook unmoved and nothing between them
+        if abs(dx) == 2 and dy == 0 and square.move_count == 0:
+            side = "king" if dx > 0 else "queen"
+            number = square.location[1]
+            rook = square.board.get(("h" if dx > 0 else "a") + number)
+            between = "fg" if dx > 0 else "bcd"
+            if rook.name == "Rook" and rook.color == self.color and rook.move_count == 0 and \
+               all(square.board.get(letter + number).name == "Empty" for letter in between):
+                safe = self._check_safe_to_castle(square, side)
+                if safe is not True:
+                    return safe
+                return True, "{}_side_castle".format(side), None
+        return False, "", None
+
+    def _check_safe_to_castle(self, square, side):
+        """The king may not castle out of, through or into check.  Each of the
+        three squares is a lookup in the attack maps, which already know how
+        every kind of piece attacks."""
+        enemy = "b" if self.color == "w" else "w"
+        step = 1 if side == "king" else -1
+        for index in (square.index, square.index + step, square.index + 2 * step):
+            if square.board.attacked(SQUARE_NAMES[index], enemy):
+                return False, "King passes through check", None
         return True
 
+
 class Queen(Piece):
-    def __init__(self, location, color, side):
-        Piece.__init__(self, location, color, side)
+    __slots__ = ()
 
-    def move_valid_check(self, paths, to, dx, dy, vpos, dpos, hpos, lpos):
-        if (to in hpos) or (to in vpos) or (to in hpos):
+    def move_valid_check(self, square, paths, to, dx, dy, vpos, dpos, hpos, lpos):
+        if hpos or vpos or dpos:
             return True, "normal", None
         else:
             return False, "", None
 
 
+#~ Piece classes indexed by the piece type of a Position code
+PIECE_CLASSES = [Empty, Pawn, Knight, Bishop, Rook, Queen, King]
+
+#~ The shared piece for every code, indexed like Position.mailbox
+PIECE_INSTANCES = [PIECE_CLASSES[code & 7](color=COLORS[code >> 3]) if EMPTY < code & 7 <= KING else Empty()
+                   for code in xrange(16)]
+
+
+class Position(object):
+    """Compact position core.  Placement is a 64 byte mailbox of piece codes
+    mirrored into one 64-bit bitboard per piece code and per color, and the
+    rest of the state is a handful of small ints.  Use pack() to store many
+    positions and Board(position) to get the object API back."""
+
+    __slots__ = ("mailbox", "bitboards", "occupied", "turn", "castling", "ep",
+                 "halfmove", "fullmove", "undo", "keys", "key", "attacks")
+
+    #~ Nibble packed mailbox followed by turn and castling, en passant square,
+    #~ halfmove clock and fullmove number.
+    PACKED = struct.Struct("<32sBbBH")
+
+    def __init__(self):
+        self.mailbox   = bytearray(64)
+        #~ Indexed by piece code, the EMPTY and unused codes stay 0
+        self.bitboards = [0] * 16
+        #~ Indexed by color, 0 for white and 1 for black
+        self.occupied  = [0, 0]
+        self.turn      = 0
+        self.castling  = 0
+        #~ Square a pawn can capture en passant onto, -1 if none
+        self.ep        = -1
+        self.halfmove  = 0
+        self.fullmove  = 1
+        #~ One int per move played, see make_move()
+        self.undo      = []
+        #~ The key before each move on undo, for repetitions()
+        self.keys      = []
+        #~ Zobrist key, kept up to date by every change to the position
+        self.key       = 0
+        #~ AttackMaps kept up to date by every change, see track_attacks()
+        self.attacks   = None
+
+    def __eq__(self, other):
+        return isinstance(other, Position) and self.pack() == other.pack()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def copy(self):
+        """An independent copy, the undo history and attack maps included, so
+        the copy can take back the moves played before it was made."""
+        position = Position.__new__(Position)
+        position.mailbox   = bytearray(self.mailbox)
+        position.bitboards = self.bitboards[:]
+        position.occupied  = self.occupied[:]
+        position.turn      = self.turn
+        position.castling  = self.castling
+        position.ep        = self.ep
+        position.halfmove  = self.halfmove
+        position.fullmove  = self.fullmove
+        position.undo      = self.undo[:]
+        position.keys      = self.keys[:]
+        position.key       = self.key
+        position.attacks   = self.attacks and self.attacks.copy(position)
+        return position
+
+    __copy__ = copy
+
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+    @classmethod
+    def start(cls):
+        """The standard starting position."""
+        position = cls()
+        lineup = [ROOK, KNIGHT, BISHOP, QUEEN, KING, BISHOP, KNIGHT, ROOK]
+        for letter, piece in enumerate(lineup):
+            position.put(letter,      piece | WHITE)
+            position.put(letter + 8,  PAWN  | WHITE)
+            position.put(letter + 48, PAWN  | BLACK)
+            position.put(letter + 56, piece | BLACK)
+        position.set_state(castling=15)
+        return position
+
+    @classmethod
+    def from_fen(cls, fen):
+        """Builds a position from a FEN string.  The clocks may be left off."""
+        fields = fen.split()
+        if len(fields) not in (4, 6):
+            raise ValueError("FEN needs 4 or 6 fields: {!r}".format(fen))
+        placement, turn, castling, ep = fields[:4]
+        rows = placement.split("/")
+        if len(rows) != 8 or turn not in COLORS:
+            raise ValueError("Bad FEN: {!r}".format(fen))
+
+        position = cls()
+        for row, pieces in enumerate(rows):
+            square = (7 - row) * 8
+            for symbol in pieces:
+                if symbol in "12345678":
+                    square += int(symbol)
+                    continue
+                code = FEN_SYMBOLS.find(symbol)
+                if code <= 0 or symbol == " ":
+                    raise ValueError("Bad piece {!r} in FEN: {!r}".format(symbol, fen))
+                if square >= (8 - row) * 8:
+                    raise ValueError("Bad row {!r} in FEN: {!r}".format(pieces, fen))
+                position.put(square, code)
+                square += 1
+            if square != (8 - row) * 8:
+                raise ValueError("Bad row {!r} in FEN: {!r}".format(pieces, fen))
+
+        rights = 0
+        for right in castling.replace("-", ""):
+            if right not in CASTLING:
+                raise ValueError("Bad castling rights in FEN: {!r}".format(fen))
+            rights |= 1 << CASTLING.index(right)
+        if ep != "-" and ep not in SQUARES:
+            raise ValueError("Bad en passant square in FEN: {!r}".format(fen))
+        position.set_state(COLORS.index(turn), rights, SQUARES.get(ep, -1))
+        if len(fields) == 6:
+            halfmove, fullmove = fields[4:]
+            #~ pack() stores the fullmove number in two bytes
+            if not (halfmove.isdigit() and fullmove.isdigit() and 1 <= int(fullmove) <= 0xffff):
+                raise ValueError("Bad move counters in FEN: {!r}".format(fen))
+            position.halfmove, position.fullmove = int(halfmove), int(fullmove)
+        return position
+
+    def to_fen(self):
+        """The position as a FEN string."""
+        rows = []
+        for number in xrange(7, -1, -1):
+            row, empty = "", 0
+            for code in self.mailbox[number * 8:number * 8 + 8]:
+                if code:
+                    row += (str(empty) if empty else "") + FEN_SYMBOLS[code]
+                    empty = 0
+                else:
+                    empty += 1
+            rows.append(row + (str(empty) if empty else ""))
+        castling = "".join(right for bit, right in enumerate(CASTLING) if self.castling & (1 << bit))
+        return "{} {} {} {} {} {}".format("/".join(rows), COLORS[self.turn], castling or "-",
+                                          SQUARE_NAMES[self.ep] if self.ep >= 0 else "-",
+                                          self.halfmove, self.fullmove)
+
+    def put(self, square, code):
+        """Places the piece code on the square, replacing what was there."""
+        self._put(square, code)
+        if self.attacks is not None:
+            self.attacks.update(1 << square)
+
+    def track_attacks(self):
+        """Starts keeping AttackMaps for this position and returns them."""
+        if self.attacks is None:
+            self.attacks = AttackMaps(self)
+        return self.attacks
+
+    def _put(self, square, code):
+        bit = 1 << square
+        old = self.mailbox[square]
+        if old:
+            self.bitboards[old] ^= bit
+            self.occupied[old >> 3] ^= bit
+        self.mailbox[square] = code
+        if code:
+            self.bitboards[code] |= bit
+            self.occupied[code >> 3] |= bit
+        self.key ^= ZOBRIST_PIECES[old][square] ^ ZOBRIST_PIECES[code][square]
+
+    def set_state(self, turn=None, castling=None, ep=None):
+        """Changes the side to move, castling rights or en passant square and
+        keeps the key up to date."""
+        self.key ^= self._state_key()
+        if turn is not None:
+            self.turn = turn
+        if castling is not None:
+            self.castling = castling
+        if ep is not None:
+            self.ep = ep
+        self.key ^= self._state_key()
+
+    def compute_key(self):
+        """The key worked out from scratch, self.key should always match it."""
+        key = self._state_key()
+        for square, code in enumerate(self.mailbox):
+            key ^= ZOBRIST_PIECES[code][square]
+        return key
+
+    def _state_key(self):
+        key = ZOBRIST_CASTLING[self.castling]
+        if self.turn:
+            key ^= ZOBRIST_TURN
+        #~ The en passant square only counts when a pawn can take on it, so
+        #~ transpositions after a harmless double push share a key.
+        ep = self.ep
+        if ep >= 0 and PAWN_ATTACKS[self.turn ^ 1][ep] & self.bitboards[PAWN | (self.turn << 3)]:
+            key ^= ZOBRIST_EP[ep & 7]
+        return key
+
+    def make_move(self, move):
+        """Plays a 16 bit move.  Everything unmake_move() needs to take it
+        back is packed into a single int on self.undo: the move, the captured
+        code, castling rights, en passant square, side to move and halfmove
+        clock."""
+        frm  = (move >> 6) & 63
+        to   = move & 63
+        flag = move & 0xc000
+        code     = self.mailbox[frm]
+        captured = self.mailbox[to]
+        self.undo.append(move | (captured << 16) | (self.castling << 20) | ((self.ep + 1) << 24) |
+                         (self.turn << 31) | (self.halfmove << 32))
+        self.keys.append(self.key)
+        self.key ^= self._state_key()
+        white, black = self.occupied
+
+        self._put(frm, EMPTY)
+        if flag == MOVE_PROMOTION:
+            self._put(to, PROMOTIONS[(move >> 12) & 3] | (code & BLACK))
+        else:
+            self._put(to, code)
+            if flag == MOVE_ENPASSANT:
+                #~ The captured pawn sits next to us on the rank we left
+                self._put((frm & 56) | (to & 7), EMPTY)
+            elif flag == MOVE_CASTLING:
+                rook_from, rook_to = CASTLING_ROOKS[to]
+                self._put(rook_to, self.mailbox[rook_from])
+                self._put(rook_from, EMPTY)
+        if self.attacks is not None:
+            #~ Every square a move touches changes color or empties
+            self.attacks.update((white ^ self.occupied[0]) | (black ^ self.occupied[1]))
+
+        self.castling &= CASTLING_MASKS[frm] & CASTLING_MASKS[to]
+        self.ep = -1
+        if code & 7 == PAWN:
+            self.halfmove = 0
+            if abs(to - frm) == 16:
+                self.ep = (frm + to) >> 1
+        elif captured:
+            self.halfmove = 0
+        else:
+            self.halfmove += 1
+        if code & BLACK:
+            self.fullmove += 1
+        self.turn = (code >> 3) ^ 1
+        self.key ^= self._state_key()
+
+    def unmake_move(self):
+        """Takes back the last move played with make_move()."""
+        record = self.undo.pop()
+        self.keys.pop()
+        frm  = (record >> 6) & 63
+        to   = record & 63
+        flag = record & 0xc000
+        code = self.mailbox[to]
+        if flag == MOVE_PROMOTION:
+            code = PAWN | (code & BLACK)
+
+        self.key ^= self._state_key()
+        white, black = self.occupied
+        self._put(to, (record >> 16) & 15)
+        self._put(frm, code)
+        if flag == MOVE_ENPASSANT:
+            self._put((frm & 56) | (to & 7), PAWN | (code & BLACK ^ BLACK))
+        elif flag == MOVE_CASTLING:
+            rook_from, rook_to = CASTLING_ROOKS[to]
+            self._put(rook_from, self.mailbox[rook_to])
+            self._put(rook_to, EMPTY)
+        if self.attacks is not None:
+            self.attacks.update((white ^ self.occupied[0]) | (black ^ self.occupied[1]))
+
+        if code & BLACK:
+            self.fullmove -= 1
+        self.castling = (record >> 20) & 15
+        self.ep       = ((record >> 24) & 127) - 1
+        self.turn     = (record >> 31) & 1
+        self.halfmove = record >> 32
+        self.key ^= self._state_key()
+
+    def history(self):
+        """The moves played with make_move() and not taken back, oldest first,
+        as an array of 16 bit moves."""
+        return array("H", [record & 0xffff for record in self.undo])
+
+    def repetitions(self, limit=None):
+        """How many times the position occurred before, among the positions
+        since the last capture or pawn move with the same side to move,
+        counting stops at limit.  The halfmove clock bounds the look back, so
+        it costs a few comparisons."""
+        keys = self.keys
+        key = self.key
+        count = 0
+        #~ Two plies can't bring a position back, the first candidate is four back
+        for index in xrange(len(keys) - 4, max(len(keys) - 1 - self.halfmove, -1), -2):
+            if keys[index] == key:
+                count += 1
+                if count == limit:
+                    break
+        return count
+
+    def is_repetition(self, count=2):
+        """Whether the position occurred count times before, twice for a
+        threefold repetition."""
+        return self.repetitions(count) >= count
+
+    def is_fifty_moves(self):
+        """Whether fifty moves of each side went by without a capture or a
+        pawn move."""
+        return self.halfmove >= 100
+
+    def attackers(self, square, color, occupied=None):
+        """Bitboard of the pieces of color index (0 white, 1 black) attacking
+        square.  occupied overrides the blockers for sliding pieces."""
+        if occupied is None:
+            occupied = self.occupied[0] | self.occupied[1]
+        bitboards = self.bitboards
+        side = color << 3
+        queens = bitboards[QUEEN | side]
+        return ((KNIGHT_ATTACKS[square] & bitboards[KNIGHT | side]) |
+                (KING_ATTACKS[square] & bitboards[KING | side]) |
+                (PAWN_ATTACKS[color ^ 1][square] & bitboards[PAWN | side]) |
+                (rook_attacks(square, occupied) & (bitboards[ROOK | side] | queens)) |
+                (bishop_attacks(square, occupied) & (bitboards[BISHOP | side] | queens)))
+
+    def attacked(self, square, color):
+        """Whether a piece of color index attacks square.  A lookup when the
+        attack maps are kept, see track_attacks()."""
+        if self.attacks is not None:
+            return bool((self.attacks.maps[color] >> square) & 1)
+        return bool(self.attackers(square, color))
+
+    def in_check(self, color=None):
+        """Whether the king of color index, the side to move by default, is
+        attacked."""
+        if color is None:
+            color = self.turn
+        king = self.bitboards[KING | (color << 3)]
+        if not king:
+            return False
+        return self.attacked(king.bit_length() - 1, color ^ 1)
+
+    def legal_moves(self, color=None):
+        """List of every legal move for color index, the side to move by
+        default.  Pins and checks are worked out up front so the position is
+        never changed while generating."""
+        if color is None:
+            color = self.turn
+        them     = color ^ 1
+        side     = color << 3
+        mailbox  = self.mailbox
+        bb       = self.bitboards
+        own      = self.occupied[color]
+        occupied = own | self.occupied[them]
+        moves    = []
+        append   = moves.append
+
+        king = bb[KING | side]
+        if not king:
+            return moves
+        king_square = king.bit_length() - 1
+
+        #~ King steps, with the king lifted off so it can't hide on its own ray
+        targets = KING_ATTACKS[king_square] & ~own
+        while targets:
+            low = targets & -targets
+            to = low.bit_length() - 1
+            targets ^= low
+            if not self.attackers(to, them, occupied ^ king):
+                append(to | (king_square << 6))
+
+        checkers = self.attackers(king_square, them, occupied)
+        if checkers & (checkers - 1):
+            #~ Double check, only the king can move
+            return moves
+        allowed = ~own
+        if checkers:
+            checker = checkers.bit_length() - 1
+            allowed &= checkers | BETWEEN[king_square][checker]
+
+        #~ Pinned pieces may only move along the line to their pinner
+        pins = {}
+        enemy_queens = bb[QUEEN | (them << 3)]
+        for directions, slider in ((ROOK_DIRECTIONS, ROOK), (BISHOP_DIRECTIONS, BISHOP)):
+            sliders = bb[slider | (them << 3)] | enemy_queens
+            for direction in directions:
+                if not RAY_MASKS[direction][king_square] & sliders:
+                    continue
+                pinned = None
+                for square in RAYS[direction][king_square]:
+                    code = mailbox[square]
+                    if not code:
+                        continue
+                    if (code >> 3) == color and pinned is None:
+                        pinned = square
+                    else:
+                        if pinned is not None and (sliders >> square) & 1:
+                            pins[pinned] = BETWEEN[king_square][square] | (1 << square)
+                        break
+
+        pieces = own ^ king
+        while pieces:
+            low = pieces & -pieces
+            frm = low.bit_length() - 1
+            pieces ^= low
+            kind = mailbox[frm] & 7
+            if kind == PAWN:
+                self._pawn_moves(frm, color, occupied, allowed, pins.get(frm, -1), king_square, append)
+                continue
+            if kind == KNIGHT:
+                if frm in pins:
+                    continue
+                targets = KNIGHT_ATTACKS[frm]
+            elif kind == BISHOP:
+                targets = bishop_attacks(frm, occupied)
+            elif kind == ROOK:
+                targets = rook_attacks(frm, occupied)
+            else:
+                targets = rook_attacks(frm, occupied) | bishop_attacks(frm, occupied)
+            targets &= allowed & pins.get(frm, -1)
+            frm <<= 6
+            while targets:
+                low = targets & -targets
+                targets ^= low
+                append((low.bit_length() - 1) | frm)
+
+        if not checkers and self.castling:
+            self._castling_moves(color, king_square, occupied, append)
+        return moves
+
+    def _pawn_moves(self, frm, color, occupied, allowed, pinned, king_square, append):
+        if color:
+            forward, last_rank, double_rank = -8, 0, 6
+        else:
+            forward, last_rank, double_rank = 8, 7, 1
+        targets = PAWN_ATTACKS[color][frm] & self.occupied[color ^ 1]
+        to = frm + forward
+        if not (occupied >> to) & 1:
+            targets |= 1 << to
+            if (frm >> 3) == double_rank and not (occupied >> (to + forward)) & 1:
+                targets |= 1 << (to + forward)
+        targets &= allowed & pinned
+        while targets:
+            low = targets & -targets
+            to = low.bit_length() - 1
+            targets ^= low
+            if (to >> 3) == last_rank:
+                for promotion in xrange(4):
+                    append(to | (frm << 6) | (promotion << 12) | MOVE_PROMOTION)
+            else:
+                append(to | (frm << 6))
+
+        ep = self.ep
+        if ep >= 0 and (PAWN_ATTACKS[color][frm] >> ep) & 1:
+            captured = ep - forward
+            if self.mailbox[captured] != (PAWN | ((color ^ 1) << 3)):
+                return
+            #~ Lifting two pawns off one rank can expose the king, so check the
+            #~ resulting occupancy directly instead of using the pin masks.
+            after = occupied ^ (1 << frm) ^ (1 << captured) | (1 << ep)
+            if self.attackers(king_square, color ^ 1, after) & ~(1 << captured):
+                return
+            append(ep | (frm << 6) | MOVE_ENPASSANT)
+
+    def _castling_moves(self, color, king_square, occupied, append):
+        home = 56 * color
+        if king_square != home + 4:
+            return
+        rook = ROOK | (color << 3)
+        rights = self.castling >> (2 * color)
+        #~ (right, rook square, squares that must be empty, squares the king crosses)
+        for right, corner, empty, crossed in ((1, 7, (5, 6), (5, 6)), (2, 0, (1, 2, 3), (3, 2))):
+            if not rights & right or self.mailbox[home + corner] != rook:
+                continue
+            if any((occupied >> (home + square)) & 1 for square in empty):
+                continue
+            if any(self.attacked(home + square, color ^ 1) for square in crossed):
+                continue
+            append((home + crossed[1]) | (king_square << 6) | MOVE_CASTLING)
+
+    def pack(self):
+        """Serializes the position into a 37 byte string."""
+        mailbox = self.mailbox
+        placement = bytearray(mailbox[i] | (mailbox[i + 1] << 4) for i in xrange(0, 64, 2))
+        return self.PACKED.pack(str(placement), self.turn | (self.castling << 1), self.ep,
+                                min(self.halfmove, 255), self.fullmove)
+
+    @classmethod
+    def unpack(cls, data):
+        """Builds a position from a string made by pack()."""
+        placement, flags, ep, halfmove, fullmove = cls.PACKED.unpack(data)
+        position = cls()
+        for i, byte in enumerate(bytearray(placement)):
+            if byte & 15:
+                position.put(2 * i, byte & 15)
+            if byte >> 4:
+                position.put(2 * i + 1, byte >> 4)
+        position.set_state(flags & 1, flags >> 1, ep)
+        position.halfmove = halfmove
+        position.fullmove = fullmove
+        return position
+
+
+class AttackMaps(object):
+    """Squares attacked by every piece and by each color of a Position, kept
+    up to date as it changes.  After a change only the pieces on the changed
+    squares and the sliders whose rays cross one of them are worked out again,
+    so "is this square attacked" stays a lookup:
+
+        attacks = position.track_attacks()
+        if (attacks.maps[color] >> square) & 1: ...
+    """
+
+    __slots__ = ("position", "by_square", "maps")
+
+    def __init__(self, position):
+        self.position  = position
+        #~ Squares attacked by the piece on each square, 0 for empty squares
+        self.by_square = [0] * 64
+        #~ Squares attacked by each color, indexed by color
+        self.maps      = [0, 0]
+        self.refresh()
+
+    def copy(self, position):
+        """The same maps, kept for position from now on."""
+        attacks = AttackMaps.__new__(AttackMaps)
+        attacks.position  = position
+        attacks.by_square = self.by_square[:]
+        attacks.maps      = self.maps[:]
+        return attacks
+
+    def refresh(self):
+        """Works every map out from scratch."""
+        self.update((1 << 64) - 1)
+
+    def update(self, changed):
+        """Brings the maps up to date after the squares of the changed
+        bitboard were emptied or filled."""
+        position  = self.position
+        mailbox   = position.mailbox
+        bitboards = position.bitboards
+        by_square = self.by_square
+        occupied  = position.occupied[0] | position.occupied[1]
+        #~ A slider reaches up to its first blocker, so a changed square on
+        #~ one of its rays is always in its old attacks
+        sliders = (bitboards[BISHOP] | bitboards[ROOK] | bitboards[QUEEN] |
+                   bitboards[BISHOP | BLACK] | bitboards[ROOK | BLACK] | bitboards[QUEEN | BLACK])
+        stale = changed
+        while sliders:
+            low = sliders & -sliders
+            sliders ^= low
+            if by_square[low.bit_length() - 1] & changed:
+                stale |= low
+        while stale:
+            low = stale & -stale
+            square = low.bit_length() - 1
+            stale ^= low
+            code = mailbox[square]
+            by_square[square] = piece_attacks(code, square, occupied) if code else 0
+
+        maps = [0, 0]
+        while occupied:
+            low = occupied & -occupied
+            square = low.bit_length() - 1
+            occupied ^= low
+            maps[mailbox[square] >> 3] |= by_square[square]
+        self.maps = maps
+
+
 class Board(dict):
 
     SHOW_BOARD = True
 
-    def __init__(self):
-        board = self.setup()
-        for letter_key in board:
-            self[letter_key] = {}
-            for number_key in board[letter_key]:
-                self[letter_key][number_key] = board[letter_key][number_key]
+    PIECE_CLASSES = PIECE_CLASSES
+
+    def __init__(self, position=None):
+        """Builds the board for position, the start position by default.  The
+        squares are a facade over the compact Position kept in self.position,
+        they are made once and read their piece from it."""
+        if position is None:
+            position = Position.start()
+        self._link_squares()
 
         self.move_list  = []
         self.last_moved = None
+        #~ Squares whose move count a move changed, with the old counts, and
+        #~ the location of the last moved piece, for every move played with
+        #~ make_move()
+        self.undo_stack = []
+        self.setup(position)
 
         if self.SHOW_BOARD:
-            self.setup()
             self.show()
 
     def __getattr__(self, location):
         return self.get(location)
 
-    def show(self):
+    def copy(self):
+        """An independent board in the same state, move history included.  No
+        setup() is run, the compact state is copied, so it takes microseconds
+        and the copy can be played on without touching this board."""
+        board = Board.__new__(Board)
+        board._link_squares()
+        board.position    = self.position.copy()
+        board.move_counts = self.move_counts[:]
+        board.move_list   = self.move_list[:]
+        #~ The records are never changed once pushed, so they can be shared
+        board.undo_stack  = self.undo_stack[:]
+        board.last_moved  = self.last_moved and board.get(self.last_moved.location)
+        return board
+
+    __copy__ = copy
+
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+    def snapshot(self):
+        """The compact Position of this board, copied.  Cheaper than copy()
+        when a worker only needs to search or play moves, see Position.  The
+        attack maps are left behind, keeping them up to date would slow every
+        move on the copy."""
+        position = self.position.copy()
+        position.attacks = None
+        return position
+
+    @classmethod
+    def from_fen(cls, fen):
+        """Builds the board for a FEN string in a single pass over the
+        squares, see Position.from_fen()."""
+        return cls(Position.from_fen(fen))
+
+    def to_fen(self):
+        return self.position.to_fen()
+
+    def show(self, out=None):
+        """Draws the board on out, stdout by default."""
         #~ "┌ ┐ └ ┘ ┬ ┴ ├ ┤ ─ │ ┼"
-        print " ┌───┬───┬───┬───┬───┬───┬───┬───┐"
+        print >> out, " ┌───┬───┬───┬───┬───┬───┬───┬───┐"
         for number in "87654321":
             row = []
             for letter in "abcdefgh":
                 row.append(self[letter][number].symbol)
-            print number + "│ {} │ {} │ {} │ {} │ {} │ {} │ {} │ {} │".format(*row)
+            print >> out, number + "│ {} │ {} │ {} │ {} │ {} │ {} │ {} │ {} │".format(*row)
             if number == "1": break
-            print " ├───┼───┼───┼───┼───┼───┼───┼───┤"
-        print " └───┴───┴───┴───┴───┴───┴───┴───┘"
-        print "   a   b   c   d   e   f   g   h"
-
-    def update_move_list(self, from_location, to_location):
-        cl_move = "Board.{}.move(\"{}\")".format(from_location, to_location)
-        self.move_list.append(cl_move)
+            print >> out, " ├───┼───┼───┼───┼───┼───┼───┼───┤"
+        print >> out, " └───┴───┴───┴───┴───┴───┴───┴───┘"
+        print >> out, "   a   b   c   d   e   f   g   h"
+
+    def legal_moves(self, color="w"):
+        """Yields every legal move for color ("w" or "b") as a 16 bit move, see
+        encode_move() and move_name().  The board is not changed."""
+        for move in self.position.legal_moves(COLORS.index(color)):
+            yield move
+
+    def attacked(self, location, color):
+        """Whether a piece of color ("w" or "b") attacks location.  A lookup
+        in the attack maps self.position keeps up to date."""
+        return self.position.attacked(SQUARES[location], COLORS.index(color))
+
+    def update_move_list(self, move):
+        """Records the SAN of a 16 bit move about to be played, so move_list
+        reads like a PGN game and can be replayed with play()."""
+        #~ notation imports this module, so it is imported when first needed
+        from notation import san
+        self.move_list.append(san(self.position, move))
+
+    def play(self, text):
+        """Plays a move given in SAN ("Nf3", "exd5", "e8=Q") or coordinate
+        notation ("g1f3", "e7e8q") and returns it as a 16 bit move.  Raises
+        InvalidMove when it is malformed or illegal."""
+        from notation import parse_move
+        move = parse_move(self.position, text)
+        self.make_move(move, record=True)
+        if self.SHOW_BOARD:
+            self.show()
+        return move
 
-    def get(self, location):
-        letter, number = location
-        return self[letter][number]
+    @property
+    def key(self):
+        """64-bit Zobrist key of the position, see Position.key."""
+        return self.position.key
 
-    def set(self, location, square):
-        self[location[0]][location[1]] = square
-        square.location = location
-        #~ Every time a move is made we must relink our squares as moveing
-        #~ will break links and reference the incorrect square.
-        self._link_squares()
+    def repetitions(self):
+        """How many times the position occurred before, see Position."""
+        return self.position.repetitions()
 
-    def setup(self):
-        board  = {letter:{number:None for number in "12345678"} for letter in "abcdefgh"}
-        lineup = [Rook, Knight, Bishop, Queen, King, Bishop, Knight, Rook]
-        white = []
-        black = []
-        for piece, letter, side in zip(lineup, "abcdefgh", "qqqqkkkk"):
-            for number, color in zip("18", "wb"):
-                board[letter][number] = piece(letter + number, color, side)
-                if color == "w":
-                    white.append(board[letter][number])
-                else:
-                    black.append(board[letter][number])
+    def is_repetition(self, count=2):
+        return self.position.is_repetition(count)
 
-            for number, color in zip("27", "wb"):
-                board[letter][number] = Pawn(letter + number, color, side)
-                if color == "w":
-                    white.append(board[letter][number])
-                else:
-                    black.append(board[letter][number])
+    def is_fifty_moves(self):
+        return self.position.is_fifty_moves()
 
-            for number in "3456":
-                board[letter][number] = Empty(letter + number)
+    def get(self, location):
+        letter, number = location
+        return self[letter][number]
 
-        self._set_teams(board, white, black)
-        self._link_squares()
-        return board
+    def set(self, location, piece):
+        """Puts piece on location.  piece is a Piece, or a Square whose piece
+        and move count are copied."""
+        move_count = 0
+        if isinstance(piece, Square):
+            piece, move_count = piece.piece, piece.move_count
+        self.position.put(SQUARES[location], piece.code)
+        self.move_counts[SQUARES[location]] = move_count if piece.code else 0
+        if location in CASTLING_LOCATIONS:
+            self.position.set_state(castling=self._castling_rights())
+
+    def encode_move(self, from_location, to_location, promotion=QUEEN):
+        """Builds the 16 bit move for the piece on from_location, working out
+        en passant, castling and promotion from the position."""
+        frm, to = SQUARES[from_location], SQUARES[to_location]
+        kind = self.position.mailbox[frm] & 7
+        if kind == PAWN:
+            if (to >> 3) in (0, 7):
+                return encode_move(frm, to, promotion)
+            if to == self.position.ep and (frm & 7) != (to & 7):
+                return encode_move(frm, to, flag=MOVE_ENPASSANT)
+        elif kind == KING and abs((to & 7) - (frm & 7)) == 2:
+            return encode_move(frm, to, flag=MOVE_CASTLING)
+        return encode_move(frm, to)
+
+    def make_move(self, move, record=False):
+        """Plays a 16 bit move on self.position and moves the move counts
+        along, pushing an undo record so unmake_move() can take it back.
+        With record the move's SAN goes on move_list, and comes off it again
+        on unmake_move()."""
+        frm, to, flag = (move >> 6) & 63, move & 63, move & 0xc000
+        counts = self.move_counts
+        touched = [frm, to]
+        if flag == MOVE_ENPASSANT:
+            touched.append((frm & 56) | (to & 7))
+        elif flag == MOVE_CASTLING:
+            touched.extend(CASTLING_ROOKS[to])
+        if record:
+            #~ Recorded first, SAN reads the position before the move
+            self.update_move_list(move)
+        self.undo_stack.append(([(square, counts[square]) for square in touched],
+                                self.last_moved and self.last_moved.location, record))
+
+        self.position.make_move(move)
+        counts[to]  = counts[frm] + 1
+        counts[frm] = 0
+        if flag == MOVE_ENPASSANT:
+            counts[touched[2]] = 0
+        elif flag == MOVE_CASTLING:
+            rook_from, rook_to = CASTLING_ROOKS[to]
+            counts[rook_to]   = counts[rook_from] + 1
+            counts[rook_from] = 0
+        self.last_moved = self.get(SQUARE_NAMES[to])
+
+    def unmake_move(self):
+        """Takes back the last move played with make_move()."""
+        touched, last_moved, recorded = self.undo_stack.pop()
+        if recorded:
+            self.move_list.pop()
+        self.last_moved = last_moved and self.get(last_moved)
+        self.position.unmake_move()
+        for square, count in touched:
+            self.move_counts[square] = count
+
+    def setup(self, position=None):
+        """Takes a private copy of position and works out the move counts and
+        the last moved pawn it implies."""
+        if position is None:
+            position = Position.start()
+        #~ A copy keeps the key history, so repetitions carry over
+        self.position = position.copy()
+        self.position.track_attacks()
+
+        #~ Pawns off their first rank have moved, and so have kings and rooks
+        #~ without castling rights
+        self.move_counts = counts = [0] * 64
+        for square, code in enumerate(position.mailbox):
+            if code & 7 == PAWN:
+                counts[square] = int((square >> 3) != (6 if code & BLACK else 1))
+            elif code & 7 in (KING, ROOK):
+                rights = position.castling & (15 ^ CASTLING_MASKS[square]) & (12 if code & BLACK else 3)
+                counts[square] = int(not rights)
+        if position.ep >= 0:
+            #~ The pawn that just made its double step
+            self.last_moved = self.get(SQUARE_NAMES[position.ep + (8 if position.turn else -8)])
 
     def clear(self):
-        for letter in "abcdefgh":
-            for number in "12345678":
-                self[letter][number] = Empty(letter + number)
+        self.position = Position()
+        self.position.track_attacks()
+        self.move_counts = [0] * 64
+        self.last_moved  = None
+        self.move_list   = []
+        self.undo_stack  = []
         self.show()
 
     #~ Internal APIs -----------------------------------------------------------
-    def _set_teams(self, board, white, black):
-        for letter in "abcdefgh":
-            for number in "12":
-                board[letter][number].team = white
-            for number in "78":
-                board[letter][number].team = black
+    def _castling_rights(self):
+        """Castling rights read from the move counts of the kings and rooks."""
+        rights = 0
+        for right, king, rook in CASTLING_PIECES:
+            king, rook = self.get(king), self.get(rook)
+            if king.name == "King" and rook.name == "Rook" and king.color == rook.color and \
+               not (king.move_count or rook.move_count):
+                rights |= right
+        return rights
 
     def _link_squares(self):
-        for letter in self.keys():
-            for number in self[letter].keys():
-                self[letter][number].init(self)
+        """Makes the 64 squares and links them to the board.  Squares are never
+        replaced, so this runs once per board."""
+        for letter in "abcdefgh":
+            squares = self[letter] = {}
+            for number in "12345678":
+                square = squares[number] = Square(letter + number)
+                square.init(self)
 
 
 if __name__ == "__main__":
@@ -465,10 +1436,6 @@ if __name__ == "__main__":
     r = Rook("e2", "w", "k")
     br = Rook("f3", "b", "k")
 
-    k.team = [k, r]
-    r.team = [k, r]
-    br.team = [br]
-
     b.set("e1", k)
     b.set("e2", r)
     b.set("f3", br)
@@ -1,6 +1,11 @@
 from unittest import TestCase, main
+import copy
+import os
+import random
+import shutil
+import tempfile
 from ipdb import set_trace as trace
-from newBoard import *
+from chess import *
 
 Board.SHOW_BOARD = False
 
@@ -200,5 +205,493 @@ class TestBishopMoves(TestCase):
 
 
 
+class TestLinking(TestCase):
+
+    def setUp(self):
+        self.b = Board()
+
+    def test_neighbors(self):
+        self.assertIs(self.b.e2._N, self.b.e3)
+        self.assertIs(self.b.b1._L1, self.b.c3)
+        self.assertIsNone(self.b.a1._W)
+        self.assertIsNone(self.b.h8._NE)
+
+    def test_set_keeps_links(self):
+        e2, e4 = self.b.e2, self.b.e4
+        self.b.set("e4", e2)
+        self.b.set("e2", Empty("e2"))
+        self.assertIs(self.b.e5._S, e4)
+        self.assertIs(self.b.f6._L6, e4)
+        self.assertIs(e4._N, self.b.e5)
+        self.assertIs(self.b.e1._N, e2)
+        self.assertEqual(e4.name, "Pawn")
+        self.assertEqual(e2.name, "Empty")
+
+
+class TestPosition(TestCase):
+
+    def setUp(self):
+        self.b = Board()
+
+    def test_start_position(self):
+        self.assertEqual(self.b.position, Position.start())
+        self.assertEqual(self.b.position.mailbox[SQUARES["e1"]], KING | WHITE)
+        self.assertEqual(self.b.position.mailbox[SQUARES["d8"]], QUEEN | BLACK)
+        self.assertEqual(self.b.position.occupied, [0xffff, 0xffff << 48])
+
+    def test_set_mirrors_position(self):
+        self.b.set("e4", Knight("e4", "b", "k"))
+        self.assertEqual(self.b.position.mailbox[SQUARES["e4"]], KNIGHT | BLACK)
+        self.assertEqual(self.b.position.bitboards[KNIGHT | BLACK], (1 << 57) | (1 << 62) | (1 << 28))
+        self.b.set("e4", Empty("e4"))
+        self.assertEqual(self.b.position.mailbox[SQUARES["e4"]], EMPTY)
+
+    def test_move_records_state(self):
+        self.b.e2.move("e4")
+        self.assertEqual(self.b.move_list, ["e4"])
+        self.assertEqual(self.b.position.ep, SQUARES["e3"])
+        self.assertEqual(self.b.position.turn, 1)
+
+    def test_unmake_takes_back_move_list(self):
+        self.b.play("e4")
+        self.b.unmake_move()
+        self.b.play("d4")
+        self.b.e7.move("e5")
+        self.b.make_move(self.b.encode_move("g1", "f3"))
+        self.assertEqual(self.b.move_list, ["d4", "e5"])
+        self.b.unmake_move()
+        self.b.unmake_move()
+        self.assertEqual(self.b.move_list, ["d4"])
+
+    def test_out_of_turn_moves_not_recorded(self):
+        self.b.e2.move("e4")
+        self.assertEqual(self.b.d2.move("d4")[0], True)
+        self.b.play("Nc6")
+        self.assertEqual(self.b.move_list, ["e4", "Nc6"])
+        self.b.unmake_move()
+        self.b.unmake_move()
+        self.assertEqual(self.b.move_list, ["e4"])
+
+    def test_play_notation(self):
+        self.b.e2.move("e4")
+        for text in ["e7e5", "Nf3", "Nc6", "Bb5", "a7a6"]:
+            self.b.play(text)
+        self.assertEqual(self.b.move_list, ["e4", "e5", "Nf3", "Nc6", "Bb5", "a6"])
+        self.assertRaises(InvalidMove, self.b.play, "Ke3")
+        replayed = Board()
+        for text in self.b.move_list:
+            replayed.play(text)
+        self.assertEqual(replayed.position, self.b.position)
+
+    def test_pack(self):
+        self.b.e2.move("e4")
+        data = self.b.position.pack()
+        self.assertEqual(len(data), 37)
+        self.assertEqual(Position.unpack(data), self.b.position)
+
+    def test_board_from_position(self):
+        self.b.e2.move("e4")
+        board = Board(self.b.position)
+        self.assertEqual(board.e4.name, "Pawn")
+        self.assertEqual(board.e2.name, "Empty")
+        self.assertEqual(board.e4.team, board.a1.team)
+        self.assertEqual(len(board.e4.team), 16)
+        self.assertEqual(board.position, self.b.position)
+        self.assertIsNot(board.position, self.b.position)
+
+
+class TestLegalMoves(TestCase):
+
+    def setUp(self):
+        self.b = Board()
+        self.b.clear()
+
+    def moves(self, color="w"):
+        return sorted(move_name(move) for move in self.b.legal_moves(color))
+
+    def test_start_position(self):
+        board = Board()
+        self.assertEqual(len(list(board.legal_moves("w"))), 20)
+        self.assertEqual(len(list(board.legal_moves("b"))), 20)
+        self.assertEqual(board.position, Position.start())
+
+    def test_pinned_piece(self):
+        self.b.set("e1", King("e1", "w", "k"))
+        self.b.set("e2", Rook("e2", "w", "k"))
+        self.b.set("e8", Rook("e8", "b", "k"))
+        self.b.set("a8", King("a8", "b", "q"))
+        rook_moves = [move for move in self.moves() if move.startswith("e2")]
+        self.assertEqual(rook_moves, ["e2e3", "e2e4", "e2e5", "e2e6", "e2e7", "e2e8"])
+
+    def test_check_evasions(self):
+        self.b.set("e1", King("e1", "w", "k"))
+        self.b.set("a2", Rook("a2", "w", "q"))
+        self.b.set("e8", Rook("e8", "b", "k"))
+        self.b.set("a8", King("a8", "b", "q"))
+        self.assertEqual(self.moves(), ["a2e2", "e1d1", "e1d2", "e1f1", "e1f2"])
+
+    def test_castling(self):
+        self.b.set("e1", King("e1", "w", "k"))
+        self.b.set("h1", Rook("h1", "w", "k"))
+        self.b.set("a1", Rook("a1", "w", "q"))
+        self.b.set("e8", King("e8", "b", "k"))
+        self.b.set("d8", Rook("d8", "b", "q"))
+        self.assertEqual(self.b.position.castling, WHITE_KING_SIDE | WHITE_QUEEN_SIDE)
+        moves = self.moves()
+        self.assertIn("e1g1", moves)
+        #~ d1 is attacked by the rook on d8
+        self.assertNotIn("e1c1", moves)
+
+    def test_en_passant(self):
+        board = Board()
+        board.e2.move("e4")
+        board.a7.move("a6")
+        board.e4.move("e5")
+        board.d7.move("d5")
+        moves = sorted(move_name(move) for move in board.legal_moves("w"))
+        self.assertIn("e5d6", moves)
+
+    def test_promotion(self):
+        self.b.set("e1", King("e1", "w", "k"))
+        self.b.set("a8", King("a8", "b", "q"))
+        self.b.set("g7", Pawn("g7", "w", "k"))
+        promotions = [move for move in self.moves() if move.startswith("g7")]
+        self.assertEqual(promotions, ["g7g8b", "g7g8n", "g7g8q", "g7g8r"])
+
+
+class TestMakeUnmake(TestCase):
+
+    def setUp(self):
+        self.b = Board()
+
+    def play(self, *moves):
+        for move in moves:
+            self.b.make_move(self.b.encode_move(move[:2], move[2:]))
+
+    def test_unmake_restores(self):
+        before = self.b.position.pack()
+        self.play("e2e4", "d7d5", "e4d5")
+        self.assertEqual(self.b.d5.piece, Pawn(color="w"))
+        self.assertEqual(self.b.d5.move_count, 2)
+        self.assertIs(self.b.last_moved, self.b.d5)
+        for _ in xrange(3):
+            self.b.unmake_move()
+        self.assertEqual(self.b.position.pack(), before)
+        self.assertEqual(self.b.e2.name, "Pawn")
+        self.assertEqual(self.b.e2.move_count, 0)
+        self.assertEqual(self.b.move_counts, [0] * 64)
+        self.assertIsNone(self.b.last_moved)
+        self.assertEqual(self.b.d7.name, "Pawn")
+
+    def test_en_passant(self):
+        self.play("e2e4", "a7a6", "e4e5", "d7d5", "e5d6")
+        self.assertEqual(self.b.d5.name, "Empty")
+        self.assertEqual(self.b.position.mailbox[SQUARES["d5"]], EMPTY)
+        self.b.unmake_move()
+        self.assertEqual(self.b.d5.name, "Pawn")
+        self.assertEqual(self.b.position.ep, SQUARES["d6"])
+
+    def test_castling(self):
+        self.play("e2e4", "e7e5", "g1f3", "b8c6", "f1c4", "g8f6", "e1g1")
+        self.assertEqual(self.b.g1.name, "King")
+        self.assertEqual(self.b.f1.name, "Rook")
+        self.assertEqual(self.b.position.castling, BLACK_KING_SIDE | BLACK_QUEEN_SIDE)
+        self.b.unmake_move()
+        self.assertEqual(self.b.h1.name, "Rook")
+        self.assertEqual(self.b.h1.move_count, 0)
+        self.assertEqual(self.b.position.castling, 15)
+
+    def test_promotion(self):
+        self.b.clear()
+        self.b.set("e1", King("e1", "w", "k"))
+        self.b.set("a8", King("a8", "b", "q"))
+        self.b.set("g7", Pawn("g7", "w", "k"))
+        self.play("g7g8")
+        self.assertEqual(self.b.g8.name, "Queen")
+        self.assertIn(self.b.g8, self.b.e1.team)
+        self.b.unmake_move()
+        self.assertEqual(self.b.g7.name, "Pawn")
+        self.assertEqual(self.b.e1.team, [self.b.e1, self.b.g7])
+
+    def test_king_safety_leaves_board_alone(self):
+        self.b.clear()
+        self.b.set("e1", King("e1", "w", "k"))
+        self.b.set("e2", Rook("e2", "w", "k"))
+        self.b.set("e8", Rook("e8", "b", "k"))
+        before = self.b.position.pack()
+        self.assertFalse(self.b.e2.check_king_safety("d2"))
+        self.assertTrue(self.b.e2.check_king_safety("e5"))
+        self.assertEqual(self.b.position.pack(), before)
+        self.assertEqual(self.b.e2.name, "Rook")
+
+
+class TestZobrist(TestCase):
+
+    def setUp(self):
+        self.b = Board()
+
+    def play(self, *moves):
+        for move in moves:
+            self.b.make_move(self.b.encode_move(move[:2], move[2:]))
+
+    def test_incremental_key(self):
+        self.play("e2e4", "d7d5", "e4d5", "d8d5", "e1e2")
+        self.assertEqual(self.b.key, self.b.position.compute_key())
+        for _ in xrange(5):
+            self.b.unmake_move()
+        self.assertEqual(self.b.key, Position.start().key)
+
+    def test_transposition(self):
+        self.play("g1f3", "g8f6", "b1c3")
+        other = Board()
+        for move in ("b1c3", "g8f6", "g1f3"):
+            other.make_move(other.encode_move(move[:2], move[2:]))
+        self.assertEqual(self.b.key, other.key)
+
+    def test_side_to_move_and_castling(self):
+        start = self.b.key
+        self.play("g1f3", "g8f6", "f3g1", "f6g8")
+        self.assertEqual(self.b.key, start)
+        self.play("g1f3")
+        self.assertNotEqual(self.b.key, start)
+        self.play("g8f6", "h1g1", "f6g8", "g1h1", "b8c6", "f3g1", "c6b8")
+        #~ Same placement and side to move, but white lost its king side castle
+        self.assertNotEqual(self.b.key, start)
+
+    def test_en_passant(self):
+        self.play("e2e4", "a7a6", "e4e5", "d7d5")
+        with_ep = self.b.key
+        self.b.position.set_state(ep=-1)
+        self.assertNotEqual(self.b.key, with_ep)
+        self.assertEqual(self.b.key, self.b.position.compute_key())
+
+
+class TestDraws(TestCase):
+
+    def setUp(self):
+        self.b = Board()
+
+    def play(self, *moves):
+        for move in moves:
+            self.b.make_move(self.b.encode_move(move[:2], move[2:]))
+
+    def test_repetition(self):
+        shuffle = ("g1f3", "g8f6", "f3g1", "f6g8")
+        self.play(*shuffle)
+        self.assertEqual(self.b.repetitions(), 1)
+        self.assertFalse(self.b.is_repetition())
+        self.play(*shuffle)
+        self.assertEqual(self.b.repetitions(), 2)
+        self.assertTrue(self.b.is_repetition())
+        #~ Back to the position after the third ply, seen once since
+        self.b.unmake_move()
+        self.assertEqual(self.b.repetitions(), 1)
+        self.assertEqual(len(self.b.position.keys), 7)
+
+    def test_board_from_position_keeps_history(self):
+        self.play("g1f3", "g8f6", "f3g1", "f6g8")
+        board = Board(self.b.position)
+        self.assertEqual((board.repetitions(), self.b.copy().repetitions()), (1, 1))
+        #~ The board plays on its own copy
+        board.make_move(board.encode_move("g1", "f3"))
+        self.assertEqual((len(board.position.keys), len(self.b.position.keys)), (5, 4))
+
+    def test_irreversible_move_is_a_boundary(self):
+        self.play("g1f3", "g8f6", "f3g1", "f6g8", "e2e4", "e7e5", "g1f3", "g8f6", "f3g1", "f6g8")
+        self.assertEqual(self.b.repetitions(), 1)
+        #~ Same placement as four plies back, but castling rights went
+        self.play("e1e2", "e8e7", "e2e1", "e7e8")
+        self.assertEqual(self.b.repetitions(), 0)
+        self.assertEqual(self.b.copy().position.keys, self.b.position.keys)
+
+    def test_fifty_moves(self):
+        board = Board.from_fen("4k3/8/8/8/8/8/8/R3K3 w - - 99 80")
+        self.assertFalse(board.is_fifty_moves())
+        board.make_move(board.encode_move("a1", "a2"))
+        self.assertTrue(board.is_fifty_moves())
+
+
+class TestFen(TestCase):
+
+    START = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+    def test_round_trip(self):
+        for fen in (self.START,
+                    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+                    "rnbqkbnr/ppp1pppp/8/3pP3/8/8/PPPP1PPP/RNBQKBNR w KQkq d6 0 3",
+                    "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 b - - 42 97"):
+            self.assertEqual(Position.from_fen(fen).to_fen(), fen)
+            self.assertEqual(Board.from_fen(fen).to_fen(), fen)
+
+    def test_start_position(self):
+        self.assertEqual(Board().to_fen(), self.START)
+        self.assertEqual(Position.from_fen(self.START), Position.start())
+        self.assertEqual(Position.from_fen(self.START).key, Position.start().key)
+
+    def test_bad_fen(self):
+        for fen in ("", "8/8/8 w - - 0 1", "rnbqkbnr/pppppppp/9/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+                    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNX w KQkq - 0 1",
+                    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR x KQkq - 0 1",
+                    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkx - 0 1",
+                    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq z9 0 1",
+                    "8p/8/8/8/8/8/8/K6k w - - 0 1", "8/8/8/8/8/8/8/K6kp w - - 0 1",
+                    "8/8/8/8/8/8/8/K6k w - - -1 1", "8/8/8/8/8/8/8/K6k w - - 0 65536",
+                    "8/8/8/8/8/8/8/K6k w - - 0 0", "8/8/8/8/8/8/8/K6k w - - x 1"):
+            self.assertRaises(ValueError, Position.from_fen, fen)
+            self.assertRaises(ValueError, Board.from_fen, fen)
+
+    def test_pieces_state(self):
+        board = Board.from_fen("r3k2r/8/8/3pP3/8/8/P7/R3K2R w Kq d6 0 20")
+        self.assertEqual(board.a2.move_count, 0)
+        self.assertEqual(board.e5.move_count, 1)
+        self.assertEqual((board.e1.move_count, board.h1.move_count, board.a1.move_count), (0, 0, 1))
+        self.assertEqual((board.e8.move_count, board.a8.move_count, board.h8.move_count), (0, 0, 1))
+        self.assertIs(board.last_moved, board.d5)
+        self.assertEqual(board.e5.move("d6")[:2], (True, "empassant"))
+        self.assertEqual(board.d5.name, "Empty")
+
+
+class TestFlyweights(TestCase):
+
+    def test_shared_pieces(self):
+        self.assertIs(Rook("a1", "w", "q"), Rook("h1", "w", "k"))
+        self.assertIsNot(Rook("a1", "w"), Rook("a8", "b"))
+        self.assertIs(Empty("e4"), PIECE_INSTANCES[EMPTY])
+        self.assertIs(PIECE_INSTANCES[QUEEN | BLACK], Queen(color="b"))
+        self.assertEqual(PIECE_INSTANCES[KNIGHT | BLACK].code, KNIGHT | BLACK)
+        self.assertRaises(AttributeError, setattr, Rook(color="w"), "color", "b")
+        self.assertFalse(hasattr(Rook(color="w"), "__dict__"))
+        self.assertIs(copy.deepcopy(Pawn(color="b")), Pawn(color="b"))
+
+    def test_board_keeps_squares(self):
+        board = Board()
+        e2, e4 = board.e2, board.e4
+        board.e2.move("e4")
+        self.assertIs(board.e2, e2)
+        self.assertIs(board.e4.piece, Pawn(color="w"))
+        self.assertEqual((e2.move_count, e4.move_count), (0, 1))
+        board.clear()
+        self.assertIs(board.e4, e4)
+        self.assertEqual(e4.name, "Empty")
+
+    def test_clear_forgets_moves(self):
+        board = Board()
+        board.e2.move("e4")
+        board.clear()
+        self.assertEqual((board.move_list, board.undo_stack), ([], []))
+
+
+class TestCopy(TestCase):
+
+    def setUp(self):
+        self.b = Board()
+        for move in ("e2e4", "d7d5", "e4e5", "f7f5"):
+            self.b.make_move(self.b.encode_move(move[:2], move[2:]))
+
+    def test_position_copy(self):
+        position = self.b.position.copy()
+        self.assertEqual(position, self.b.position)
+        self.assertEqual(position.key, self.b.key)
+        position.make_move(position.legal_moves()[0])
+        self.assertNotEqual(position, self.b.position)
+        #~ The copy keeps the history and its own attack maps
+        for _ in xrange(5):
+            position.unmake_move()
+        self.assertEqual(position, Position.start())
+        self.assertEqual(self.b.position.attacks.maps, self.b.position.track_attacks().maps)
+        self.assertIsNot(position.attacks, self.b.position.attacks)
+
+    def test_board_copy(self):
+        board = self.b.copy()
+        self.assertEqual(board.to_fen(), self.b.to_fen())
+        self.assertIs(board.last_moved, board.f5)
+        self.assertEqual(board.e5.move("f6")[:2], (True, "empassant"))
+        self.assertEqual(self.b.f5.name, "Pawn")
+        self.assertEqual(self.b.e5.move_count, 2)
+        self.assertIs(self.b.e5._N.board, self.b)
+        board.unmake_move()
+        board.unmake_move()
+        self.assertIs(board.last_moved, board.e5)
+        self.assertEqual((board.e5.move_count, board.f7.move_count, board.f7.name), (2, 0, "Pawn"))
+        self.assertIs(copy.deepcopy(self.b).__class__, Board)
+
+    def test_snapshot(self):
+        snapshot = self.b.snapshot()
+        self.assertEqual(snapshot, self.b.position)
+        self.assertIsNone(snapshot.attacks)
+        self.assertIsNotNone(self.b.position.attacks)
+        snapshot.make_move(snapshot.legal_moves()[0])
+        self.assertNotEqual(snapshot, self.b.position)
+
+
+class TestAttackMaps(TestCase):
+
+    def full_maps(self, position):
+        maps, occupied = [0, 0], position.occupied[0] | position.occupied[1]
+        for square, code in enumerate(position.mailbox):
+            if code:
+                maps[code >> 3] |= piece_attacks(code, square, occupied)
+        return maps
+
+    def test_incremental(self):
+        position = Position.from_fen("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1")
+        attacks = position.track_attacks()
+        for move in position.legal_moves():
+            position.make_move(move)
+            self.assertEqual(attacks.maps, self.full_maps(position), move_name(move))
+            for reply in position.legal_moves():
+                position.make_move(reply)
+                self.assertEqual(attacks.maps, self.full_maps(position), move_name(reply))
+                position.unmake_move()
+            position.unmake_move()
+        self.assertEqual(attacks.maps, self.full_maps(position))
+        position.put(SQUARES["e2"], EMPTY)
+        self.assertEqual(attacks.maps, self.full_maps(position))
+
+    def test_geometry(self):
+        board = Board.from_fen("4k3/8/8/8/3n4/8/3p4/4K3 w - - 0 1")
+        #~ Knights attack on their L, pawns only diagonally forward
+        self.assertTrue(board.attacked("e2", "b"))
+        self.assertTrue(board.attacked("f3", "b"))
+        self.assertFalse(board.attacked("d3", "b"))
+        self.assertTrue(board.attacked("c1", "b"))
+        self.assertFalse(board.attacked("d1", "b"))
+        self.assertTrue(board.position.in_check(0))
+
+    def test_castling_through_check(self):
+        board = Board.from_fen("r3k2r/8/8/8/8/8/4p3/R3K2R w KQkq - 0 1")
+        self.assertEqual(board.e1.move("g1")[:2], (False, "King passes through check"))
+        self.assertEqual(board.e1.move("c1")[:2], (False, "King passes through check"))
+        board = Board.from_fen("r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1")
+        self.assertEqual(board.e1.move("c1")[:2], (True, "queen_side_castle"))
+        self.assertEqual(board.to_fen(), "r3k2r/8/8/8/8/8/8/2KR3R b kq - 1 1")
+
+
+class TestSliderTables(TestCase):
+
+    def test_lookup_matches_walk(self):
+        from chess import _slide
+        generator = random.Random(7)
+        for _ in xrange(2000):
+            square = generator.randrange(64)
+            occupied = generator.getrandbits(64) & generator.getrandbits(64)
+            self.assertEqual(rook_attacks(square, occupied), _slide(square, occupied, ROOK_DIRECTIONS))
+            self.assertEqual(bishop_attacks(square, occupied), _slide(square, occupied, BISHOP_DIRECTIONS))
+
+    def test_disk_cache(self):
+        folder = tempfile.mkdtemp()
+        try:
+            path = os.path.join(folder, "sliders")
+            rooks, bishops = load_slider_tables(path)
+            self.assertTrue(os.path.exists(path))
+            self.assertEqual(load_slider_tables(path), (rooks, bishops))
+            self.assertEqual(rooks, ROOK_TABLES)
+            #~ A broken cache is rebuilt
+            with open(path, "wb") as cache:
+                cache.write("broken")
+            self.assertEqual(load_slider_tables(path)[1], BISHOP_TABLES)
+        finally:
+            shutil.rmtree(folder)
+
 
 main()
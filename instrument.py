@@ -0,0 +1,122 @@
+# encoding: utf-8
+"""Opt-in counters and timing histograms for the rules engine's hot paths.
+
+enable() swaps the methods in PROBES for wrappers that count the calls and
+time them, disable() puts the originals back, so nothing is paid when it is
+off.  Timings are inclusive, get_paths() inside move() counts for both:
+
+    instrument.enable()
+    board.e2.move("e4")
+    instrument.snapshot()["Square.get_paths"]["calls"]
+    instrument.to_json()
+    instrument.disable()
+
+Setting CHESS_INSTRUMENT in the environment enables it on import.  A
+regression like relinking the board on every move shows up as
+Board._link_squares being called more than once per board.
+"""
+
+import json
+import os
+from functools import wraps
+from timeit import default_timer
+
+from chess import PIECE_CLASSES, Board, Piece, Position, Square
+
+#~ (class, method name) of every probed method.  The server and the search go
+#~ through the Board and Position ones, not the Square API.
+PROBES = [(Square, "move"), (Square, "get_paths"), (Square, "_get_path"), (Square, "check_king_safety"),
+          (Board, "_link_squares"), (Board, "make_move"), (Position, "make_move"),
+          (Position, "legal_moves")] + \
+         [(cls, "move_valid_check") for cls in [Piece] + PIECE_CLASSES if "move_valid_check" in vars(cls)]
+
+#~ Histogram buckets are powers of two microseconds, the last one open ended
+BUCKETS = 24
+
+
+class Stats(object):
+    """Call count, total and longest time and a histogram of one method."""
+
+    __slots__ = ("calls", "seconds", "longest", "buckets")
+
+    def __init__(self):
+        self.calls   = 0
+        self.seconds = 0.0
+        self.longest = 0.0
+        #~ buckets[i] counts the calls under 2 ** i microseconds
+        self.buckets = [0] * BUCKETS
+
+    def record(self, seconds):
+        self.calls   += 1
+        self.seconds += seconds
+        if seconds > self.longest:
+            self.longest = seconds
+        self.buckets[min(int(seconds * 1e6).bit_length(), BUCKETS - 1)] += 1
+
+    def as_dict(self):
+        """The stats in microseconds, the histogram keyed by the bucket's
+        upper bound and without the empty buckets."""
+        return {"calls": self.calls, "total_us": self.seconds * 1e6, "max_us": self.longest * 1e6,
+                "mean_us": self.seconds * 1e6 / self.calls if self.calls else 0.0,
+                "histogram": dict((str(2 ** i), count) for i, count in enumerate(self.buckets) if count)}
+
+
+#~ Stats by probe name, kept across enable() and disable() until reset()
+stats = dict(("{}.{}".format(cls.__name__, name), Stats()) for cls, name in PROBES)
+#~ The original methods while enabled
+_originals = {}
+
+
+def _probe(function, record):
+    @wraps(function)
+    def probe(*args, **kwargs):
+        started = default_timer()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            record(default_timer() - started)
+    return probe
+
+
+def enabled():
+    return bool(_originals)
+
+
+def enable():
+    """Starts counting, a no-op when already enabled."""
+    if enabled():
+        return
+    for cls, name in PROBES:
+        original = vars(cls)[name]
+        _originals[cls, name] = original
+        #~ Set on the class itself, Piece instances refuse new attributes
+        type.__setattr__(cls, name, _probe(original, stats["{}.{}".format(cls.__name__, name)].record))
+
+
+def disable():
+    """Puts the original methods back, the stats are kept."""
+    for (cls, name), original in _originals.items():
+        type.__setattr__(cls, name, original)
+    _originals.clear()
+
+
+def reset():
+    for name in stats:
+        stats[name] = Stats()
+    if enabled():
+        #~ The wrappers hold the old Stats, wrap again
+        disable()
+        enable()
+
+
+def snapshot():
+    """{probe name: stats dict} of every probe."""
+    return dict((name, probe.as_dict()) for name, probe in stats.iteritems())
+
+
+def to_json(**kwargs):
+    return json.dumps(snapshot(), sort_keys=True, **kwargs)
+
+
+if os.environ.get("CHESS_INSTRUMENT"):
+    enable()
@@ -0,0 +1,66 @@
+import json
+from unittest import TestCase, main
+
+import instrument
+from chess import Board, Pawn, Square
+
+
+class TestInstrument(TestCase):
+
+    def setUp(self):
+        self.show_board = Board.SHOW_BOARD
+        Board.SHOW_BOARD = False
+        instrument.reset()
+
+    def tearDown(self):
+        instrument.disable()
+        Board.SHOW_BOARD = self.show_board
+
+    def test_counts_only_while_enabled(self):
+        board = Board()
+        board.e2.move("e4")
+        self.assertEqual(instrument.snapshot()["Square.move"]["calls"], 0)
+        instrument.enable()
+        self.assertTrue(instrument.enabled())
+        board.e7.move("e5")
+        board.g1.move("f3")
+        instrument.disable()
+        board.b8.move("c6")
+        snapshot = instrument.snapshot()
+        self.assertEqual(snapshot["Square.move"]["calls"], 2)
+        self.assertEqual(snapshot["Square.get_paths"]["calls"], 2)
+        self.assertEqual(snapshot["Square.check_king_safety"]["calls"], 2)
+        self.assertEqual(snapshot["Pawn.move_valid_check"]["calls"], 1)
+        self.assertEqual(snapshot["Knight.move_valid_check"]["calls"], 1)
+        self.assertEqual(snapshot["Board._link_squares"]["calls"], 0)
+        self.assertEqual(sum(snapshot["Square.move"]["histogram"].values()), 2)
+        self.assertTrue(snapshot["Square.move"]["max_us"] >= snapshot["Square.move"]["mean_us"] > 0)
+
+    def test_disable_restores_methods(self):
+        originals = vars(Square)["get_paths"], vars(Pawn)["move_valid_check"]
+        instrument.enable()
+        instrument.enable()
+        self.assertNotEqual(vars(Square)["get_paths"], originals[0])
+        instrument.disable()
+        self.assertEqual((vars(Square)["get_paths"], vars(Pawn)["move_valid_check"]), originals)
+
+    def test_links_once_per_board(self):
+        instrument.enable()
+        board = Board()
+        board.copy()
+        for location, to in (("e2", "e4"), ("e7", "e5"), ("g1", "f3")):
+            board.get(location).move(to)
+        self.assertEqual(instrument.snapshot()["Board._link_squares"]["calls"], 2)
+
+    def test_reset_and_json(self):
+        instrument.enable()
+        Board().e2.move("e4")
+        instrument.reset()
+        Board().d2.move("d4")
+        exported = json.loads(instrument.to_json())
+        self.assertEqual(exported["Square.move"]["calls"], 1)
+        self.assertEqual(set(exported), set(instrument.stats))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+# encoding: utf-8
+"""Move notation for the compact Position.
+
+parse_san() turns standard algebraic notation ("Nbd7", "exd6", "e8=Q+",
+"O-O") into the 16 bit move for the current position.  The candidate pieces
+come straight from the attack tables, so a move is found without generating
+every legal move.  parse_uci() does the same for coordinate notation
+("e2e4", "e7e8q") from the piece on the from square, and parse_move()
+takes either.
+
+san() goes the other way, with the file, rank or square added only when
+another piece of the kind can reach the same square, and the check and
+mate suffixes.  Both directions take microseconds, a make/unmake per
+candidate piece, which is what bulk PGN import and export is bound by.
+"""
+
+import re
+
+from chess import (InvalidMove, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, SQUARES, SQUARE_NAMES,
+                   KNIGHT_ATTACKS, KING_ATTACKS, MOVE_CASTLING, MOVE_ENPASSANT, MOVE_PROMOTION,
+                   bishop_attacks, encode_move, rook_attacks)
+
+SAN_PIECES = {"N": KNIGHT, "B": BISHOP, "R": ROOK, "Q": QUEEN, "K": KING}
+#~ SAN letter of each piece kind
+SAN_LETTERS = " PNBRQK"
+FILES, RANKS = "abcdefgh", "12345678"
+
+#~ from square, to square, promotion
+UCI = re.compile(r"[a-h][1-8][a-h][1-8][nbrq]?$")
+
+#~ piece, from letter, from number, capture, to square, promotion
+SAN = re.compile(r"([NBRQK])?([a-h])?([1-8])?(x)?([a-h][1-8])(?:=?([NBRQ]))?$")
+
+#~ Castling king destinations, indexed by color then king (0) or queen (1) side
+CASTLING_TARGETS = [[SQUARES["g1"], SQUARES["c1"]], [SQUARES["g8"], SQUARES["c8"]]]
+
+
+def _attackers(position, kind, to, side, occupied):
+    """Bitboard of the pieces of kind and side (0 or BLACK) that move to the
+    square to, pawns aside."""
+    bitboards = position.bitboards
+    if kind == KNIGHT:
+        return KNIGHT_ATTACKS[to] & bitboards[KNIGHT | side]
+    if kind == BISHOP:
+        return bishop_attacks(to, occupied) & bitboards[BISHOP | side]
+    if kind == ROOK:
+        return rook_attacks(to, occupied) & bitboards[ROOK | side]
+    if kind == QUEEN:
+        return (rook_attacks(to, occupied) | bishop_attacks(to, occupied)) & bitboards[QUEEN | side]
+    return KING_ATTACKS[to] & bitboards[KING | side]
+
+
+def _castling(position, target, text):
+    for move in position.legal_moves():
+        if move & 0xc000 == MOVE_CASTLING and move & 63 == target:
+            return move
+    raise InvalidMove("Illegal castling: {}".format(text))
+
+
+def _legal(position, move):
+    """Whether a pseudo legal move leaves the mover's king safe."""
+    color = position.turn
+    position.make_move(move)
+    legal = not position.in_check(color)
+    position.unmake_move()
+    return legal
+
+
+def parse_san(position, san):
+    """The 16 bit move san stands for in position, for the side to move.
+    Raises InvalidMove when san is malformed, illegal or ambiguous."""
+    text = san.rstrip("+#!?")
+    if text in ("O-O", "0-0", "O-O-O", "0-0-0"):
+        return _castling(position, CASTLING_TARGETS[position.turn][len(text) > 3], san)
+    match = SAN.match(text)
+    if match is None:
+        raise InvalidMove("Bad move: {}".format(san))
+    piece, from_letter, from_number, capture, to, promotion = match.groups()
+    #~ A pawn with its file given captures, "ed6" as well as "exd6"
+    return _resolve(position, SAN_PIECES[piece] if piece else PAWN, SQUARES[to], from_letter, from_number,
+                    capture or from_letter, promotion, san)
+
+
+def _resolve(position, kind, to, from_letter, from_number, capture, promotion, text):
+    """The one legal move of a piece of kind to the square to, from the file
+    and rank given, if given."""
+    color = position.turn
+    side = color << 3
+    occupied = position.occupied[0] | position.occupied[1]
+
+    flag = 0
+    if kind == PAWN:
+        forward = -8 if color else 8
+        if capture:
+            candidates = 0
+            for frm in (to - forward - 1, to - forward + 1):
+                if 0 <= frm < 64 and abs((frm & 7) - (to & 7)) == 1:
+                    candidates |= 1 << frm
+            if to == position.ep:
+                flag = MOVE_ENPASSANT
+            elif not (position.occupied[color ^ 1] >> to) & 1:
+                raise InvalidMove("Nothing to capture: {}".format(text))
+        elif (occupied >> to) & 1:
+            raise InvalidMove("Pawn blocked: {}".format(text))
+        elif not 0 <= to - forward < 64:
+            #~ Onto our own first rank
+            candidates = 0
+        else:
+            candidates = 1 << (to - forward)
+            #~ A double step from the first rank over an empty square
+            if not (occupied >> (to - forward)) & 1 and (to >> 3) == (4 if color else 3):
+                candidates = 1 << (to - 2 * forward)
+        candidates &= position.bitboards[PAWN | side]
+        if ((to >> 3) in (0, 7)) != bool(promotion):
+            raise InvalidMove("Bad promotion: {}".format(text))
+    elif promotion:
+        raise InvalidMove("Bad promotion: {}".format(text))
+    else:
+        candidates = _attackers(position, kind, to, side, occupied)
+    #~ Can't land on our own piece
+    if (position.occupied[color] >> to) & 1:
+        candidates = 0
+
+    found = None
+    while candidates:
+        low = candidates & -candidates
+        frm = low.bit_length() - 1
+        candidates ^= low
+        if from_letter and "abcdefgh"[frm & 7] != from_letter:
+            continue
+        if from_number and "12345678"[frm >> 3] != from_number:
+            continue
+        if promotion:
+            move = encode_move(frm, to, SAN_PIECES[promotion])
+        else:
+            move = encode_move(frm, to, flag=flag)
+        if not _legal(position, move):
+            continue
+        if found is not None:
+            raise InvalidMove("Ambiguous move: {}".format(text))
+        found = move
+    if found is None:
+        raise InvalidMove("Illegal move: {}".format(text))
+    return found
+
+
+def parse_uci(position, text):
+    """The 16 bit move for coordinate notation text in position, for the
+    side to move.  Raises InvalidMove when text is malformed or illegal."""
+    if not UCI.match(text):
+        raise InvalidMove("Bad move: {}".format(text))
+    frm, to = SQUARES[text[:2]], SQUARES[text[2:4]]
+    code = position.mailbox[frm]
+    if not code or code >> 3 != position.turn:
+        raise InvalidMove("Illegal move: {}".format(text))
+    kind = code & 7
+    if kind == KING and abs((to & 7) - (frm & 7)) == 2:
+        if to not in CASTLING_TARGETS[position.turn] or frm & 7 != 4 or len(text) > 4:
+            raise InvalidMove("Illegal move: {}".format(text))
+        return _castling(position, to, text)
+    #~ The from square picks the piece, so the move can't be ambiguous
+    return _resolve(position, kind, to, text[0], text[1], (frm & 7) != (to & 7),
+                    text[4:].upper() or None, text)
+
+
+def parse_move(position, text):
+    """The 16 bit move for text in SAN or coordinate notation."""
+    if UCI.match(text):
+        return parse_uci(position, text)
+    return parse_san(position, text)
+
+
+def san(position, move):
+    """Standard algebraic notation of a legal move in position, "Nbd7",
+    "exd6", "e8=Q+", "O-O#".  The file, the rank or both are added when
+    another piece of the kind can go to the same square, and "+" or "#"
+    when the move checks or mates."""
+    frm, to, flag = (move >> 6) & 63, move & 63, move & 0xc000
+    mailbox = position.mailbox
+    kind = mailbox[frm] & 7
+    if flag == MOVE_CASTLING:
+        text = "O-O" if to & 7 == 6 else "O-O-O"
+    elif kind == PAWN:
+        if frm & 7 != to & 7:
+            text = FILES[frm & 7] + "x" + SQUARE_NAMES[to]
+        else:
+            text = SQUARE_NAMES[to]
+        if flag == MOVE_PROMOTION:
+            text += "=" + "NBRQ"[(move >> 12) & 3]
+    else:
+        occupied = position.occupied[0] | position.occupied[1]
+        others = _attackers(position, kind, to, position.turn << 3, occupied) & ~(1 << frm)
+        same_file = same_rank = ambiguous = False
+        while others:
+            low = others & -others
+            other = low.bit_length() - 1
+            others ^= low
+            if not _legal(position, encode_move(other, to)):
+                continue
+            ambiguous = True
+            same_file |= other & 7 == frm & 7
+            same_rank |= other >> 3 == frm >> 3
+        text = SAN_LETTERS[kind]
+        if ambiguous:
+            if not same_file:
+                text += FILES[frm & 7]
+            elif not same_rank:
+                text += RANKS[frm >> 3]
+            else:
+                text += SQUARE_NAMES[frm]
+        if mailbox[to]:
+            text += "x"
+        text += SQUARE_NAMES[to]
+
+    position.make_move(move)
+    if position.in_check():
+        text += "+" if position.legal_moves() else "#"
+    position.unmake_move()
+    return text
+
+
+def san_line(position, moves):
+    """SAN of each move of a sequence played from position, which is left
+    as it was."""
+    names = []
+    for move in moves:
+        names.append(san(position, move))
+        position.make_move(move)
+    for _ in moves:
+        position.unmake_move()
+    return names
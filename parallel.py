@@ -0,0 +1,158 @@
+# encoding: utf-8
+"""Root splitting search over a pool of processes.
+
+Every depth of the iterative deepening searches the best move so far first,
+then hands the other root moves to the workers with its score as alpha.
+A worker searches the reply one ply shallower with its own Search and keeps
+a TranspositionTable between tasks.  Positions travel as the 37 byte
+Position.pack() string, never as pickled Board objects, with the keys of
+the positions since the last capture or pawn move for repetitions:
+
+    with ParallelSearch(workers=8) as searcher:
+        result = searcher.run(board.position, max_time=5.0)
+
+Run the module to report the speedup over a single process search:
+
+    python parallel.py --depth 5 --workers 1,2,4,8
+"""
+
+import argparse
+import multiprocessing
+import time
+
+from chess import Position
+from search import INFINITY, MATE, MAX_PLY, Search, SearchResult
+from transposition import TranspositionTable
+
+#~ The worker's table, built once per process by _init_worker()
+_table = None
+
+
+def _init_worker(megabytes):
+    global _table
+    _table = TranspositionTable(megabytes)
+
+
+def _search_move(task):
+    """Searches one root move in a worker.  Returns (move, score from the
+    root's point of view, nodes, principal variation, finished).  A score at
+    or below alpha is only an upper bound."""
+    packed, keys, move, depth, alpha, deadline = task
+    position = Position.unpack(packed)
+    #~ Older than any move on undo, never popped
+    position.keys = list(keys)
+    position.make_move(move)
+    #~ The single process Search scores a repetition one ply from the root
+    #~ as a draw, the worker's own root is that ply
+    if position.is_repetition(1):
+        return move, 0, 0, [move], True
+    max_time = None
+    if deadline:
+        max_time = deadline - time.time()
+        if max_time <= 0:
+            return move, 0, 0, [move], False
+    result = Search(position, max_time=max_time, max_depth=depth, table=_table, beta=-alpha).run()
+    score = -result.score
+    #~ The reply's mate distance is one ply short of the root's
+    if score >= MATE - MAX_PLY * 2:
+        score -= 1
+    elif score <= -MATE + MAX_PLY * 2:
+        score += 1
+    finished = result.move is None or result.depth == depth or abs(result.score) >= MATE - MAX_PLY
+    return move, score, result.nodes, [move] + result.pv, finished
+
+
+class ParallelSearch(object):
+    """Owns the process pool, close() it or use it in a with block."""
+
+    def __init__(self, workers=None, table_megabytes=16):
+        self.workers = workers or multiprocessing.cpu_count()
+        self.pool = multiprocessing.Pool(self.workers, _init_worker, (table_megabytes,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
+
+    def run(self, position, max_time=None, max_depth=MAX_PLY, on_iteration=None):
+        """Same as Search.run(), the position is left alone."""
+        started = time.time()
+        deadline = started + max_time if max_time else None
+        moves = position.legal_moves()
+        if not moves:
+            return SearchResult(None, -MATE if position.in_check() else 0, 0, 0, [], 0.0)
+        result = SearchResult(moves[0], 0, 0, 0, moves[:1], 0.0)
+        packed = position.pack()
+        keys = position.keys[len(position.keys) - position.halfmove:] if position.halfmove else []
+        nodes = 0
+
+        #~ Depth 1 leaves nothing to split, the replies start at depth 1
+        for depth in xrange(2, min(max_depth, MAX_PLY) + 1):
+            move, score, searched, pv, finished = self.pool.apply(
+                _search_move, ((packed, keys, moves[0], depth - 1, -INFINITY, deadline),))
+            nodes += searched
+            scores = {move: score}
+            best = (score, pv)
+            tasks = [(packed, keys, move, depth - 1, best[0], deadline) for move in moves[1:]]
+            for move, score, searched, pv, done in self.pool.imap_unordered(_search_move, tasks):
+                nodes += searched
+                finished = finished and done
+                scores[move] = score
+                if score > best[0]:
+                    best = (score, pv)
+            if not finished:
+                break
+            result = SearchResult(best[1][0], best[0], depth, nodes, best[1], time.time() - started)
+            if on_iteration:
+                on_iteration(result)
+            if abs(best[0]) >= MATE - MAX_PLY:
+                break
+            if deadline and time.time() + (time.time() - started) > deadline:
+                break
+            #~ Hand out the best moves first next time around
+            moves.sort(key=scores.__getitem__, reverse=True)
+        return result
+
+
+def benchmark(position, depth, worker_counts, out=None):
+    """Times a fixed depth search in one process and with each worker count.
+    Returns [(workers, seconds, nodes, speedup)], 0 workers is the single
+    process Search."""
+    started = time.time()
+    single = Search(position, max_depth=depth, table=TranspositionTable()).run()
+    baseline = time.time() - started
+    rows = [(0, baseline, single.nodes, 1.0)]
+    for workers in worker_counts:
+        with ParallelSearch(workers) as searcher:
+            started = time.time()
+            result = searcher.run(position, max_depth=depth)
+            seconds = time.time() - started
+        rows.append((workers, seconds, result.nodes, baseline / seconds))
+    if out is not None:
+        print >> out, "{:>8} {:>9} {:>12} {:>8}".format("workers", "seconds", "nodes", "speedup")
+        for workers, seconds, nodes, speedup in rows:
+            print >> out, "{:>8} {:>9.2f} {:>12} {:>7.2f}x".format(workers or "single", seconds, nodes, speedup)
+    return rows
+
+
+def main(argv=None):
+    import sys
+    parser = argparse.ArgumentParser(description="Parallel search speedup over a single process.")
+    parser.add_argument("-d", "--depth", type=int, default=4)
+    parser.add_argument("-w", "--workers", default="1,2,4",
+                        help="comma separated worker counts, default 1,2,4")
+    parser.add_argument("--fen", help="position to search, the start position by default")
+    args = parser.parse_args(argv)
+
+    position = Position.from_fen(args.fen) if args.fen else Position.start()
+    benchmark(position, args.depth, [int(count) for count in args.workers.split(",")], sys.stdout)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
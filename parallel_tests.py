@@ -0,0 +1,53 @@
+from unittest import TestCase, main
+
+from chess import Position, move_name
+from notation import parse_uci
+from parallel import ParallelSearch, benchmark
+from search import MATE, search
+
+
+class TestParallelSearch(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.searcher = ParallelSearch(workers=2, table_megabytes=1)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.searcher.close()
+
+    def test_mate_in_two(self):
+        position = Position.from_fen("r2qkb1r/pp2nppp/3p4/2pNN1B1/2BnP3/3P4/PPP2PPP/R2bK2R w KQkq - 1 1")
+        result = self.searcher.run(position, max_depth=4)
+        self.assertEqual(result.score, MATE - 3)
+        self.assertEqual(map(move_name, result.pv), ["d5f6", "g7f6", "c4f7"])
+
+    def test_position_left_alone(self):
+        position = Position.start()
+        result = self.searcher.run(position, max_depth=3)
+        self.assertEqual(result.depth, 3)
+        self.assertIn(result.move, position.legal_moves())
+        self.assertEqual(position, Position.start())
+
+    def test_repetition_is_a_draw(self):
+        #~ A queen down, black goes back to a position of the game
+        position = Position.from_fen("rnb1kbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1")
+        for name in ("g1f3", "g8f6", "f3g1"):
+            position.make_move(parse_uci(position, name))
+        result = self.searcher.run(position, max_depth=3)
+        single = search(position, max_depth=3)
+        self.assertEqual((move_name(result.move), result.score), ("f6g8", 0))
+        self.assertEqual((result.move, result.score), (single.move, single.score))
+
+    def test_no_moves(self):
+        mated = Position.from_fen("7k/6Q1/6K1/8/8/8/8/8 b - - 0 1")
+        self.assertEqual(self.searcher.run(mated).score, -MATE)
+
+    def test_benchmark(self):
+        rows = benchmark(Position.start(), 2, [1])
+        self.assertEqual([workers for workers, _, _, _ in rows], [0, 1])
+        self.assertEqual(rows[0][3], 1.0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# encoding: utf-8
+"""Perft: counts the leaf nodes of the legal move tree to a fixed depth and
+checks them against published values.  Run it from the command line to track
+move generation correctness and speed:
+
+    python perft.py --depth 4 kiwipete
+    python perft.py --divide --depth 3 --fen "8/8/8/8/8/8/8/K6k w - - 0 1"
+"""
+
+import argparse
+import sys
+import time
+
+from chess import Position, move_name
+
+#~ (name, FEN, node counts from depth 1), see chessprogramming.org/Perft_Results
+POSITIONS = [
+    ("start", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+     [20, 400, 8902, 197281, 4865609, 119060324]),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     [48, 2039, 97862, 4085603, 193690690]),
+    ("position3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     [14, 191, 2812, 43238, 674624, 11030083]),
+    ("position4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     [6, 264, 9467, 422333, 15833292]),
+    ("position5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+     [44, 1486, 62379, 2103487, 89941194]),
+    ("position6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     [46, 2079, 89890, 3894594, 164075551]),
+]
+
+
+def perft(position, depth):
+    """Number of leaf nodes depth plies below position."""
+    moves = position.legal_moves()
+    if depth <= 1:
+        #~ Bulk count the last ply instead of playing it
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for move in moves:
+        position.make_move(move)
+        nodes += perft(position, depth - 1)
+        position.unmake_move()
+    return nodes
+
+
+def divide(position, depth):
+    """List of (move name, leaf nodes) for every root move, sorted by name."""
+    counts = []
+    for move in position.legal_moves():
+        position.make_move(move)
+        counts.append((move_name(move), perft(position, depth - 1)))
+        position.unmake_move()
+    return sorted(counts)
+
+
+def run(positions, depth, show_divide=False, out=sys.stdout):
+    """Runs perft on the (name, FEN, expected counts) positions and prints a
+    line per position.  Returns True when every known count matched."""
+    passed = True
+    total_nodes, total_seconds = 0, 0.0
+    for name, fen, expected in positions:
+        position = Position.from_fen(fen)
+        start = time.time()
+        if show_divide:
+            counts = divide(position, depth)
+            nodes = sum(count for _, count in counts)
+        else:
+            nodes = perft(position, depth)
+        seconds = time.time() - start
+        total_nodes += nodes
+        total_seconds += seconds
+
+        if show_divide:
+            for move, count in counts:
+                print >> out, "  {} {}".format(move, count)
+        if depth <= len(expected):
+            status = "ok" if nodes == expected[depth - 1] else "FAIL expected {}".format(expected[depth - 1])
+        else:
+            status = "no reference"
+        passed = passed and not status.startswith("FAIL")
+        print >> out, "{:<10} depth {} {:>12} nodes {:>8.2f}s {:>10.0f} nps  {}".format(
+            name, depth, nodes, seconds, nodes / max(seconds, 1e-9), status)
+    print >> out, "{:<10} depth {} {:>12} nodes {:>8.2f}s {:>10.0f} nps".format(
+        "total", depth, total_nodes, total_seconds, total_nodes / max(total_seconds, 1e-9))
+    return passed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Count leaf nodes of the legal move tree.")
+    parser.add_argument("names", nargs="*", help="reference positions to run, all by default: " +
+                        ", ".join(name for name, _, _ in POSITIONS))
+    parser.add_argument("-d", "--depth", type=int, default=3)
+    parser.add_argument("--divide", action="store_true", help="print the node count of every root move")
+    parser.add_argument("--fen", help="run a FEN instead of the reference positions")
+    args = parser.parse_args(argv)
+
+    if args.fen:
+        positions = [("fen", args.fen, [])]
+    else:
+        known = dict((name, (name, fen, counts)) for name, fen, counts in POSITIONS)
+        unknown = [name for name in args.names if name not in known]
+        if unknown:
+            parser.error("unknown positions: " + ", ".join(unknown))
+        positions = [known[name] for name in args.names] or POSITIONS
+    return 0 if run(positions, args.depth, args.divide) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,30 @@
+from unittest import TestCase, main
+from StringIO import StringIO
+
+from chess import Position
+from perft import POSITIONS, divide, perft, run
+
+
+class TestPerft(TestCase):
+
+    def test_reference_positions(self):
+        for name, fen, counts in POSITIONS:
+            position = Position.from_fen(fen)
+            self.assertEqual(perft(position, 2), counts[1], name)
+            self.assertEqual(position, Position.from_fen(fen), name)
+
+    def test_divide(self):
+        counts = divide(Position.start(), 2)
+        self.assertEqual(len(counts), 20)
+        self.assertIn(("e2e4", 20), counts)
+        self.assertEqual(sum(count for _, count in counts), 400)
+
+    def test_run_reports_failures(self):
+        out = StringIO()
+        self.assertTrue(run(POSITIONS[:1], 2, out=out))
+        self.assertIn("ok", out.getvalue())
+        self.assertFalse(run([("wrong", POSITIONS[0][1], [20, 401])], 2, out=StringIO()))
+
+
+if __name__ == "__main__":
+    main()
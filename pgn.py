@@ -0,0 +1,167 @@
+# encoding: utf-8
+"""Streaming PGN reader and game replay.
+
+read_games() walks a PGN file line by line and yields one Game at a time, so
+memory stays flat however big the archive is.  replay() plays a game's SAN
+moves on a Position and yields a Record per ply, validate() only checks them:
+
+    for game in read_games(open("archive.pgn")):
+        for record in replay(game):
+            store(record.key, record.move)
+
+From the command line, every game is validated and the throughput printed:
+
+    python pgn.py archive.pgn.gz --records plies.txt
+"""
+
+import argparse
+import bz2
+import gzip
+import re
+import sys
+import time
+from collections import namedtuple
+
+from chess import InvalidMove, Position, move_name
+from notation import parse_san
+
+Game = namedtuple("Game", "tags moves result")
+#~ One ply of a replayed game: the position before the move, as its key and
+#~ 37 byte pack(), and the move played from it
+Record = namedtuple("Record", "ply key packed move san")
+
+RESULTS = set(("1-0", "0-1", "1/2-1/2", "*"))
+
+TAG = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+#~ Comments, escapes and NAGs dropped before the move text is split
+NOISE = re.compile(r"\{[^}]*\}|;[^\n]*|%[^\n]*|\$\d+")
+MOVE_NUMBER = re.compile(r"^\d+\.+")
+
+
+class PGNError(InvalidMove):
+    """A game whose moves can't be played."""
+
+
+def open_pgn(path):
+    """Opens a PGN file, gzip and bzip2 compressed ones included."""
+    if path == "-":
+        return sys.stdin
+    if path.endswith(".gz"):
+        return gzip.open(path)
+    if path.endswith(".bz2"):
+        return bz2.BZ2File(path)
+    return open(path)
+
+
+def read_games(lines):
+    """Yields a Game for every game in an iterable of PGN lines."""
+    tags, movetext = {}, []
+    in_comment = False
+    for line in lines:
+        stripped = line.strip()
+        if not in_comment and stripped.startswith("["):
+            if movetext:
+                yield _game(tags, movetext)
+                tags, movetext = {}, []
+            match = TAG.match(stripped)
+            if match:
+                tags[match.group(1)] = match.group(2).replace('\\"', '"').replace("\\\\", "\\")
+            continue
+        if stripped:
+            movetext.append(stripped)
+            #~ A "[" inside a comment spread over lines is not a tag
+            in_comment = (in_comment + stripped.count("{") - stripped.count("}")) > 0
+    if movetext or tags:
+        yield _game(tags, movetext)
+
+
+def _game(tags, movetext):
+    text = NOISE.sub(" ", "\n".join(movetext))
+    moves, result, depth = [], tags.get("Result", "*"), 0
+    for token in text.replace("(", " ( ").replace(")", " ) ").split():
+        #~ Variations are skipped, however deep they nest
+        if token == "(":
+            depth += 1
+        elif token == ")":
+            depth = max(depth - 1, 0)
+        elif depth:
+            continue
+        elif token in RESULTS:
+            result = token
+        else:
+            token = MOVE_NUMBER.sub("", token)
+            if token:
+                moves.append(token)
+    return Game(tags, moves, result)
+
+
+def start_position(game):
+    """The position a game starts from, its FEN tag if it has one.  Raises
+    PGNError when the tag is not a FEN."""
+    if "FEN" in game.tags:
+        try:
+            return Position.from_fen(game.tags["FEN"])
+        except ValueError as error:
+            raise PGNError(str(error))
+    return Position.start()
+
+
+def replay(game):
+    """Plays the game and yields a Record before every move.  Raises
+    PGNError on the first move that can't be played."""
+    position = start_position(game)
+    for ply, san in enumerate(game.moves):
+        move = _parse(position, san, ply)
+        yield Record(ply, position.key, position.pack(), move, san)
+        position.make_move(move)
+
+
+def validate(game):
+    """Plays the game through the rules and returns the final Position.
+    Raises PGNError on the first move that can't be played."""
+    position = start_position(game)
+    for ply, san in enumerate(game.moves):
+        position.make_move(_parse(position, san, ply))
+    return position
+
+
+def _parse(position, san, ply):
+    try:
+        return parse_san(position, san)
+    except InvalidMove as error:
+        raise PGNError("Ply {}: {}".format(ply + 1, error))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Validate the games of PGN files.")
+    parser.add_argument("paths", nargs="+", help="PGN files, .gz and .bz2 are read as they stream, - for stdin")
+    parser.add_argument("--records", help="write a 'game ply key move' line for every ply here")
+    args = parser.parse_args(argv)
+
+    out = open(args.records, "w") if args.records else None
+    games = plies = errors = 0
+    started = time.time()
+    for path in args.paths:
+        for game in read_games(open_pgn(path)):
+            games += 1
+            try:
+                if out is None:
+                    validate(game)
+                    plies += len(game.moves)
+                    continue
+                for record in replay(game):
+                    out.write("{} {} {:016x} {}\n".format(games, record.ply, record.key, move_name(record.move)))
+                    plies += 1
+            except PGNError as error:
+                errors += 1
+                print >> sys.stderr, "game {}: {}".format(games, error)
+    seconds = max(time.time() - started, 1e-9)
+    if out is not None:
+        out.close()
+    print "{} games, {} plies, {} errors in {:.2f}s, {:.0f} games/s, {:.0f} plies/s".format(
+        games, plies, errors, seconds, games / seconds, plies / seconds)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
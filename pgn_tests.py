@@ -0,0 +1,102 @@
+from unittest import TestCase, main
+from StringIO import StringIO
+
+from chess import InvalidMove, Position, move_name
+from notation import parse_san, parse_uci, san, san_line
+from pgn import PGNError, read_games, replay, validate
+
+GAMES = """[Event "Opera"]
+[White "Morphy"]
+[Result "1-0"]
+
+1. e4 e5 2. Nf3 d6 3. d4 Bg4 {a weak move; [not a tag]
+spread over lines} 4. dxe5 Bxf3 5. Qxf3 dxe5 6. Bc4 Nf6 7. Qb3 Qe7
+8. Nc3 (8. Qxb7 Qb4+ (8... Bc5)) 8... c6 9. Bg5 $4 b5 10. Nxb5 cxb5 11. Bxb5+ Nbd7
+12. O-O-O Rd8 13. Rxd7 Rxd7 14. Rd1 Qe6 15. Bxd7+ Nxd7 16. Qb8+ Nxb8 17. Rd8# 1-0
+
+[Event "Illegal"]
+[FEN "4k3/8/8/8/8/8/8/4K3 w - - 0 1"]
+
+1. Kd2 Ke7 2. Kd4 *
+"""
+
+
+class TestSan(TestCase):
+
+    def test_moves(self):
+        position = Position.from_fen("r3k2r/1P6/8/3pP3/8/2N3N1/8/R3K2R w KQkq d6 0 1")
+        for text, name in [("exd6", "e5d6"), ("Nce4", "c3e4"), ("Nge4", "g3e4"), ("bxa8=Q+", "b7a8q"),
+                           ("b8=N", "b7b8n"), ("O-O-O", "e1c1"), ("Rh2", "h1h2")]:
+            self.assertEqual(move_name(parse_san(position, text)), name, text)
+
+    def test_invalid(self):
+        position = Position.from_fen("r3k2r/1P6/8/3pP3/8/2N3N1/8/R3K2R w KQkq d6 0 1")
+        for text in ["Ne4", "b8", "exf6", "e6x", "Ke3", "Nd4", "Kf3"]:
+            self.assertRaises(InvalidMove, parse_san, position, text)
+
+    def test_san(self):
+        position = Position.from_fen("r3k2r/1P6/8/3pP3/8/2N3N1/8/R3K2R w KQkq d6 0 1")
+        for name, text in [("e5d6", "exd6"), ("c3e4", "Nce4"), ("b7a8q", "bxa8=Q+"), ("b7b8n", "b8=N"),
+                           ("e1c1", "O-O-O"), ("e1g1", "O-O"), ("h1h2", "Rh2"), ("c3d5", "Nxd5")]:
+            self.assertEqual(san(position, parse_uci(position, name)), text, name)
+        #~ Rank, file and square disambiguation, and a mate
+        position = Position.from_fen("8/8/7k/Q7/8/8/8/Q3Q2K w - - 0 1")
+        for name, text in [("a1c3", "Qa1c3"), ("a1a3", "Q1a3"), ("e1b1", "Qeb1"), ("e1e6", "Qe6+"),
+                           ("a5a8", "Qa8")]:
+            self.assertEqual(san(position, parse_uci(position, name)), text, name)
+        position = Position.from_fen("1Q6/8/8/8/Q3Q3/8/8/k3K3 w - - 0 1")
+        for name, text in [("e4e5", "Qee5#"), ("b8b2", "Qb2+")]:
+            self.assertEqual(san(position, parse_uci(position, name)), text, name)
+
+    def test_san_round_trip(self):
+        game = next(read_games(StringIO(GAMES)))
+        position = Position.start()
+        moves = [record.move for record in replay(game)]
+        self.assertEqual(san_line(position, moves), [text.rstrip("!?") for text in game.moves])
+        self.assertEqual(position, Position.start())
+
+    def test_uci(self):
+        position = Position.from_fen("r3k2r/1P6/8/3pP3/8/2N3N1/8/R3K2R w KQkq d6 0 1")
+        for name in ["e5d6", "b7a8q", "e1c1", "c3e4"]:
+            self.assertEqual(move_name(parse_uci(position, name)), name)
+        for name in ["e5e7", "b7a8", "e1c1q", "c3e5", "d5d4", "e2e4", "e1e9"]:
+            self.assertRaises(InvalidMove, parse_uci, position, name)
+
+
+class TestPgn(TestCase):
+
+    def test_read_games(self):
+        games = list(read_games(StringIO(GAMES)))
+        self.assertEqual(len(games), 2)
+        self.assertEqual(games[0].tags["White"], "Morphy")
+        self.assertEqual(games[0].result, "1-0")
+        self.assertEqual(len(games[0].moves), 33)
+        self.assertEqual(games[0].moves[14:16], ["Nc3", "c6"])
+        self.assertEqual(games[1].result, "*")
+
+    def test_replay(self):
+        game = next(read_games(StringIO(GAMES)))
+        records = list(replay(game))
+        self.assertEqual(len(records), 33)
+        self.assertEqual(records[0].packed, Position.start().pack())
+        self.assertEqual(move_name(records[-1].move), "d1d8")
+        final = validate(game)
+        self.assertTrue(final.in_check())
+        self.assertEqual(final.legal_moves(), [])
+
+    def test_invalid_game(self):
+        game = list(read_games(StringIO(GAMES)))[1]
+        self.assertRaises(PGNError, validate, game)
+        records = replay(game)
+        self.assertEqual(next(records).san, "Kd2")
+        next(records)
+        self.assertRaises(PGNError, next, records)
+
+    def test_bad_fen_tag(self):
+        game = next(read_games(StringIO('[FEN "8p/8/8/8/8/8/8/K6k w - - 0 1"]\n\n1. Kb1 *\n')))
+        self.assertRaises(PGNError, validate, game)
+        self.assertRaises(PGNError, list, replay(game))
+
+
+if __name__ == "__main__":
+    main()
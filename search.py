@@ -0,0 +1,366 @@
+# encoding: utf-8
+"""Negamax alpha-beta search over the compact Position.
+
+Iterative deepening runs depth 1, 2, ... until the time or node budget runs
+out, and the last finished depth gives the best move and principal variation:
+
+    result = Search(board.position, max_time=1.0).run()
+    print move_name(result.move), result.score, map(move_name, result.pv)
+"""
+
+import time
+from collections import namedtuple
+
+from chess import PAWN, KNIGHT, BLACK, MOVE_PROMOTION, MOVE_ENPASSANT, move_name
+from transposition import EXACT, LOWER, UPPER
+
+INFINITY = 100000
+#~ A mate found n plies from the root scores MATE - n
+MATE     = 50000
+MAX_PLY  = 64
+
+PIECE_VALUES = [0, 100, 320, 330, 500, 900, 0]
+
+
+def _table(rows):
+    """Piece square table written with rank 8 on top, returned a1 first."""
+    values = [int(value) for value in rows.split()]
+    return [value for rank in xrange(7, -1, -1) for value in values[rank * 8:rank * 8 + 8]]
+
+#~ Simplified evaluation function tables, from white's point of view
+PIECE_TABLES = [[0] * 64, _table("""
+      0   0   0   0   0   0   0   0
+     50  50  50  50  50  50  50  50
+     10  10  20  30  30  20  10  10
+      5   5  10  25  25  10   5   5
+      0   0   0  20  20   0   0   0
+      5  -5 -10   0   0 -10  -5   5
+      5  10  10 -20 -20  10  10   5
+      0   0   0   0   0   0   0   0"""), _table("""
+    -50 -40 -30 -30 -30 -30 -40 -50
+    -40 -20   0   0   0   0 -20 -40
+    -30   0  10  15  15  10   0 -30
+    -30   5  15  20  20  15   5 -30
+    -30   0  15  20  20  15   0 -30
+    -30   5  10  15  15  10   5 -30
+    -40 -20   0   5   5   0 -20 -40
+    -50 -40 -30 -30 -30 -30 -40 -50"""), _table("""
+    -20 -10 -10 -10 -10 -10 -10 -20
+    -10   0   0   0   0   0   0 -10
+    -10   0   5  10  10   5   0 -10
+    -10   5   5  10  10   5   5 -10
+    -10   0  10  10  10  10   0 -10
+    -10  10  10  10  10  10  10 -10
+    -10   5   0   0   0   0   5 -10
+    -20 -10 -10 -10 -10 -10 -10 -20"""), _table("""
+      0   0   0   0   0   0   0   0
+      5  10  10  10  10  10  10   5
+     -5   0   0   0   0   0   0  -5
+     -5   0   0   0   0   0   0  -5
+     -5   0   0   0   0   0   0  -5
+     -5   0   0   0   0   0   0  -5
+     -5   0   0   0   0   0   0  -5
+      0   0   0   5   5   0   0   0"""), _table("""
+    -20 -10 -10  -5  -5 -10 -10 -20
+    -10   0   0   0   0   0   0 -10
+    -10   0   5   5   5   5   0 -10
+     -5   0   5   5   5   5   0  -5
+      0   0   5   5   5   5   0  -5
+    -10   5   5   5   5   5   0 -10
+    -10   0   5   0   0   0   0 -10
+    -20 -10 -10  -5  -5 -10 -10 -20"""), _table("""
+    -30 -40 -40 -50 -50 -40 -40 -30
+    -30 -40 -40 -50 -50 -40 -40 -30
+    -30 -40 -40 -50 -50 -40 -40 -30
+    -30 -40 -40 -50 -50 -40 -40 -30
+    -20 -30 -30 -40 -40 -30 -30 -20
+    -10 -20 -20 -20 -20 -20 -20 -10
+     20  20   0   0   0   0  20  20
+     20  30  10   0   0  10  30  20""")]
+
+#~ Value plus table bonus for every piece code and square, black mirrored
+SQUARE_VALUES = [[0] * 64 for _ in xrange(16)]
+for _kind in xrange(1, 7):
+    for _square in xrange(64):
+        SQUARE_VALUES[_kind][_square] = PIECE_VALUES[_kind] + PIECE_TABLES[_kind][_square]
+        SQUARE_VALUES[_kind | BLACK][_square] = -(PIECE_VALUES[_kind] + PIECE_TABLES[_kind][_square ^ 56])
+
+
+def evaluate(position):
+    """Material and piece square score in centipawns for the side to move."""
+    score = 0
+    mailbox = position.mailbox
+    occupied = position.occupied[0] | position.occupied[1]
+    while occupied:
+        low = occupied & -occupied
+        square = low.bit_length() - 1
+        occupied ^= low
+        score += SQUARE_VALUES[mailbox[square]][square]
+    return -score if position.turn else score
+
+
+SearchResult = namedtuple("SearchResult", "move score depth nodes pv seconds")
+
+
+class SearchAborted(Exception):
+    """Raised inside the search when the budget runs out."""
+
+
+class Search(object):
+    """Negamax alpha-beta with iterative deepening, quiescence on captures and
+    move ordering by principal variation, captures (most valuable victim,
+    least valuable attacker), killer moves and the history heuristic.
+
+    The position is searched in place with make/unmake and is left as it
+    was found, even when the budget runs out half way through a depth."""
+
+    #~ How many nodes to search between looks at the clock
+    CHECK_EVERY = 1024
+
+    def __init__(self, position, max_time=None, max_nodes=None, max_depth=MAX_PLY, on_iteration=None,
+                 table=None, alpha=-INFINITY, beta=INFINITY, on_progress=None):
+        self.position  = position
+        #~ Root window, a score outside it is only a bound
+        self.alpha     = alpha
+        self.beta      = beta
+        #~ Optional TranspositionTable, it can be shared between searches
+        self.table     = table
+        self.max_time  = max_time
+        self.max_nodes = max_nodes
+        self.max_depth = min(max_depth, MAX_PLY)
+        #~ Called with the SearchResult of every finished depth
+        self.on_iteration = on_iteration
+        #~ Called with the Search every CHECK_EVERY nodes, from inside it
+        self.on_progress  = on_progress
+        #~ Set from another thread to stop the search early, at once or at a
+        #~ time.time(), see stop_at()
+        self.stopped   = False
+        self.stop_time = None
+        self.nodes     = 0
+        self.killers   = [[0, 0] for _ in xrange(MAX_PLY + 1)]
+        #~ Indexed by the from and to squares of a quiet move
+        self.history   = [0] * 4096
+        self.pv        = [[] for _ in xrange(MAX_PLY + 2)]
+        #~ Principal variation of the last finished depth, tried first
+        self.last_pv   = []
+
+    def run(self):
+        """Searches until a budget runs out and returns the SearchResult of
+        the deepest finished depth.  Without legal moves the move is None
+        and the score says whether we are mated."""
+        self.started   = time.time()
+        self.deadline  = self.started + self.max_time if self.max_time else None
+        self.stopped   = False
+        self.nodes     = 0
+        self._next_check = self.CHECK_EVERY
+        if self.table is not None:
+            self.table.new_search()
+        moves = self.position.legal_moves()
+        if not moves:
+            score = -MATE if self.position.in_check() else 0
+            return SearchResult(None, score, 0, 0, [], 0.0)
+        result = SearchResult(moves[0], 0, 0, 0, moves[:1], 0.0)
+
+        undo_depth = len(self.position.undo)
+        for depth in xrange(1, self.max_depth + 1):
+            try:
+                score = self._search(depth, self.alpha, self.beta, 0)
+            except SearchAborted:
+                while len(self.position.undo) > undo_depth:
+                    self.position.unmake_move()
+                break
+            #~ Failing low on a narrowed window leaves no variation behind
+            pv = self.last_pv = list(self.pv[0]) or result.pv
+            result = SearchResult(pv[0], score, depth, self.nodes, pv, time.time() - self.started)
+            if self.on_iteration:
+                self.on_iteration(result)
+            if abs(score) >= MATE - MAX_PLY:
+                break
+            #~ The next depth costs more than all the ones before it together
+            if self.deadline and time.time() + (time.time() - self.started) > self.deadline:
+                break
+        return result
+
+    def stop_at(self, seconds):
+        """Gives the search seconds more from now, safe to call from another
+        thread before or while it runs."""
+        self.stop_time = time.time() + seconds
+
+    #~ Internal APIs -----------------------------------------------------------
+    def _count(self):
+        self.nodes += 1
+        if self.nodes >= self._next_check:
+            self._next_check += self.CHECK_EVERY
+            if self.on_progress:
+                self.on_progress(self)
+            if self.stopped or (self.max_nodes and self.nodes >= self.max_nodes) or \
+               (self.deadline and time.time() >= self.deadline) or \
+               (self.stop_time and time.time() >= self.stop_time):
+                raise SearchAborted()
+
+    def _search(self, depth, alpha, beta, ply):
+        self._count()
+        position = self.position
+        self.pv[ply] = []
+        #~ A position met before, in the game or on the way here, is a draw
+        #~ the side that repeated it can force again
+        if ply and position.is_repetition(1):
+            return 0
+        in_check = position.in_check()
+        if in_check:
+            depth += 1
+        if depth <= 0 or ply >= MAX_PLY:
+            return self._quiesce(alpha, beta, ply)
+
+        table = self.table
+        table_move = None
+        if table is not None:
+            entry = table.probe(position.key)
+            if entry:
+                table_move, score, entry_depth, bound = entry
+                score = _from_table(score, ply)
+                #~ Never cut at the root, it has to hand back a move
+                if ply and entry_depth >= depth and (bound == EXACT or
+                   (bound == LOWER and score >= beta) or (bound == UPPER and score <= alpha)):
+                    return score
+
+        moves = position.legal_moves()
+        if not moves:
+            return -MATE + ply if in_check else 0
+        if position.is_fifty_moves():
+            return 0
+
+        original_alpha = alpha
+        best, best_move = -INFINITY, 0
+        for move in self._order(moves, ply, table_move):
+            position.make_move(move)
+            score = -self._search(depth - 1, -beta, -alpha, ply + 1)
+            position.unmake_move()
+            if score > best:
+                best, best_move = score, move
+                if score > alpha:
+                    alpha = score
+                    self.pv[ply] = [move] + self.pv[ply + 1]
+                    if alpha >= beta:
+                        self._cutoff(move, depth, ply)
+                        break
+
+        if table is not None:
+            if best >= beta:
+                bound = LOWER
+            elif best <= original_alpha:
+                bound = UPPER
+            else:
+                bound = EXACT
+            table.store(position.key, best_move, _to_table(best, ply), depth, bound)
+        return best
+
+    def _quiesce(self, alpha, beta, ply):
+        self._count()
+        position = self.position
+        self.pv[ply] = []
+        stand_pat = evaluate(position)
+        if stand_pat >= beta or ply >= MAX_PLY:
+            return stand_pat
+        alpha = max(alpha, stand_pat)
+
+        mailbox = position.mailbox
+        captures = [move for move in position.legal_moves()
+                    if mailbox[move & 63] or move & 0xc000 in (MOVE_PROMOTION, MOVE_ENPASSANT)]
+        for move in sorted(captures, key=self._capture_score, reverse=True):
+            position.make_move(move)
+            score = -self._quiesce(-beta, -alpha, ply + 1)
+            position.unmake_move()
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+                self.pv[ply] = [move] + self.pv[ply + 1]
+        return alpha
+
+    def _capture_score(self, move):
+        mailbox = self.position.mailbox
+        victim = mailbox[move & 63] & 7 or PAWN
+        score = PIECE_VALUES[victim] * 10 - PIECE_VALUES[mailbox[(move >> 6) & 63] & 7]
+        if move & 0xc000 == MOVE_PROMOTION:
+            score += PIECE_VALUES[((move >> 12) & 3) + KNIGHT] * 10
+        return score
+
+    def _order(self, moves, ply, table_move=None):
+        """Moves sorted best first for the node ply plies from the root."""
+        mailbox = self.position.mailbox
+        pv_move = self.last_pv[ply] if ply < len(self.last_pv) else None
+        killers = self.killers[ply]
+        history = self.history
+        scores = {}
+        for move in moves:
+            if move == table_move:
+                score = 1 << 31
+            elif move == pv_move:
+                score = 1 << 30
+            elif mailbox[move & 63] or move & 0xc000 in (MOVE_PROMOTION, MOVE_ENPASSANT):
+                score = (1 << 24) + self._capture_score(move)
+            elif move == killers[0]:
+                score = 1 << 23
+            elif move == killers[1]:
+                score = (1 << 23) - 1
+            else:
+                score = history[move & 4095]
+            scores[move] = score
+        return sorted(moves, key=scores.__getitem__, reverse=True)
+
+    def _cutoff(self, move, depth, ply):
+        """Remembers a quiet move that failed high as a killer and in the
+        history table."""
+        if self.position.mailbox[move & 63] or move & 0xc000:
+            return
+        killers = self.killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+        self.history[move & 4095] += depth * depth
+
+
+def _to_table(score, ply):
+    """Mate scores are stored as distance from the node, not the root."""
+    if score >= MATE - MAX_PLY * 2:
+        return score + ply
+    if score <= -MATE + MAX_PLY * 2:
+        return score - ply
+    return score
+
+def _from_table(score, ply):
+    if score >= MATE - MAX_PLY * 2:
+        return score - ply
+    if score <= -MATE + MAX_PLY * 2:
+        return score + ply
+    return score
+
+
+def search(position, max_time=None, max_nodes=None, max_depth=MAX_PLY, table=None, book=None,
+           tablebases=None):
+    """Best move for the side to move, see Search.  With an opening Book or
+    endgame Tablebases a position found in them is answered at once, with a
+    result of depth 0."""
+    if tablebases is not None:
+        move = tablebases.best_move(position)
+        if move is not None:
+            outcome, plies = tablebases.probe(position)
+            return SearchResult(move, outcome * (MATE - plies), 0, 0, [move], 0.0)
+    if book is not None:
+        move = book.best(position)
+        #~ Keys can collide, a book move is only played when it is legal
+        if move is not None and move in position.legal_moves():
+            return SearchResult(move, 0, 0, 0, [move], 0.0)
+    return Search(position, max_time, max_nodes, max_depth, table=table).run()
+
+
+if __name__ == "__main__":
+    import sys
+    from chess import Position
+
+    position = Position.from_fen(sys.argv[1]) if len(sys.argv) > 1 else Position.start()
+    result = Search(position, max_time=5.0, on_iteration=lambda result: sys.stdout.write(
+        "depth {} score {} nodes {} time {:.2f} pv {}\n".format(
+            result.depth, result.score, result.nodes, result.seconds, " ".join(map(move_name, result.pv))))).run()
+    print "bestmove", move_name(result.move)
@@ -0,0 +1,64 @@
+import time
+from unittest import TestCase, main
+
+from chess import Position, move_name
+from notation import parse_uci
+from search import MATE, Search, evaluate, search
+
+
+class TestSearch(TestCase):
+
+    def test_mate_in_one(self):
+        position = Position.from_fen("6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - 0 1")
+        result = search(position, max_depth=3)
+        self.assertEqual(move_name(result.move), "a1a8")
+        self.assertEqual(result.score, MATE - 1)
+
+    def test_mate_in_two(self):
+        position = Position.from_fen("r2qkb1r/pp2nppp/3p4/2pNN1B1/2BnP3/3P4/PPP2PPP/R2bK2R w KQkq - 1 1")
+        result = search(position, max_depth=4)
+        self.assertEqual(result.score, MATE - 3)
+        self.assertEqual(map(move_name, result.pv), ["d5f6", "g7f6", "c4f7"])
+
+    def test_wins_material(self):
+        position = Position.from_fen("4k3/8/8/3q4/8/8/3R4/3K4 w - - 0 1")
+        self.assertEqual(move_name(search(position, max_depth=2).move), "d2d5")
+
+    def test_node_budget_leaves_position_alone(self):
+        position = Position.start()
+        before = position.pack()
+        result = search(position, max_nodes=3000)
+        self.assertLess(result.nodes, 3000)
+        self.assertGreater(result.depth, 0)
+        self.assertEqual(position.pack(), before)
+        self.assertEqual(position.undo, [])
+
+    def test_iterations_reported(self):
+        depths = []
+        Search(Position.start(), max_depth=3, on_iteration=lambda result: depths.append(result.depth)).run()
+        self.assertEqual(depths, [1, 2, 3])
+
+    def test_stop_at_before_run(self):
+        search = Search(Position.start())
+        search.stop_at(0.2)
+        started = time.time()
+        result = search.run()
+        self.assertLess(time.time() - started, 1.0)
+        self.assertGreater(result.depth, 0)
+
+    def test_repetition_is_a_draw(self):
+        #~ A queen down, black goes back to a position of the game
+        position = Position.from_fen("rnb1kbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1")
+        for name in ("g1f3", "g8f6", "f3g1"):
+            position.make_move(parse_uci(position, name))
+        result = search(position, max_depth=3)
+        self.assertEqual((move_name(result.move), result.score), ("f6g8", 0))
+
+    def test_evaluate_is_symmetric(self):
+        self.assertEqual(evaluate(Position.start()), 0)
+        position = Position.from_fen("4k3/8/8/8/8/8/8/3QK3 b - - 0 1")
+        self.assertLess(evaluate(position), -800)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,394 @@
+# encoding: utf-8
+"""Twisted game server, many games over one reactor.
+
+Clients talk newline delimited JSON, one object per line with an "op":
+
+    {"op": "seek"}                              pair with the next seeker
+    {"op": "new"}                               open a game, you play white
+    {"op": "join", "game": 7}                   take the free side of game 7
+    {"op": "watch", "game": 7}                  follow game 7
+    {"op": "move", "game": 7, "move": "e2e4"}   coordinate notation
+    {"op": "resign", "game": 7}
+    {"op": "stats"}                             the server's counters
+
+and receive "created", "start", "state", "moved", "over", "stats" and
+"error" objects back.  Every game is a Board checked by the rules engine: a move is a
+legal move lookup and a make_move() on the compact position, microseconds
+of work, so it runs on the reactor thread and "moved" goes out to both
+players and every spectator before the next line is read.
+
+    python server.py serve --port 8007 [--instrument]
+    python server.py bench --port 8007 --games 500 --plies 40
+    python server.py bench --local --games 200
+
+bench is a load generator: it plays that many games at once over real
+sockets, each player a random mover, and reports the move round trip
+latency.  --local runs the server in the same process.  --instrument
+turns on the rules engine's timing histograms, see instrument.py, which
+"stats" returns along with the server's counts.
+"""
+
+import argparse
+import itertools
+import json
+import random
+import sys
+import time
+
+from twisted.internet import reactor
+from twisted.internet.protocol import ClientFactory, Factory
+from twisted.protocols.basic import LineReceiver
+
+import instrument
+from chess import COLORS, Board, InvalidMove, Position, move_name
+from notation import parse_uci
+
+#~ Game statuses sent with every "moved"
+ONGOING, CHECKMATE, STALEMATE, FIFTY_MOVES, REPETITION = \
+    "ongoing", "checkmate", "stalemate", "fifty moves", "threefold repetition"
+
+
+class GameBoard(Board):
+    """A Board that never draws itself, the server has no terminal."""
+    SHOW_BOARD = False
+
+
+class Game(object):
+    """One hosted game: its board, the two players and the spectators."""
+
+    def __init__(self, ident):
+        self.ident      = ident
+        self.board      = GameBoard()
+        #~ Protocols indexed by color, None until the side is taken
+        self.players    = [None, None]
+        self.spectators = set()
+        self.moves      = []
+        self.result     = None
+        #~ The legal moves of the side to move by name.  Worked out once per
+        #~ move, to see if the game is over, and reused to check the next one.
+        self.legal      = self._legal_moves()
+
+    @property
+    def started(self):
+        return None not in self.players
+
+    def state(self):
+        return {"op": "state", "game": self.ident, "fen": self.board.to_fen(), "moves": self.moves,
+                "result": self.result}
+
+    def play(self, player, text):
+        """Plays text for player and returns the game status.  Raises
+        InvalidMove for anything the rules or the turn don't allow."""
+        if self.result is not None:
+            raise InvalidMove("Game {} is over".format(self.ident))
+        if not self.started:
+            raise InvalidMove("Game {} has not started".format(self.ident))
+        position = self.board.position
+        if self.players[position.turn] is not player:
+            raise InvalidMove("Not your turn")
+        move = self.legal.get(text)
+        if move is None:
+            #~ Tells a malformed move from an illegal one
+            parse_uci(position, text)
+        self.board.make_move(move)
+        self.moves.append(text)
+
+        self.legal = self._legal_moves()
+        if not self.legal:
+            if position.in_check():
+                self.result = "0-1" if position.turn == 0 else "1-0"
+                return CHECKMATE
+            self.result = "1/2-1/2"
+            return STALEMATE
+        if position.is_fifty_moves():
+            self.result = "1/2-1/2"
+            return FIFTY_MOVES
+        #~ Drawn at once, nobody has to claim it
+        if position.is_repetition():
+            self.result = "1/2-1/2"
+            return REPETITION
+        return ONGOING
+
+    def _legal_moves(self):
+        return dict((move_name(move), move) for move in self.board.position.legal_moves())
+
+    def broadcast(self, message):
+        """Sends message to both players and every spectator, encoded once."""
+        line = json.dumps(message)
+        for protocol in self.players:
+            if protocol is not None:
+                protocol.sendLine(line)
+        for protocol in self.spectators:
+            protocol.sendLine(line)
+
+
+class GameProtocol(LineReceiver):
+    """One client connection, playing or watching any number of games."""
+
+    delimiter  = "\n"
+    MAX_LENGTH = 4096
+
+    def connectionMade(self):
+        self.games = set()
+
+    def connectionLost(self, reason):
+        self.factory.drop(self)
+
+    def lineReceived(self, line):
+        try:
+            message = json.loads(line)
+            handler = getattr(self, "do_" + str(message.get("op")), None)
+            if handler is None:
+                raise InvalidMove("Unknown op: {}".format(message.get("op")))
+            handler(message)
+        except (ValueError, AttributeError, TypeError):
+            self.send(op="error", message="Bad request: {}".format(line[:80]))
+        except InvalidMove as error:
+            self.send(op="error", message=str(error), game=message.get("game"))
+
+    def send(self, **message):
+        self.sendLine(json.dumps(message))
+
+    def do_seek(self, message):
+        self.factory.seek(self)
+
+    def do_new(self, message):
+        game = self.factory.create()
+        self.factory.seat(game, self, 0)
+
+    def do_join(self, message):
+        game = self.factory.find(message)
+        if game.started:
+            raise InvalidMove("Game {} is full".format(game.ident))
+        self.factory.seat(game, self, game.players.index(None))
+
+    def do_watch(self, message):
+        game = self.factory.find(message)
+        game.spectators.add(self)
+        self.games.add(game)
+        self.sendLine(json.dumps(game.state()))
+
+    def do_move(self, message):
+        game = self.factory.find(message)
+        status = game.play(self, str(message.get("move")))
+        self.factory.moves += 1
+        game.broadcast({"op": "moved", "game": game.ident, "move": game.moves[-1],
+                        "fen": game.board.to_fen(), "status": status})
+        if game.result is not None:
+            self.factory.finish(game, status)
+
+    def do_resign(self, message):
+        game = self.factory.find(message)
+        if self not in game.players:
+            raise InvalidMove("You don't play game {}".format(game.ident))
+        game.result = "0-1" if game.players.index(self) == 0 else "1-0"
+        self.factory.finish(game, "resignation")
+
+    def do_stats(self, message):
+        self.send(op="stats", games=len(self.factory.games), moves=self.factory.moves,
+                  played=self.factory.played, instrumented=instrument.enabled(),
+                  probes=instrument.snapshot() if instrument.enabled() else {})
+
+
+class GameServer(Factory):
+    """Hosts the games, hands out game ids and pairs seekers."""
+
+    protocol = GameProtocol
+
+    def __init__(self):
+        self.games   = {}
+        self.idents  = itertools.count(1)
+        #~ The seeker waiting for an opponent, if any
+        self.waiting = None
+        self.moves   = 0
+        self.played  = 0
+
+    def create(self):
+        game = Game(next(self.idents))
+        self.games[game.ident] = game
+        return game
+
+    def find(self, message):
+        try:
+            return self.games[message["game"]]
+        except (KeyError, TypeError):
+            raise InvalidMove("No such game: {}".format(message.get("game")))
+
+    def seat(self, game, protocol, color):
+        game.players[color] = protocol
+        protocol.games.add(game)
+        if not game.started:
+            protocol.send(op="created", game=game.ident, color=COLORS[color])
+            return
+        fen = game.board.to_fen()
+        for color, player in enumerate(game.players):
+            player.send(op="start", game=game.ident, color=COLORS[color], fen=fen)
+
+    def seek(self, protocol):
+        waiting, self.waiting = self.waiting, None
+        if waiting is None or waiting is protocol:
+            self.waiting = protocol
+            return
+        game = self.create()
+        game.players[0] = waiting
+        waiting.games.add(game)
+        self.seat(game, protocol, 1)
+
+    def finish(self, game, reason):
+        game.broadcast({"op": "over", "game": game.ident, "result": game.result, "reason": reason})
+        for protocol in game.players + list(game.spectators):
+            if protocol is not None:
+                protocol.games.discard(game)
+        self.games.pop(game.ident, None)
+        self.played += 1
+
+    def drop(self, protocol):
+        """Forgets a closed connection, its games are lost by abandonment."""
+        if self.waiting is protocol:
+            self.waiting = None
+        for game in list(protocol.games):
+            game.spectators.discard(protocol)
+            if protocol in game.players:
+                color = game.players.index(protocol)
+                game.players[color] = None
+                game.result = "0-1" if color == 0 else "1-0"
+                self.finish(game, "abandoned")
+
+
+#~ Load generator ---------------------------------------------------------------
+class BenchPlayer(LineReceiver):
+    """Seeks a game and plays random legal moves until the ply limit, timing
+    every move from sending it to its "moved" coming back."""
+
+    delimiter = "\n"
+
+    def connectionMade(self):
+        self.game     = None
+        self.color    = None
+        self.position = None
+        self.sent     = None
+        self.sendLine(json.dumps({"op": "seek"}))
+
+    def connectionLost(self, reason):
+        self.factory.player_done(self)
+
+    def lineReceived(self, line):
+        message = json.loads(line)
+        op = message["op"]
+        if op == "start":
+            self.game     = message["game"]
+            self.color    = COLORS.index(message["color"])
+            self.position = Position.from_fen(message["fen"])
+            self.play()
+        elif op == "moved":
+            if self.sent is not None:
+                self.factory.latencies.append(time.time() - self.sent)
+                self.sent = None
+            self.position = Position.from_fen(message["fen"])
+            if message["status"] == ONGOING:
+                self.play()
+        elif op == "over":
+            self.factory.results[message["reason"]] = self.factory.results.get(message["reason"], 0) + 1
+            self.transport.loseConnection()
+        elif op == "error":
+            self.factory.errors += 1
+
+    def play(self):
+        position = self.position
+        if position.turn != self.color:
+            return
+        #~ Both players count the plies, the one to move ends the game
+        if (position.fullmove - 1) * 2 + position.turn >= self.factory.plies:
+            self.sendLine(json.dumps({"op": "resign", "game": self.game}))
+            return
+        move = self.factory.random.choice(position.legal_moves())
+        self.sent = time.time()
+        self.sendLine(json.dumps({"op": "move", "game": self.game, "move": move_name(move)}))
+
+
+class BenchClient(ClientFactory):
+
+    protocol = BenchPlayer
+
+    def __init__(self, players, plies, seed=None, on_done=None):
+        self.players   = players
+        self.plies     = plies
+        self.random    = random.Random(seed)
+        self.on_done   = on_done
+        self.latencies = []
+        self.results   = {}
+        self.errors    = 0
+        self.finished  = 0
+
+    def player_done(self, player):
+        self.finished += 1
+        if self.finished == self.players and self.on_done is not None:
+            self.on_done()
+
+    def clientConnectionFailed(self, connector, reason):
+        self.errors += 1
+        self.player_done(None)
+
+
+def percentile(values, fraction):
+    """The value below which fraction of the sorted values fall."""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def bench(host, port, games, plies, seed=None, out=None):
+    """Plays games concurrent games of plies plies against the server at
+    host:port and returns a dict of the throughput and move latencies."""
+    client = BenchClient(2 * games, plies, seed, on_done=reactor.stop)
+    for _ in xrange(2 * games):
+        reactor.connectTCP(host, port, client)
+    started = time.time()
+    reactor.run()
+    seconds = time.time() - started
+
+    latencies = sorted(client.latencies)
+    stats = dict(games=games, moves=len(latencies), errors=client.errors, seconds=seconds,
+                 moves_per_second=len(latencies) / seconds, results=client.results,
+                 p50=percentile(latencies, 0.50), p99=percentile(latencies, 0.99),
+                 max=latencies[-1] if latencies else 0.0)
+    if out is not None:
+        print >> out, "{games} games, {moves} moves, {errors} errors in {seconds:.2f}s, " \
+                      "{moves_per_second:.0f} moves/s".format(**stats)
+        print >> out, "move latency p50 {:.2f}ms p99 {:.2f}ms max {:.2f}ms".format(
+            stats["p50"] * 1000, stats["p99"] * 1000, stats["max"] * 1000)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Chess game server and load generator.")
+    commands = parser.add_subparsers(dest="command")
+    serve = commands.add_parser("serve", help="host games")
+    serve.add_argument("--port", type=int, default=8007)
+    serve.add_argument("--interface", default="")
+    serve.add_argument("--instrument", action="store_true", help="time the rules engine's hot paths")
+    load = commands.add_parser("bench", help="play concurrent games against a server")
+    load.add_argument("--host", default="127.0.0.1")
+    load.add_argument("--port", type=int, default=8007)
+    load.add_argument("--local", action="store_true", help="run the server in this process")
+    load.add_argument("-g", "--games", type=int, default=100)
+    load.add_argument("-p", "--plies", type=int, default=40)
+    load.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        if args.instrument:
+            instrument.enable()
+        port = reactor.listenTCP(args.port, GameServer(), interface=args.interface)
+        print "serving on port {}".format(port.getHost().port)
+        reactor.run()
+        return 0
+    port = args.port
+    if args.local:
+        port = reactor.listenTCP(0, GameServer(), interface="127.0.0.1").getHost().port
+    stats = bench(args.host, port, args.games, args.plies, args.seed, sys.stdout)
+    return 1 if stats["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
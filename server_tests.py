@@ -0,0 +1,125 @@
+import json
+from unittest import TestCase, main
+
+from twisted.test.proto_helpers import StringTransport
+
+import instrument
+from server import CHECKMATE, REPETITION, GameServer
+
+
+class TestServer(TestCase):
+
+    def setUp(self):
+        self.server = GameServer()
+
+    def connect(self):
+        protocol = self.server.buildProtocol(None)
+        protocol.makeConnection(StringTransport())
+        return protocol
+
+    def send(self, protocol, **message):
+        protocol.dataReceived(json.dumps(message) + "\n")
+
+    def received(self, protocol):
+        """The messages sent to protocol since the last call."""
+        lines = protocol.transport.value().splitlines()
+        protocol.transport.clear()
+        return [json.loads(line) for line in lines]
+
+    def start(self):
+        white, black = self.connect(), self.connect()
+        self.send(white, op="seek")
+        self.send(black, op="seek")
+        game = self.received(white)[0]["game"]
+        self.received(black)
+        return game, white, black
+
+    def test_seek_pairs_players(self):
+        white, black = self.connect(), self.connect()
+        self.send(white, op="seek")
+        self.assertEqual(self.received(white), [])
+        self.send(black, op="seek")
+        start, = self.received(white)
+        self.assertEqual((start["op"], start["color"]), ("start", "w"))
+        self.assertEqual(self.received(black)[0]["color"], "b")
+
+    def test_moves_reach_players_and_spectators(self):
+        game, white, black = self.start()
+        spectator = self.connect()
+        self.send(spectator, op="watch", game=game)
+        self.assertEqual(self.received(spectator)[0]["moves"], [])
+        self.send(white, op="move", game=game, move="e2e4")
+        for protocol in (white, black, spectator):
+            moved, = self.received(protocol)
+            self.assertEqual((moved["op"], moved["move"], moved["status"]), ("moved", "e2e4", "ongoing"))
+            self.assertEqual(moved["fen"], "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1")
+
+    def test_rejected_moves(self):
+        game, white, black = self.start()
+        for protocol, move in ((black, "e7e5"), (white, "e2e5"), (white, "e2"), (white, None)):
+            self.send(protocol, op="move", game=game, move=move)
+            error, = self.received(protocol)
+            self.assertEqual(error["op"], "error")
+        self.assertEqual(self.received(white) + self.received(black), [])
+        self.send(white, op="move", game=99, move="e2e4")
+        self.assertEqual(self.received(white)[0]["message"], "No such game: 99")
+        white.dataReceived("not json\n")
+        self.assertEqual(self.received(white)[0]["op"], "error")
+
+    def test_checkmate_ends_game(self):
+        game, white, black = self.start()
+        for protocol, move in ((white, "f2f3"), (black, "e7e5"), (white, "g2g4"), (black, "d8h4")):
+            self.send(protocol, op="move", game=game, move=move)
+        moved, over = self.received(white)[-2:]
+        self.assertEqual(moved["status"], CHECKMATE)
+        self.assertEqual((over["op"], over["result"]), ("over", "0-1"))
+        self.assertNotIn(game, self.server.games)
+
+    def test_repetition_ends_game(self):
+        game, white, black = self.start()
+        shuffle = ((white, "g1f3"), (black, "g8f6"), (white, "f3g1"), (black, "f6g8"))
+        for protocol, move in shuffle * 2:
+            self.send(protocol, op="move", game=game, move=move)
+        moved, over = self.received(black)[-2:]
+        self.assertEqual(moved["status"], REPETITION)
+        self.assertEqual((over["op"], over["result"], over["reason"]), ("over", "1/2-1/2", REPETITION))
+
+    def test_new_join_and_abandon(self):
+        white, black = self.connect(), self.connect()
+        self.send(white, op="new")
+        created, = self.received(white)
+        self.send(black, op="join", game=created["game"])
+        self.assertEqual(self.received(black)[0]["op"], "start")
+        self.received(white)
+        black.connectionLost(None)
+        over, = self.received(white)
+        self.assertEqual((over["result"], over["reason"]), ("1-0", "abandoned"))
+        self.assertEqual(self.server.games, {})
+
+    def test_stats(self):
+        game, white, black = self.start()
+        self.send(white, op="move", game=game, move="e2e4")
+        self.received(white)
+        self.send(white, op="stats")
+        stats, = self.received(white)
+        self.assertEqual((stats["games"], stats["moves"], stats["instrumented"]), (1, 1, False))
+
+    def test_instrumented_stats(self):
+        game, white, black = self.start()
+        instrument.reset()
+        instrument.enable()
+        try:
+            self.send(white, op="move", game=game, move="e2e4")
+            self.received(white)
+            self.send(white, op="stats")
+            stats, = self.received(white)
+        finally:
+            instrument.disable()
+        self.assertTrue(stats["instrumented"])
+        self.assertEqual(stats["probes"]["Board.make_move"]["calls"], 1)
+        self.assertEqual(stats["probes"]["Position.make_move"]["calls"], 1)
+        self.assertEqual(stats["probes"]["Position.legal_moves"]["calls"], 1)
+
+
+if __name__ == "__main__":
+    main()
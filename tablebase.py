@@ -0,0 +1,645 @@
+# encoding: utf-8
+"""Endgame tablebases: distance to mate for every position of a few small
+material sets, worked out backwards from the mates.
+
+Every position of a material set gets a number, see Layout, and a byte in a
+file holding the table: a header and then one value per number.  Probing is
+working out the number and reading the byte through mmap:
+
+    tablebases = Tablebases("tables")
+    tablebases.probe(position)        # (WIN, 19), (DRAW, 0)... or None
+    tablebases.best_move(position)    # the move keeping the best result
+
+Generation is retrograde analysis.  Mates, stalemates and the positions
+whose every move leaves the table (a capture or a promotion, looked up in
+the smaller tables) are known first.  Then, layer by layer, a position one
+move before a lost one is won, and a position all of whose moves reach won
+ones is lost, one ply further from mate.  The first pass over the whole
+table and the work of every layer are shared out to a pool of processes,
+reading the table under construction through a shared mmap:
+
+    python tablebase.py generate --dir tables KQK KRK KPK KRKR
+    python tablebase.py verify --dir tables
+    python tablebase.py probe --dir tables "8/8/8/8/8/2k5/8/KQ6 w - - 0 1"
+
+verify checks every stored value against the values of the position's
+moves, which proves the whole table right given the smaller ones.
+"""
+
+import argparse
+import itertools
+import mmap
+import multiprocessing
+import os
+import struct
+import sys
+import time
+
+from chess import BLACK, FEN_SYMBOLS, KING, PAWN, PROMOTIONS, PAWN_ATTACKS, Position, move_name, piece_attacks
+
+MAGIC   = "CHESSTB1"
+VERSION = 1
+#~ Magic, version, material and position count
+HEADER = struct.Struct("<8sI8sQ")
+
+#~ The material sets known, white holding the extra pieces, in the order they
+#~ have to be generated since a table looks up the ones before it
+MATERIALS = ["KQK", "KRK", "KPK", "KRKR"]
+
+#~ Stored values, one byte a position from the side to move's point of view.
+#~ Any other value is mate in value - 1 plies, won for the side to move when
+#~ that is odd and lost when it is even, 1 being checkmated.
+DRAW, UNKNOWN, ILLEGAL = 0, 254, 255
+#~ Results returned by probe(), from the side to move's point of view
+WIN, LOSS = 1, -1
+
+#~ The eight symmetries of the board as square maps, identity first and the
+#~ left to right mirror second
+def _transform(square, mirror_file, mirror_rank, swap):
+    x, y = square & 7, square >> 3
+    if mirror_file:
+        x = 7 - x
+    if mirror_rank:
+        y = 7 - y
+    if swap:
+        x, y = y, x
+    return y * 8 + x
+
+TRANSFORMS = [[_transform(square, mirror_file, mirror_rank, swap) for square in xrange(64)]
+              for swap in (0, 1) for mirror_rank in (0, 1) for mirror_file in (0, 1)]
+
+
+class TablebaseError(Exception):
+    pass
+
+
+def _codes(material):
+    """Piece codes of a material name, the kings first and then the other
+    white and black pieces in the order named."""
+    black = material.find("K", 1)
+    if not material.startswith("K") or black < 0 or material.count("K") != 2 or \
+       any(letter not in "PNBRQ" for letter in material.replace("K", "")):
+        raise TablebaseError("Not a material set: {!r}".format(material))
+    return [KING, KING | BLACK] + [FEN_SYMBOLS.index(letter) for letter in material[1:black]] + \
+           [FEN_SYMBOLS.index(letter) | BLACK for letter in material[black + 1:]]
+
+
+def _canonical(codes, squares):
+    """(material name, squares) with the pieces in the order of the table of
+    that material: the kings, then each side's pieces from the queen down."""
+    pieces = sorted(zip(codes, squares), key=lambda (code, square): (code & 7 != KING, code >> 3, -(code & 7)))
+    name = "".join(FEN_SYMBOLS[code & 7] for code, _ in pieces if not code & BLACK) + \
+           "".join(FEN_SYMBOLS[code & 7] for code, _ in pieces if code & BLACK)
+    return name, [square for _, square in pieces]
+
+
+def _insufficient(material):
+    """Whether no sequence of moves can mate, a lone minor piece at most."""
+    return material in ("KK", "KNK", "KBK", "KKN", "KKB")
+
+
+def _flipped(material):
+    """The material name with the colors swapped."""
+    black = material.find("K", 1)
+    return material[black:] + material[:black]
+
+
+def _best(children):
+    """Value of a position from the values of its moves, each from the point
+    of view of the opponent, who is to move after it."""
+    won = [value for value in children if value and not (value - 1) & 1]
+    if won:
+        return min(won) + 1
+    if DRAW in children:
+        return DRAW
+    return max(children) + 1
+
+
+def result(value):
+    """(WIN, DRAW or LOSS, plies to mate) of a stored value."""
+    if value in (DRAW, UNKNOWN, ILLEGAL):
+        return DRAW, 0
+    return (WIN if (value - 1) & 1 else LOSS), value - 1
+
+
+class Layout(object):
+    """Numbering of the positions of a material set.  The white king is
+    brought to the a1-d1-d4 triangle by one of the board's symmetries, or to
+    the queen side when there are pawns, and the number is its index there,
+    then the square of every other piece and the side to move.  A king on
+    the diagonal gets there by two symmetries, the lower number is used.
+    Numbers of impossible placements are left in, the table stays a plain
+    array."""
+
+    def __init__(self, material):
+        self.material = material
+        self.codes = _codes(material)
+        if _canonical(self.codes, range(len(self.codes)))[0] != material:
+            raise TablebaseError("Name the pieces from the queen down: {!r}".format(material))
+        if any(code & 7 == PAWN for code in self.codes):
+            self.kings, symmetries = [square for square in xrange(64) if square & 7 < 4], TRANSFORMS[:2]
+        else:
+            self.kings = [square for square in xrange(64) if square >> 3 <= square & 7 < 4]
+            symmetries = TRANSFORMS
+        self.king_index = [self.kings.index(square) if square in self.kings else None for square in xrange(64)]
+        #~ The symmetries bringing each square of the white king in place
+        self.symmetries = [[transform for transform in symmetries if transform[square] in self.kings]
+                           for square in xrange(64)]
+        self.size = len(self.kings) * 64 ** (len(self.codes) - 1) * 2
+
+    def index(self, turn, squares):
+        lowest = None
+        for transform in self.symmetries[squares[0]]:
+            index = self.king_index[transform[squares[0]]]
+            for square in squares[1:]:
+                index = index * 64 + transform[square]
+            if lowest is None or index < lowest:
+                lowest = index
+        return lowest * 2 + turn
+
+    def position(self, index):
+        """(turn, squares) numbered index, as seen after the symmetry."""
+        turn, index = index & 1, index >> 1
+        squares = []
+        for _ in xrange(len(self.codes) - 1):
+            squares.append(index & 63)
+            index >>= 6
+        squares.append(self.kings[index])
+        squares.reverse()
+        return turn, squares
+
+
+class Table(object):
+    """Read only view of a table file through mmap."""
+
+    def __init__(self, path):
+        with open(path, "rb") as table:
+            self.map = mmap.mmap(table.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.map) < HEADER.size:
+            raise TablebaseError("Not a tablebase: {}".format(path))
+        magic, version, material, size = HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != VERSION:
+            raise TablebaseError("Not a version {} tablebase: {}".format(VERSION, path))
+        self.layout = Layout(material.rstrip("\0"))
+        if size != self.layout.size or HEADER.size + size > len(self.map):
+            raise TablebaseError("Truncated tablebase: {}".format(path))
+
+    def close(self):
+        self.map.close()
+
+    def value(self, turn, squares):
+        """The stored value of the position, squares in the table's order."""
+        return ord(self.map[HEADER.size + self.layout.index(turn, squares)])
+
+
+class Tablebases(object):
+    """The tables of a directory, each opened the first time it's needed."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.available = set(name[:-3] for name in os.listdir(directory) if name.endswith(".tb"))
+        self.tables = {}
+
+    def table(self, material):
+        """The Table of material, None when there is no such file."""
+        if material not in self.available:
+            return None
+        if material not in self.tables:
+            self.tables[material] = Table(os.path.join(self.directory, material + ".tb"))
+        return self.tables[material]
+
+    def close(self):
+        for table in self.tables.values():
+            table.close()
+        self.tables = {}
+
+    def lookup(self, codes, squares, turn):
+        """The stored value of the pieces codes on squares with turn to move,
+        in any order, or None when there is no table for them."""
+        material, ordered = _canonical(codes, squares)
+        if _insufficient(material):
+            return DRAW
+        table = self.table(material)
+        if table is None:
+            if self.table(_flipped(material)) is None:
+                return None
+            #~ The same position with the colors swapped and the board upside down
+            material, ordered = _canonical([code ^ BLACK for code in codes], [square ^ 56 for square in squares])
+            table, turn = self.table(material), turn ^ 1
+        return table.value(turn, ordered)
+
+    def probe(self, position):
+        """(WIN, DRAW or LOSS, plies to mate) for the side to move, or None
+        when the position has no table or can't happen.  Castling rights are
+        ignored."""
+        value = self._value(position)
+        return None if value in (None, ILLEGAL) else result(value)
+
+    def best_move(self, position):
+        """A move keeping the probed result, mating in the fewest plies or
+        being mated in the most, or None without a table."""
+        if self._value(position) in (None, ILLEGAL):
+            return None
+        best = None
+        for move in position.legal_moves():
+            position.make_move(move)
+            value = self._value(position)
+            position.unmake_move()
+            if value is not None and (best is None or _rank(_best([value])) > best[0]):
+                best = _rank(_best([value])), move
+        return best and best[1]
+
+    def _value(self, position):
+        pieces = [(code, square) for square, code in enumerate(position.mailbox) if code]
+        return self.lookup([code for code, _ in pieces], [square for _, square in pieces], position.turn)
+
+
+def _rank(value):
+    """Orders values from the worst to the best for the side to move."""
+    outcome, plies = result(value)
+    return outcome, -plies if outcome == WIN else plies
+
+
+#~ Generation -----------------------------------------------------------------
+class _Generator(object):
+    """Move generation over the (turn, squares) of one table, reading the
+    table through mmap and the smaller ones through Tablebases."""
+
+    def __init__(self, material, path, directory):
+        self.layout = Layout(material)
+        self.codes = self.layout.codes
+        self.tablebases = Tablebases(directory)
+        with open(path, "rb") as table:
+            self.values = mmap.mmap(table.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def value(self, index):
+        return ord(self.values[HEADER.size + index])
+
+    def attacked(self, codes, squares, target, color, occupied):
+        """Whether a piece of color index attacks target."""
+        for code, square in zip(codes, squares):
+            if code >> 3 == color and piece_attacks(code, square, occupied) >> target & 1:
+                return True
+        return False
+
+    def legal(self, index):
+        """Whether index is the number of a position that can happen."""
+        turn, squares = self.layout.position(index)
+        if len(set(squares)) != len(squares) or self.layout.index(turn, squares) != index:
+            return False
+        occupied = 0
+        for code, square in zip(self.codes, squares):
+            if code & 7 == PAWN and square >> 3 in (0, 7):
+                return False
+            occupied |= 1 << square
+        return not self.attacked(self.codes, squares, squares[turn ^ 1], turn, occupied)
+
+    def in_check(self, turn, squares):
+        occupied = 0
+        for square in squares:
+            occupied |= 1 << square
+        return self.attacked(self.codes, squares, squares[turn], turn ^ 1, occupied)
+
+    def moves(self, turn, squares):
+        """([index of the position after every move staying in the table],
+        [value of the position after every other move]), both for the
+        opponent's turn."""
+        codes, layout, lookup = self.codes, self.layout, self.tablebases.lookup
+        occupied = own = 0
+        for code, square in zip(codes, squares):
+            occupied |= 1 << square
+            if code >> 3 == turn:
+                own |= 1 << square
+        inside, outside = [], []
+        for i, code in enumerate(codes):
+            if code >> 3 != turn:
+                continue
+            start = squares[i]
+            if code & 7 == PAWN:
+                step = -8 if turn else 8
+                targets = PAWN_ATTACKS[turn][start] & occupied & ~own
+                if not occupied >> (start + step) & 1:
+                    targets |= 1 << (start + step)
+                    if start >> 3 == (6 if turn else 1) and not occupied >> (start + 2 * step) & 1:
+                        targets |= 1 << (start + 2 * step)
+            else:
+                targets = piece_attacks(code, start, occupied) & ~own
+            while targets:
+                bit = targets & -targets
+                targets ^= bit
+                to = bit.bit_length() - 1
+                after = list(squares)
+                after[i] = to
+                after_codes = codes
+                if occupied & bit:
+                    victim = squares.index(to)
+                    after_codes = codes[:victim] + codes[victim + 1:]
+                    del after[victim]
+                king = to if i == turn else squares[turn]
+                if self.attacked(after_codes, after, king, turn ^ 1, occupied & ~(1 << start) | bit):
+                    continue
+                if code & 7 == PAWN and to >> 3 in (0, 7):
+                    index = after.index(to)
+                    for promotion in PROMOTIONS:
+                        promoted = list(after_codes)
+                        promoted[index] = promotion | (code & BLACK)
+                        outside.append(lookup(promoted, after, turn ^ 1))
+                elif after_codes is codes:
+                    inside.append(layout.index(turn ^ 1, after))
+                else:
+                    outside.append(lookup(after_codes, after, turn ^ 1))
+        if None in outside:
+            raise TablebaseError("{} needs the tables it reaches, generate those first".format(layout.material))
+        return inside, outside
+
+    def predecessors(self, index):
+        """Indexes of the positions one move of the side not to move before
+        index, by moves that stay in the table.  Some may be illegal."""
+        turn, squares = self.layout.position(index)
+        mover = turn ^ 1
+        occupied = 0
+        for square in squares:
+            occupied |= 1 << square
+        found = []
+        for i, code in enumerate(self.codes):
+            if code >> 3 != mover:
+                continue
+            to = squares[i]
+            if code & 7 == PAWN:
+                step = -8 if mover else 8
+                back, origins = to - step, 0
+                if 8 <= back < 56 and not occupied >> back & 1:
+                    origins = 1 << back
+                    if to >> 3 == (4 if mover else 3) and not occupied >> (back - step) & 1:
+                        origins |= 1 << (back - step)
+            else:
+                origins = piece_attacks(code, to, occupied) & ~occupied
+            while origins:
+                bit = origins & -origins
+                origins ^= bit
+                before = list(squares)
+                before[i] = bit.bit_length() - 1
+                found.append(self.layout.index(mover, before))
+        return found
+
+    def initial(self, index):
+        """(value, plies of a win by leaving the table or None, plies after
+        which every move may be lost or None) of a position before the
+        retrograde layers, UNKNOWN when they decide it."""
+        if not self.legal(index):
+            return ILLEGAL, None, None
+        turn, squares = self.layout.position(index)
+        inside, outside = self.moves(turn, squares)
+        if not inside:
+            if not outside:
+                return (1 if self.in_check(turn, squares) else DRAW), None, None
+            return _best(outside), None, None
+        won = [value for value in outside if value and not (value - 1) & 1]
+        if won:
+            return UNKNOWN, min(won), None
+        if outside and DRAW not in outside:
+            return UNKNOWN, None, max(outside) - 1
+        return UNKNOWN, None, None
+
+    def lost(self, index, plies):
+        """Whether every move of index reaches a position won for the
+        opponent in at most plies."""
+        turn, squares = self.layout.position(index)
+        inside, outside = self.moves(turn, squares)
+        for value in itertools.chain(outside, (self.value(child) for child in inside)):
+            if value in (DRAW, UNKNOWN) or not (value - 1) & 1 or value - 1 > plies:
+                return False
+        return True
+
+    def expected(self, index):
+        """The value index should hold given the values of its moves."""
+        if not self.legal(index):
+            return ILLEGAL
+        turn, squares = self.layout.position(index)
+        inside, outside = self.moves(turn, squares)
+        children = outside + [self.value(child) for child in inside]
+        if not children:
+            return 1 if self.in_check(turn, squares) else DRAW
+        return _best(children)
+
+
+#~ The process' _Generator, built once per worker by _init_worker()
+_generator = None
+
+
+def _init_worker(material, path, directory):
+    global _generator
+    _generator = _Generator(material, path, directory)
+
+
+def _initial_chunk(bounds):
+    """(start, values, [(index, value) decided], [(index, plies) won by leaving
+    the table], [(index, plies) to check]) for the indexes in bounds."""
+    start, stop = bounds
+    values, decided, wins, checks = bytearray(), [], [], []
+    for index in xrange(start, stop):
+        value, win, check = _generator.initial(index)
+        values.append(value)
+        if value not in (DRAW, UNKNOWN, ILLEGAL):
+            decided.append((index, value))
+        if win is not None:
+            wins.append((index, win))
+        if check is not None:
+            checks.append((index, check))
+    return start, str(values), decided, wins, checks
+
+
+def _layer_chunk(task):
+    """Positions decided one ply after the layer of positions plies from
+    mate: the ones before a lost position, or the checked ones lost."""
+    plies, indexes, checks = task
+    found, seen = [], set()
+    for index in indexes:
+        for before in _generator.predecessors(index):
+            if before in seen or _generator.value(before) != UNKNOWN:
+                continue
+            seen.add(before)
+            #~ Layers alternate, an even one holds lost positions
+            if not plies & 1 or _generator.lost(before, plies):
+                found.append(before)
+    for index in checks:
+        if index not in seen and _generator.value(index) == UNKNOWN and _generator.lost(index, plies):
+            found.append(index)
+    return found
+
+
+def _verify_chunk(bounds):
+    """The indexes in bounds holding another value than expected()."""
+    return [index for index in xrange(*bounds) if _generator.value(index) != _generator.expected(index)]
+
+
+def _chunks(items, size):
+    for start in xrange(0, len(items), size):
+        yield items[start:start + size]
+
+
+class _Workers(object):
+    """A pool of processes running _init_worker(*args), or this process
+    alone when workers is 1."""
+
+    def __init__(self, workers, args):
+        self.pool = None
+        if workers > 1:
+            self.pool = multiprocessing.Pool(workers, _init_worker, args)
+        else:
+            _init_worker(*args)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+
+    def map(self, function, tasks):
+        if self.pool is None:
+            return itertools.imap(function, tasks)
+        return self.pool.imap_unordered(function, tasks)
+
+
+def _needs(material):
+    """The tables a capture or a promotion in material leads to."""
+    codes = _codes(material)
+    needed = set()
+    for i, code in enumerate(codes):
+        if code & 7 == KING:
+            continue
+        needed.add(_canonical(codes[:i] + codes[i + 1:], range(len(codes) - 1))[0])
+        if code & 7 == PAWN:
+            for promotion in PROMOTIONS:
+                needed.add(_canonical(codes[:i] + [promotion | (code & BLACK)] + codes[i + 1:], codes)[0])
+    return sorted(name for name in needed if not _insufficient(name))
+
+
+def generate(material, directory, workers=None, out=None):
+    """Writes the table of material to directory/material.tb, the tables it
+    needs being there already.  Returns a dict of counts and the longest
+    mate in plies."""
+    started = time.time()
+    layout = Layout(material)
+    for needed in _needs(material):
+        if not any(os.path.exists(os.path.join(directory, name + ".tb")) for name in (needed, _flipped(needed))):
+            raise TablebaseError("{} needs the {} table, generate it first".format(material, needed))
+    workers = workers or multiprocessing.cpu_count()
+    path = os.path.join(directory, material + ".tb")
+    work = path + ".tmp"
+    with open(work, "wb") as table:
+        table.write(HEADER.pack(MAGIC, VERSION, material, layout.size))
+        table.write(chr(UNKNOWN) * layout.size)
+    with open(work, "r+b") as table:
+        values = mmap.mmap(table.fileno(), 0)
+
+    with _Workers(workers, (material, work, directory)) as pool:
+        layers, wins, checks = {}, {}, {}
+        size = max(1024, min(65536, layout.size // (workers * 16)))
+        bounds = [(start, min(start + size, layout.size)) for start in xrange(0, layout.size, size)]
+        for start, chunk, decided, won, check in pool.map(_initial_chunk, bounds):
+            values[HEADER.size + start:HEADER.size + start + len(chunk)] = chunk
+            for index, value in decided:
+                layers.setdefault(value - 1, []).append(index)
+            for index, plies in won:
+                wins.setdefault(plies, []).append(index)
+            for index, plies in check:
+                checks.setdefault(plies, []).append(index)
+
+        plies = 0
+        while layers or wins or checks:
+            layer = layers.pop(plies, [])
+            for index in wins.pop(plies, []):
+                if ord(values[HEADER.size + index]) == UNKNOWN:
+                    values[HEADER.size + index] = chr(plies + 1)
+                    layer.append(index)
+            tasks = [(plies, indexes, []) for indexes in _chunks(layer, 1024)] + \
+                    [(plies, [], indexes) for indexes in _chunks(checks.pop(plies, []), 1024)]
+            for found in pool.map(_layer_chunk, tasks):
+                for index in found:
+                    if ord(values[HEADER.size + index]) == UNKNOWN:
+                        values[HEADER.size + index] = chr(plies + 2)
+                        layers.setdefault(plies + 1, []).append(index)
+            if out is not None and layer:
+                print >> out, "{} mate in {} plies: {} positions".format(material, plies, len(layer))
+            plies += 1
+            if plies + 2 >= UNKNOWN:
+                raise TablebaseError("{} has mates too long to store".format(material))
+
+    data = values[HEADER.size:].replace(chr(UNKNOWN), chr(DRAW))
+    values[HEADER.size:] = data
+    values.flush()
+    values.close()
+    os.rename(work, path)
+
+    counts = [data.count(chr(value)) for value in xrange(256)]
+    stats = dict(material=material, positions=layout.size, illegal=counts[ILLEGAL], draws=counts[DRAW],
+                 wins=sum(counts[value] for value in xrange(2, UNKNOWN, 2)),
+                 losses=sum(counts[value] for value in xrange(1, UNKNOWN, 2)),
+                 longest=max([value - 1 for value in xrange(1, UNKNOWN) if counts[value]] or [0]),
+                 seconds=time.time() - started)
+    if out is not None:
+        print >> out, "{material}: {positions} positions, {wins} won, {losses} lost, {draws} drawn, " \
+                      "longest mate {longest} plies, {seconds:.1f}s".format(**stats)
+    return stats
+
+
+def verify(material, directory, workers=None):
+    """Indexes of the table of material whose value disagrees with the
+    values of their moves, none for a correct table."""
+    workers = workers or multiprocessing.cpu_count()
+    path = os.path.join(directory, material + ".tb")
+    table = Table(path)
+    size = table.layout.size
+    table.close()
+    chunk = max(1024, min(65536, size // (workers * 16)))
+    with _Workers(workers, (material, path, directory)) as pool:
+        bounds = [(start, min(start + chunk, size)) for start in xrange(0, size, chunk)]
+        return sorted(index for wrong in pool.map(_verify_chunk, bounds) for index in wrong)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate, verify and probe endgame tablebases.")
+    parser.add_argument("-d", "--dir", default=".", help="directory of the tables")
+    parser.add_argument("-w", "--workers", type=int, help="processes, one per core by default")
+    commands = parser.add_subparsers(dest="command")
+    generator = commands.add_parser("generate", help="generate tables, all of them by default")
+    generator.add_argument("materials", nargs="*", default=MATERIALS)
+    checker = commands.add_parser("verify", help="check tables against their moves")
+    checker.add_argument("materials", nargs="*", default=MATERIALS)
+    prober = commands.add_parser("probe", help="look up a position")
+    prober.add_argument("fen")
+    args = parser.parse_args(argv)
+
+    if args.command == "generate":
+        for material in args.materials:
+            generate(material, args.dir, args.workers, sys.stdout)
+        return 0
+    if args.command == "verify":
+        failed = 0
+        for material in args.materials:
+            wrong = verify(material, args.dir, args.workers)
+            print "{}: {}".format(material, "{} wrong values".format(len(wrong)) if wrong else "ok")
+            failed += len(wrong)
+        return 1 if failed else 0
+    tablebases = Tablebases(args.dir)
+    position = Position.from_fen(args.fen)
+    probed = tablebases.probe(position)
+    if probed is None:
+        print "no table"
+        return 1
+    outcome, plies = probed
+    words = {WIN: "win", DRAW: "draw", LOSS: "loss"}[outcome]
+    if outcome != DRAW:
+        words += " in {} plies".format(plies)
+    best = tablebases.best_move(position)
+    if best is not None:
+        words += ", " + move_name(best)
+    print words
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
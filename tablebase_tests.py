@@ -0,0 +1,93 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase, main
+
+from chess import Position, move_name
+from search import search
+from tablebase import (DRAW, LOSS, WIN, Layout, TablebaseError, Tablebases, TRANSFORMS, generate,
+                       verify)
+
+
+class TestLayout(TestCase):
+
+    def test_symmetric_positions_share_an_index(self):
+        layout = Layout("KQK")
+        squares = [1, 20, 45]
+        indexes = set(layout.index(0, [transform[square] for square in squares]) for transform in TRANSFORMS)
+        self.assertEqual(len(indexes), 1)
+        self.assertEqual(layout.size, 10 * 64 * 64 * 2)
+        turn, seen = layout.position(indexes.pop())
+        self.assertEqual(turn, 0)
+        self.assertIn(seen[0], layout.kings)
+
+    def test_pawns_only_mirror(self):
+        layout = Layout("KPK")
+        self.assertEqual(layout.size, 32 * 64 * 64 * 2)
+        self.assertEqual(layout.index(1, [4, 60, 12]), layout.index(1, [3, 59, 11]))
+        self.assertNotEqual(layout.index(1, [4, 60, 12]), layout.index(1, [60, 4, 52]))
+
+    def test_bad_material(self):
+        for material in ("KQ", "QKK", "KXK", "KRQK"):
+            self.assertRaises(TablebaseError, Layout, material)
+
+
+class TestTablebases(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.folder = tempfile.mkdtemp()
+        cls.stats = generate("KQK", cls.folder, workers=2)
+        cls.tablebases = Tablebases(cls.folder)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tablebases.close()
+        shutil.rmtree(cls.folder)
+
+    def probe(self, fen):
+        return self.tablebases.probe(Position.from_fen(fen))
+
+    def test_generate(self):
+        self.assertTrue(os.path.exists(os.path.join(self.folder, "KQK.tb")))
+        self.assertFalse(os.path.exists(os.path.join(self.folder, "KQK.tb.tmp")))
+        #~ Mate in ten moves at most with the queen to move
+        self.assertEqual(self.stats["longest"], 20)
+        self.assertEqual(verify("KQK", self.folder, workers=1), [])
+
+    def test_probe(self):
+        self.assertEqual(self.probe("k7/2Q5/1K6/8/8/8/8/8 b - - 0 1"), (DRAW, 0))
+        self.assertEqual(self.probe("k7/1Q6/1K6/8/8/8/8/8 b - - 0 1"), (LOSS, 0))
+        self.assertEqual(self.probe("k7/8/1K6/8/8/8/8/6Q1 w - - 0 1"), (WIN, 1))
+        #~ The black king can take the queen
+        self.assertEqual(self.probe("8/8/8/8/8/1Q6/2k5/K7 b - - 0 1"), (DRAW, 0))
+        #~ The same positions with the colors swapped
+        self.assertEqual(self.probe("6q1/8/8/8/8/1k6/8/K7 b - - 0 1"), (WIN, 1))
+        self.assertEqual(self.probe("k7/2K5/1q6/8/8/8/8/8 w - - 0 1"), (DRAW, 0))
+        #~ No table, and a position where the side not to move is in check
+        self.assertEqual(self.probe("k7/8/1K6/8/8/8/8/6R1 w - - 0 1"), None)
+        self.assertEqual(self.probe("k7/8/1K6/8/8/8/8/7Q w - - 0 1"), None)
+
+    def test_best_move_mates(self):
+        position = Position.from_fen("8/8/8/8/8/2k5/8/KQ6 w - - 0 1")
+        outcome, plies = self.tablebases.probe(position)
+        self.assertEqual(outcome, WIN)
+        while plies:
+            position.make_move(self.tablebases.best_move(position))
+            outcome, left = self.tablebases.probe(position)
+            self.assertEqual((outcome, left), (LOSS if left & 1 == 0 else WIN, plies - 1))
+            plies = left
+        self.assertFalse(position.legal_moves())
+        self.assertTrue(position.in_check())
+
+    def test_search_uses_tablebases(self):
+        result = search(Position.from_fen("k7/8/1K6/8/8/8/8/6Q1 w - - 0 1"), max_depth=1,
+                        tablebases=self.tablebases)
+        self.assertEqual((move_name(result.move), result.depth), ("g1g8", 0))
+
+    def test_needs_smaller_tables(self):
+        self.assertRaises(TablebaseError, generate, "KPK", self.folder, 1)
+
+
+if __name__ == "__main__":
+    main()
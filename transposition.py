@@ -0,0 +1,118 @@
+# encoding: utf-8
+"""Fixed size transposition table keyed by Position.key.
+
+Entries live in three preallocated arrays, 12 bytes a slot, so the memory
+used is set by the cap given up front and never grows:
+
+    table = TranspositionTable(megabytes=64)
+    result = Search(position, max_time=1.0, table=table).run()
+    print table.stats()
+"""
+
+from array import array
+
+#~ Bound types of a stored score
+EXACT, LOWER, UPPER = 1, 2, 3
+
+#~ Replacement policies.  DEPTH_PREFERRED buckets hold two slots, one kept for
+#~ the deepest search of the current generation and one always replaced.
+#~ ALWAYS_REPLACE buckets hold a single slot that every store overwrites.
+DEPTH_PREFERRED, ALWAYS_REPLACE = "depth", "always"
+
+#~ Bytes per slot: check, score and info ints
+SLOT_SIZE = 12
+
+
+class TranspositionTable(object):
+
+    def __init__(self, megabytes=16, policy=DEPTH_PREFERRED):
+        if policy not in (DEPTH_PREFERRED, ALWAYS_REPLACE):
+            raise ValueError("Unknown replacement policy: {!r}".format(policy))
+        self.policy = policy
+        self.bucket_size = 2 if policy == DEPTH_PREFERRED else 1
+        #~ Round down to a power of two buckets so a mask picks the bucket
+        buckets = max(1, int(megabytes * 1024 * 1024) // (SLOT_SIZE * self.bucket_size))
+        self.buckets = 1 << (buckets.bit_length() - 1)
+        self.mask = self.buckets - 1
+        slots = self.buckets * self.bucket_size
+        #~ The high 32 bits of the key, the low bits already picked the bucket
+        self.checks = array("I", [0]) * slots
+        self.scores = array("i", [0]) * slots
+        #~ move | (depth + 1) << 16 | bound << 24 | generation << 26, 0 if empty
+        self.infos  = array("I", [0]) * slots
+        self.generation = 0
+        self.reset_stats()
+
+    def __len__(self):
+        return len(self.infos)
+
+    @property
+    def size(self):
+        """Bytes used by the entries."""
+        return sum(a.itemsize * len(a) for a in (self.checks, self.scores, self.infos))
+
+    def clear(self):
+        slots = len(self.infos)
+        self.checks = array("I", [0]) * slots
+        self.scores = array("i", [0]) * slots
+        self.infos  = array("I", [0]) * slots
+        self.generation = 0
+        self.reset_stats()
+
+    def new_search(self):
+        """Ages the entries so the depth preferred slots free up for the new
+        search."""
+        self.generation = (self.generation + 1) & 63
+
+    def probe(self, key):
+        """(move, score, depth, bound) stored for key, or None."""
+        self.probes += 1
+        check = (key >> 32) & 0xffffffff
+        slot = (key & self.mask) * self.bucket_size
+        collided = False
+        for slot in xrange(slot, slot + self.bucket_size):
+            info = self.infos[slot]
+            if not info:
+                continue
+            if self.checks[slot] == check:
+                self.hits += 1
+                return (info & 0xffff, self.scores[slot], ((info >> 16) & 0xff) - 1, (info >> 24) & 3)
+            collided = True
+        self.misses += 1
+        if collided:
+            self.collisions += 1
+        return None
+
+    def store(self, key, move, score, depth, bound):
+        self.stores += 1
+        check = (key >> 32) & 0xffffffff
+        slot = (key & self.mask) * self.bucket_size
+        if self.bucket_size == 2:
+            info = self.infos[slot]
+            #~ Keep the deeper entry of this generation unless it is the same
+            #~ position, otherwise fall back to the always replaced slot
+            if info and self.checks[slot] != check and (info >> 26) == self.generation and \
+               ((info >> 16) & 0xff) - 1 > depth:
+                slot += 1
+        if self.infos[slot] and self.checks[slot] != check:
+            self.overwrites += 1
+        self.checks[slot] = check
+        self.scores[slot] = score
+        self.infos[slot]  = (move & 0xffff) | ((max(depth, 0) + 1) << 16) | (bound << 24) | \
+                            (self.generation << 26)
+
+    def usage(self, sample=1000):
+        """Permille of used slots in the first sample slots."""
+        sample = min(sample, len(self.infos))
+        return sum(1 for info in self.infos[:sample] if info) * 1000 // sample
+
+    def reset_stats(self):
+        self.probes = self.hits = self.misses = self.collisions = 0
+        self.stores = self.overwrites = 0
+
+    def stats(self):
+        """Counters since the last reset_stats(), as a dict."""
+        return dict(probes=self.probes, hits=self.hits, misses=self.misses,
+                    collisions=self.collisions, stores=self.stores, overwrites=self.overwrites,
+                    hit_rate=float(self.hits) / self.probes if self.probes else 0.0,
+                    usage=self.usage(), size=self.size, policy=self.policy)
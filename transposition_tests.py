@@ -0,0 +1,58 @@
+from unittest import TestCase, main
+
+from chess import Position
+from search import search
+from transposition import ALWAYS_REPLACE, EXACT, LOWER, UPPER, TranspositionTable
+
+
+class TestTranspositionTable(TestCase):
+
+    def setUp(self):
+        self.table = TranspositionTable(megabytes=1)
+
+    def test_memory_cap(self):
+        self.assertLessEqual(self.table.size, 1024 * 1024)
+        self.assertGreater(self.table.size, 512 * 1024)
+        self.assertLessEqual(TranspositionTable(megabytes=0.01).size, 0.01 * 1024 * 1024)
+
+    def test_store_and_probe(self):
+        key = Position.start().key
+        self.assertIsNone(self.table.probe(key))
+        self.table.store(key, 1234, -56, 7, LOWER)
+        self.assertEqual(self.table.probe(key), (1234, -56, 7, LOWER))
+        stats = self.table.stats()
+        self.assertEqual((stats["probes"], stats["hits"], stats["misses"]), (2, 1, 1))
+
+    def test_depth_preferred(self):
+        deep, shallow, other = 1 << 40, 2 << 40, 3 << 40
+        self.table.store(deep, 1, 10, 8, EXACT)
+        self.table.store(shallow, 2, 20, 2, EXACT)
+        self.table.store(other, 3, 30, 1, UPPER)
+        #~ Same bucket: the deep entry stays, the always replaced slot turns over
+        self.assertEqual(self.table.probe(deep), (1, 10, 8, EXACT))
+        self.assertIsNone(self.table.probe(shallow))
+        self.assertEqual(self.table.probe(other), (3, 30, 1, UPPER))
+        self.assertEqual(self.table.collisions, 1)
+        self.table.new_search()
+        self.table.store(shallow, 2, 20, 2, EXACT)
+        self.assertIsNone(self.table.probe(deep))
+
+    def test_always_replace(self):
+        table = TranspositionTable(megabytes=1, policy=ALWAYS_REPLACE)
+        table.store(1 << 40, 1, 10, 8, EXACT)
+        table.store(2 << 40, 2, 20, 1, EXACT)
+        self.assertIsNone(table.probe(1 << 40))
+        self.assertEqual(table.overwrites, 1)
+        self.assertRaises(ValueError, TranspositionTable, 1, "never")
+
+    def test_search_uses_fewer_nodes(self):
+        position = Position.start()
+        plain = search(position, max_depth=4)
+        cached = search(position, max_depth=4, table=self.table)
+        self.assertLess(cached.nodes, plain.nodes)
+        self.assertEqual(cached.score, plain.score)
+        self.assertGreater(self.table.hits, 0)
+
+
+if __name__ == "__main__":
+    main()
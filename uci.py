@@ -0,0 +1,294 @@
+# encoding: utf-8
+"""UCI front end, so GUIs, tournament managers and match runners can drive
+the engine:
+
+    python uci.py
+
+Commands are read from stdin one line at a time and answers go to stdout.
+"position startpos moves e2e4 e7e5" replays the moves on the compact
+Position with parse_uci(), no Board involved.  "go" starts the search on a
+background thread and returns at once, so "stop", "isready" and "quit" are
+answered within milliseconds however deep the search is.  Every finished
+depth sends an "info depth ... pv ..." line, and an "info nodes ... nps"
+line goes out every PROGRESS_EVERY seconds in between.
+
+Supported: uci, debug, isready, setoption (Hash, BookFile, TablebasePath),
+ucinewgame, position, go (depth, nodes, movetime, wtime, btime, winc,
+binc, movestogo, infinite, ponder), stop, ponderhit and quit.
+"""
+
+import sys
+import threading
+import time
+
+from book import Book, BookError
+from chess import InvalidMove, Position, move_name
+from notation import parse_uci
+from search import MATE, MAX_PLY, Search, SearchResult
+from tablebase import TablebaseError, Tablebases
+from transposition import TranspositionTable
+
+NAME   = "chess"
+AUTHOR = "chess authors"
+
+#~ Seconds between the "info nodes" lines of a running search
+PROGRESS_EVERY = 1.0
+#~ Moves left to plan for when the GUI doesn't say, and the milliseconds kept
+#~ back for the GUI's overhead
+MOVES_TO_GO   = 30
+MOVE_OVERHEAD = 50
+#~ Scores past this are mates, tablebase wins included
+MATE_BOUND = MATE - 1000
+
+#~ go parameters followed by a number
+GO_NUMBERS = ("depth", "nodes", "movetime", "wtime", "btime", "winc", "binc", "movestogo")
+
+
+def format_score(score):
+    """"cp 35", or "mate 3" and "mate -2" in moves for mate scores."""
+    if score >= MATE_BOUND:
+        return "mate {}".format((MATE - score + 1) // 2)
+    if score <= -MATE_BOUND:
+        return "mate {}".format(-((MATE + score) // 2))
+    return "cp {}".format(score)
+
+
+def parse_go(words):
+    """{parameter: value} of the words after "go", True for the flags."""
+    limits = {}
+    words = iter(words)
+    for word in words:
+        if word in GO_NUMBERS:
+            limits[word] = int(next(words))
+        elif word in ("infinite", "ponder"):
+            limits[word] = True
+    return limits
+
+
+def budget(limits, turn):
+    """Seconds to search for the go limits with turn to move, None for no
+    time limit."""
+    if "movetime" in limits:
+        return max(limits["movetime"] - MOVE_OVERHEAD, 1) / 1000.0
+    remaining = limits.get("btime" if turn else "wtime")
+    if remaining is None:
+        return None
+    increment = limits.get("binc" if turn else "winc", 0)
+    moves = limits.get("movestogo") or MOVES_TO_GO
+    milliseconds = min(remaining / moves + increment * 3 // 4, remaining - MOVE_OVERHEAD)
+    return max(milliseconds, 1) / 1000.0
+
+
+class Engine(object):
+    """The UCI state machine: command() handles one line, and what the
+    engine says is written to out, from the search thread too."""
+
+    def __init__(self, out=sys.stdout, megabytes=16):
+        self.out        = out
+        self.lock       = threading.Lock()
+        self.position   = Position.start()
+        self.table      = TranspositionTable(megabytes)
+        self.book       = None
+        self.tablebases = None
+        self.debug      = False
+        self.search     = None
+        self.thread     = None
+        #~ Set when an infinite or ponder search may send its bestmove
+        self.release    = threading.Event()
+        #~ Seconds to search once a ponder search is told "ponderhit"
+        self.ponder_time = None
+
+    def send(self, line):
+        with self.lock:
+            self.out.write(line + "\n")
+            self.out.flush()
+
+    def loop(self, lines):
+        """Handles lines until "quit" or the end of input."""
+        for line in lines:
+            if not self.command(line):
+                break
+        self.stop()
+
+    def command(self, line):
+        """Handles one line, False when it says quit."""
+        words = line.split()
+        if not words:
+            return True
+        name, args = words[0], words[1:]
+        handler = getattr(self, "do_" + name, None)
+        if handler is None:
+            self.send("info string Unknown command: {}".format(name))
+            return True
+        return handler(args) is not False
+
+    def searching(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def stop(self):
+        """Stops the search and waits for its bestmove to go out."""
+        while self.searching():
+            #~ Search.run() clears the flag when it starts, so keep setting it
+            self.search.stopped = True
+            self.release.set()
+            self.thread.join(0.005)
+        self.thread = None
+
+    #~ Commands ----------------------------------------------------------------
+    def do_uci(self, args):
+        self.send("id name {}".format(NAME))
+        self.send("id author {}".format(AUTHOR))
+        self.send("option name Hash type spin default 16 min 1 max 4096")
+        self.send("option name BookFile type string default <empty>")
+        self.send("option name TablebasePath type string default <empty>")
+        self.send("uciok")
+
+    def do_debug(self, args):
+        self.debug = args[:1] == ["on"]
+
+    def do_isready(self, args):
+        self.send("readyok")
+
+    def do_setoption(self, args):
+        text = " ".join(args)
+        name, _, value = text.partition(" value ")
+        name = name.replace("name", "", 1).strip().lower()
+        value = value.strip()
+        self.stop()
+        try:
+            if name == "hash":
+                self.table = TranspositionTable(int(value))
+            elif name == "bookfile":
+                self.book = Book(value) if value and value != "<empty>" else None
+            elif name == "tablebasepath":
+                self.tablebases = Tablebases(value) if value and value != "<empty>" else None
+            else:
+                self.send("info string Unknown option: {}".format(name))
+        except (ValueError, EnvironmentError, BookError, TablebaseError) as error:
+            self.send("info string Bad value for {}: {}".format(name, error))
+
+    def do_ucinewgame(self, args):
+        self.stop()
+        self.table.clear()
+
+    def do_position(self, args):
+        if "moves" in args:
+            split = args.index("moves")
+            args, moves = args[:split], args[split + 1:]
+        else:
+            moves = []
+        try:
+            if args[:1] == ["startpos"]:
+                position = Position.start()
+            elif args[:1] == ["fen"]:
+                position = Position.from_fen(" ".join(args[1:]))
+            else:
+                raise ValueError("position needs startpos or fen")
+            for text in moves:
+                position.make_move(parse_uci(position, text))
+        except (ValueError, InvalidMove) as error:
+            #~ The last good position stays
+            self.send("info string {}".format(error))
+            return
+        self.stop()
+        self.position = position
+
+    def do_go(self, args):
+        self.stop()
+        try:
+            limits = parse_go(args)
+        except (ValueError, StopIteration):
+            self.send("info string Bad go: {}".format(" ".join(args)))
+            return
+        position = self.position.copy()
+        seconds = budget(limits, position.turn)
+        waiting = limits.get("infinite") or limits.get("ponder")
+        self.ponder_time = seconds if limits.get("ponder") else None
+        self.release.clear()
+        if waiting:
+            seconds = None
+        else:
+            self.release.set()
+        self.search = Search(position, max_time=seconds, max_nodes=limits.get("nodes"),
+                             max_depth=limits.get("depth", MAX_PLY), table=self.table,
+                             on_iteration=self._iteration, on_progress=self._progress)
+        self._reported = time.time()
+        self.thread = threading.Thread(target=self._run, args=(self.search,), name="search")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def do_stop(self, args):
+        self.stop()
+
+    def do_ponderhit(self, args):
+        """The move pondered on was played: the search goes on as a normal
+        one with the time of the last go."""
+        search = self.search
+        if search is not None and self.ponder_time is not None:
+            search.stop_at(self.ponder_time)
+        self.ponder_time = None
+        self.release.set()
+
+    def do_quit(self, args):
+        self.stop()
+        return False
+
+    #~ Search thread -----------------------------------------------------------
+    def _run(self, search):
+        result = self._shortcut(search.position)
+        if result is None:
+            result = search.run()
+        #~ An infinite or ponder search waits to be told before it moves
+        self.release.wait()
+        if result.move is None:
+            self.send("bestmove 0000")
+        elif len(result.pv) > 1:
+            self.send("bestmove {} ponder {}".format(move_name(result.move), move_name(result.pv[1])))
+        else:
+            self.send("bestmove {}".format(move_name(result.move)))
+
+    def _shortcut(self, position):
+        """A SearchResult from the tablebases or the book, None if neither
+        knows position.  The same answers as search.search()."""
+        move = score = None
+        if self.tablebases is not None:
+            move = self.tablebases.best_move(position)
+            if move is not None:
+                outcome, plies = self.tablebases.probe(position)
+                score = outcome * (MATE - plies)
+        if move is None and self.book is not None:
+            move = self.book.best(position)
+            #~ Keys can collide, a book move is only played when it is legal
+            if move not in position.legal_moves():
+                move = None
+            score = 0
+        if move is None:
+            return None
+        result = SearchResult(move, score, 0, 0, [move], 0.0)
+        self._iteration(result)
+        return result
+
+    def _iteration(self, result):
+        seconds = max(result.seconds, 1e-3)
+        self.send("info depth {} score {} nodes {} nps {} time {} pv {}".format(
+            result.depth, format_score(result.score), result.nodes, int(result.nodes / seconds),
+            int(result.seconds * 1000), " ".join(map(move_name, result.pv))))
+
+    def _progress(self, search):
+        now = time.time()
+        if now - self._reported < PROGRESS_EVERY:
+            return
+        self._reported = now
+        seconds = max(now - search.started, 1e-3)
+        self.send("info nodes {} nps {} time {} hashfull {}".format(
+            search.nodes, int(search.nodes / seconds), int(seconds * 1000), self.table.usage()))
+
+
+def main():
+    #~ readline() rather than iterating stdin, which reads ahead in blocks
+    Engine().loop(iter(sys.stdin.readline, ""))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+import threading
+import time
+from unittest import TestCase, main
+
+from chess import Position
+from search import MATE
+from uci import Engine, budget, format_score, parse_go
+
+
+class Output(object):
+    """Lines the engine sent, readable while its search thread writes."""
+
+    def __init__(self):
+        self.lines = []
+        self.changed = threading.Condition()
+
+    def write(self, text):
+        with self.changed:
+            self.lines.extend(text.splitlines())
+            self.changed.notify_all()
+
+    def flush(self):
+        pass
+
+    def wait_for(self, prefix, timeout=10.0):
+        """The first line starting with prefix, waiting for it to come."""
+        deadline = time.time() + timeout
+        with self.changed:
+            while True:
+                for line in self.lines:
+                    if line.startswith(prefix):
+                        return line
+                if time.time() >= deadline:
+                    raise AssertionError("No {!r} in {!r}".format(prefix, self.lines))
+                self.changed.wait(deadline - time.time())
+
+
+class TestUCI(TestCase):
+
+    def setUp(self):
+        self.out = Output()
+        self.engine = Engine(self.out, megabytes=1)
+
+    def tearDown(self):
+        self.engine.stop()
+
+    def send(self, *lines):
+        for line in lines:
+            self.engine.command(line)
+
+    def test_handshake(self):
+        self.send("uci", "isready")
+        self.assertEqual(self.out.lines[:2], ["id name chess", "id author chess authors"])
+        self.assertEqual(self.out.lines[-2:], ["uciok", "readyok"])
+
+    def test_position_moves(self):
+        self.send("position startpos moves e2e4 e7e5 g1f3")
+        expected = Position.from_fen("rnbqkbnr/pppp1ppp/8/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R b KQkq - 1 2")
+        self.assertEqual(self.engine.position, expected)
+        self.send("position fen k7/8/1K6/8/8/8/8/6Q1 w - - 0 1 moves g1g8")
+        self.assertEqual(self.engine.position.to_fen(), "k5Q1/8/1K6/8/8/8/8/8 b - - 1 1")
+        #~ An illegal move leaves the last good position
+        self.send("position startpos moves e2e5")
+        self.assertIn("Illegal move", self.out.wait_for("info string"))
+        self.assertEqual(self.engine.position.to_fen(), "k5Q1/8/1K6/8/8/8/8/8 b - - 1 1")
+
+    def test_go_depth_streams_info(self):
+        self.send("position fen 6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - 0 1", "go depth 3")
+        self.assertEqual(self.out.wait_for("bestmove"), "bestmove a1a8")
+        infos = [line for line in self.out.lines if line.startswith("info depth")]
+        self.assertTrue(infos[0].startswith("info depth 1 score "))
+        self.assertIn("score mate 1", infos[-1])
+        self.assertIn(" nps ", infos[-1])
+
+    def test_stop_is_fast(self):
+        self.send("position startpos", "go infinite")
+        self.out.wait_for("info depth 1")
+        started = time.time()
+        self.send("isready")
+        self.assertEqual(self.out.lines[-1], "readyok")
+        self.send("stop")
+        self.assertLess(time.time() - started, 0.5)
+        self.assertTrue(self.out.lines[-1].startswith("bestmove "))
+        self.assertFalse(self.engine.searching())
+
+    def test_infinite_waits_for_stop(self):
+        self.send("position fen 6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - 0 1", "go infinite")
+        self.out.wait_for("info depth 1 score mate 1")
+        time.sleep(0.05)
+        self.assertFalse([line for line in self.out.lines if line.startswith("bestmove")])
+        self.send("stop")
+        self.assertEqual(self.out.lines[-1], "bestmove a1a8")
+
+    def test_ponderhit_starts_the_clock(self):
+        self.send("position startpos", "go ponder movetime 250", "ponderhit")
+        started = time.time()
+        self.assertTrue(self.out.wait_for("bestmove", timeout=5.0).startswith("bestmove "))
+        self.assertLess(time.time() - started, 2.0)
+
+    def test_no_moves(self):
+        self.send("position fen k7/1Q6/1K6/8/8/8/8/8 b - - 0 1", "go depth 2")
+        self.assertEqual(self.out.wait_for("bestmove"), "bestmove 0000")
+
+    def test_helpers(self):
+        self.assertEqual(parse_go("wtime 60000 btime 50000 winc 1000 infinite".split()),
+                         {"wtime": 60000, "btime": 50000, "winc": 1000, "infinite": True})
+        self.assertEqual(budget({"movetime": 1050}, 0), 1.0)
+        self.assertEqual(budget({"wtime": 60000, "btime": 30000, "movestogo": 10}, 1), 3.0)
+        self.assertEqual(budget({"depth": 4}, 0), None)
+        self.assertEqual(format_score(35), "cp 35")
+        self.assertEqual(format_score(MATE - 3), "mate 2")
+        self.assertEqual(format_score(-MATE + 2), "mate -1")
+
+
+if __name__ == "__main__":
+    main()